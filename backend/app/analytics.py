@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+from collections.abc import Iterable
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import delete, func, insert, literal, select
+from sqlalchemy.orm import Session
+
+from . import schemas
+from .core.config import settings
+from .database import upsert_insert
+from .models import (
+  AnalyticsOrder,
+  LowStockProduct,
+  Order,
+  OrderItem,
+  Product,
+  ProductSalesDaily,
+  SalesDaily,
+)
+from .outbox import handler
+
+# date() is a function on PostgreSQL too; on SQLite it yields the same
+# 'YYYY-MM-DD' text a Date column stores.
+_day = func.date(Order.created_at)
+
+
+def _product_sales(orders):
+  return (
+    select(
+      _day,
+      OrderItem.product_id,
+      func.sum(OrderItem.quantity),
+      func.sum(OrderItem.subtotal_price),
+    )
+    .join(Order, Order.id == OrderItem.order_id)
+    .where(orders)
+    .group_by(_day, OrderItem.product_id)
+    # Upserts take row locks in this order, so concurrent workers cannot
+    # deadlock on each other's rows.
+    .order_by(_day, OrderItem.product_id)
+  )
+
+
+def _daily_sales(orders):
+  return (
+    select(
+      _day,
+      func.count(func.distinct(Order.id)),
+      func.sum(OrderItem.quantity),
+      func.sum(OrderItem.subtotal_price),
+    )
+    .join(Order, Order.id == OrderItem.order_id)
+    .where(orders)
+    .group_by(_day)
+    .order_by(_day)
+  )
+
+
+def refresh_low_stock(db: Session, product_ids: Optional[Iterable[int]] = None) -> None:
+  # Re-derive the watchlist rows of the given products (all when None) from
+  # their current stock.
+  products = [] if product_ids is None else [Product.id.in_(list(product_ids))]
+  watched = [] if product_ids is None else [LowStockProduct.product_id.in_(list(product_ids))]
+  db.execute(delete(LowStockProduct).where(*watched))
+  db.execute(
+    insert(LowStockProduct).from_select(
+      ['product_id', 'stock', 'updated_at'],
+      select(Product.id, Product.stock, literal(datetime.utcnow())).where(
+        Product.is_active.is_(True), Product.stock <= settings.low_stock_threshold, *products
+      ),
+    )
+  )
+
+
+def add_orders(db: Session, order_ids: list[int]) -> int:
+  # Adds orders to the daily rollups in the caller's transaction. Orders
+  # already counted are skipped, so replays are harmless.
+  if not order_ids:
+    return 0
+  claim = upsert_insert(db)(AnalyticsOrder).values([{'order_id': id} for id in order_ids])
+  claimed = db.scalars(claim.on_conflict_do_nothing().returning(AnalyticsOrder.order_id)).all()
+  if not claimed:
+    return 0
+  orders = OrderItem.order_id.in_(claimed)
+  product_sales = upsert_insert(db)(ProductSalesDaily).from_select(
+    ['day', 'product_id', 'units', 'revenue'], _product_sales(orders)
+  )
+  db.execute(
+    product_sales.on_conflict_do_update(
+      index_elements=[ProductSalesDaily.day, ProductSalesDaily.product_id],
+      set_={
+        'units': ProductSalesDaily.units + product_sales.excluded.units,
+        'revenue': ProductSalesDaily.revenue + product_sales.excluded.revenue,
+      },
+    )
+  )
+  daily_sales = upsert_insert(db)(SalesDaily).from_select(
+    ['day', 'orders', 'units', 'revenue'], _daily_sales(orders)
+  )
+  db.execute(
+    daily_sales.on_conflict_do_update(
+      index_elements=[SalesDaily.day],
+      set_={
+        'orders': SalesDaily.orders + daily_sales.excluded.orders,
+        'units': SalesDaily.units + daily_sales.excluded.units,
+        'revenue': SalesDaily.revenue + daily_sales.excluded.revenue,
+      },
+    )
+  )
+  refresh_low_stock(db, db.scalars(select(OrderItem.product_id).where(orders).distinct()).all())
+  return len(claimed)
+
+
+def rebuild(db) -> None:
+  # Recount every order, set-based. Takes a Session or a Connection.
+  for model in (ProductSalesDaily, SalesDaily, AnalyticsOrder):
+    db.execute(delete(model))
+  db.execute(insert(AnalyticsOrder).from_select(['order_id'], select(Order.id)))
+  # Driven by the claims just written, so an order committed meanwhile is
+  # left whole to its own event.
+  orders = OrderItem.order_id.in_(select(AnalyticsOrder.order_id))
+  db.execute(
+    insert(ProductSalesDaily).from_select(
+      ['day', 'product_id', 'units', 'revenue'], _product_sales(orders)
+    )
+  )
+  db.execute(
+    insert(SalesDaily).from_select(['day', 'orders', 'units', 'revenue'], _daily_sales(orders))
+  )
+  refresh_low_stock(db)
+
+
+@handler('order.created')
+def _count_order(db: Session, payload: dict, key: str) -> None:
+  add_orders(db, [payload['order_id']])
+
+
+def _since(days: int):
+  return datetime.utcnow().date() - timedelta(days=days - 1)
+
+
+def daily_sales(db: Session, days: int) -> list[schemas.DailySales]:
+  rows = db.execute(
+    select(SalesDaily.day, SalesDaily.orders, SalesDaily.units, SalesDaily.revenue)
+    .where(SalesDaily.day >= _since(days))
+    .order_by(SalesDaily.day)
+  ).all()
+  return [schemas.DailySales.model_validate(row) for row in rows]
+
+
+def top_products(db: Session, days: int, limit: int, by: str) -> list[schemas.TopProduct]:
+  units = func.sum(ProductSalesDaily.units).label('units')
+  revenue = func.sum(ProductSalesDaily.revenue).label('revenue')
+  totals = (
+    select(ProductSalesDaily.product_id, units, revenue)
+    .where(ProductSalesDaily.day >= _since(days))
+    .group_by(ProductSalesDaily.product_id)
+    .order_by((units if by == 'units' else revenue).desc(), ProductSalesDaily.product_id)
+    .limit(limit)
+    .subquery()
+  )
+  rows = db.execute(
+    select(totals.c.product_id, Product.name, totals.c.units, totals.c.revenue)
+    .join(Product, Product.id == totals.c.product_id)
+    .order_by(totals.c[by].desc(), totals.c.product_id)
+  ).all()
+  return [schemas.TopProduct.model_validate(row) for row in rows]
+
+
+def low_stock(db: Session, limit: int) -> list[schemas.LowStockItem]:
+  watched = (
+    select(LowStockProduct.product_id, LowStockProduct.stock)
+    .order_by(LowStockProduct.stock, LowStockProduct.product_id)
+    .limit(limit)
+    .subquery()
+  )
+  recent = (
+    select(ProductSalesDaily.product_id, func.sum(ProductSalesDaily.units).label('units'))
+    .where(
+      ProductSalesDaily.day >= _since(7),
+      ProductSalesDaily.product_id.in_(select(watched.c.product_id)),
+    )
+    .group_by(ProductSalesDaily.product_id)
+    .subquery()
+  )
+  rows = db.execute(
+    select(watched.c.product_id, Product.name, watched.c.stock, recent.c.units)
+    .join(Product, Product.id == watched.c.product_id)
+    .outerjoin(recent, recent.c.product_id == watched.c.product_id)
+    .order_by(watched.c.stock, watched.c.product_id)
+  ).all()
+  return [
+    schemas.LowStockItem(
+      product_id=product_id,
+      name=name,
+      stock=stock,
+      units_last_7_days=units or 0,
+      # At last week's pace; None when nothing sold.
+      days_of_cover=round(stock / (units / 7), 1) if units else None,
+    )
+    for product_id, name, stock, units in rows
+  ]
@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+import csv
+import io
+import json
+from collections import defaultdict
+from collections.abc import Iterator
+from datetime import datetime
+from typing import IO, Any
+
+from pydantic import ValidationError
+from sqlalchemy import insert, select, text, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from . import schemas
+from .database import upsert_insert
+from .models import Product
+
+EXPORT_COLUMNS = ('id', 'name', 'description', 'price', 'image_url', 'stock', 'is_active')
+NEW_PRODUCT_FIELDS = ('name', 'description', 'price', 'stock')
+MAX_REPORTED_ERRORS = 1000
+
+
+def _iter_ndjson(stream: IO[str]) -> Iterator[tuple[int, Any]]:
+  for number, line in enumerate(stream, start=1):
+    if not line.strip():
+      continue
+    try:
+      yield number, json.loads(line)
+    except ValueError as exc:
+      yield number, exc
+
+
+def _iter_csv(stream: IO[str]) -> Iterator[tuple[int, Any]]:
+  reader = csv.DictReader(stream)
+  for row in reader:
+    # Empty cells mean "not provided" so model defaults apply.
+    yield reader.line_num, {key: value for key, value in row.items() if key and value != ''}
+
+
+class _Importer:
+  def __init__(self, db: Session, batch_size: int):
+    self.db = db
+    self.batch_size = batch_size
+    self.dialect = db.get_bind().dialect.name
+    self.upsert_insert = upsert_insert(db)
+    self.batch: list[tuple[int, schemas.ProductImportRow]] = []
+    self.inserted = 0
+    self.upserted = 0
+    self.failed = 0
+    self.errors: list[schemas.BulkImportError] = []
+
+  def fail(self, row: int, detail: str) -> None:
+    self.failed += 1
+    if len(self.errors) < MAX_REPORTED_ERRORS:
+      self.errors.append(schemas.BulkImportError(row=row, detail=detail))
+
+  def add(self, row: int, raw: Any) -> None:
+    if isinstance(raw, Exception):
+      self.fail(row, str(raw))
+      return
+    try:
+      product = schemas.ProductImportRow.model_validate(raw)
+    except ValidationError as exc:
+      self.fail(row, '; '.join(f'{".".join(map(str, e["loc"]))}: {e["msg"]}' for e in exc.errors()))
+      return
+    if product.id is None and _missing(product):
+      self.fail(row, '; '.join(f'{field}: Field required' for field in _missing(product)))
+      return
+    self.batch.append((row, product))
+    if len(self.batch) >= self.batch_size:
+      self.flush()
+
+  def _write(self, rows: list[schemas.ProductImportRow]) -> None:
+    # Rows with an id update that product or create it under that id, changing
+    # only the fields they carry. Rows without one always become new products:
+    # there is no natural key to match them on, so importing id-less rows
+    # twice creates them twice.
+    now = datetime.utcnow()
+    new_rows = [
+      {**row.model_dump(exclude={'id'}), 'created_at': now, 'updated_at': now}
+      for row in rows
+      if row.id is None
+    ]
+    # Rows that could create their product are upserted; the others can only
+    # update one, since an insert needs every NOT NULL column even when it
+    # would conflict. Rows carrying the same fields share a statement.
+    upserts: dict[tuple[str, ...], list[dict]] = defaultdict(list)
+    updates: dict[tuple[str, ...], list[dict]] = defaultdict(list)
+    for row in rows:
+      if row.id is None:
+        continue
+      fields = tuple(sorted(row.model_fields_set - {'id'}))
+      if _missing(row):
+        updates[fields].append({**row.model_dump(include={'id', *fields}), 'updated_at': now})
+      else:
+        upserts[fields].append({**row.model_dump(), 'created_at': now, 'updated_at': now})
+    for fields, values in upserts.items():
+      statement = self.upsert_insert(Product).values(values)
+      statement = statement.on_conflict_do_update(
+        index_elements=[Product.id],
+        set_={
+          **{field: statement.excluded[field] for field in fields},
+          'updated_at': statement.excluded.updated_at,
+        },
+      )
+      self.db.execute(statement)
+    if upserts and self.dialect == 'postgresql':
+      # Explicit ids may be past the sequence; move it on before anything
+      # draws from it, including the new rows below.
+      self.db.execute(
+        text(
+          'SELECT setval(seq, GREATEST(:id, COALESCE(pg_sequence_last_value(seq), 0))) '
+          "FROM CAST(pg_get_serial_sequence('products', 'id') AS regclass) AS seq"
+        ),
+        {'id': max(row['id'] for values in upserts.values() for row in values)},
+      )
+    for values in updates.values():
+      self.db.execute(update(Product), values)
+    if new_rows:
+      self.db.execute(insert(Product), new_rows)
+
+  def _unknown(self, batch: list[tuple[int, schemas.ProductImportRow]]) -> set[int]:
+    # Ids of partial rows whose product does not exist; they cannot be created.
+    ids = {row.id for _, row in batch if row.id is not None and _missing(row)}
+    if not ids:
+      return set()
+    return ids - set(self.db.scalars(select(Product.id).where(Product.id.in_(ids))))
+
+  def flush(self) -> None:
+    if not self.batch:
+      return
+    batch, self.batch = self.batch, []
+    unknown = self._unknown(batch)
+    if unknown:
+      needed = ', '.join(NEW_PRODUCT_FIELDS)
+      for number, row in batch:
+        if row.id in unknown:
+          self.fail(number, f'id: product {row.id} not found; new products need {needed}')
+      batch = [(number, row) for number, row in batch if row.id not in unknown]
+    try:
+      self._write([row for _, row in batch])
+      self.db.commit()
+      self._count([row for _, row in batch])
+      return
+    except SQLAlchemyError:
+      self.db.rollback()
+    # Retry row by row so the report can name the offending rows.
+    for number, row in batch:
+      try:
+        self._write([row])
+        self.db.commit()
+        self._count([row])
+      except SQLAlchemyError as exc:
+        self.db.rollback()
+        self.fail(number, str(exc.orig) if getattr(exc, 'orig', None) else str(exc))
+
+  def _count(self, rows: list[schemas.ProductImportRow]) -> None:
+    keyed = sum(1 for row in rows if row.id is not None)
+    self.upserted += keyed
+    self.inserted += len(rows) - keyed
+
+  def finish(self) -> schemas.BulkImportResult:
+    self.flush()
+    return schemas.BulkImportResult(
+      inserted=self.inserted, upserted=self.upserted, failed=self.failed, errors=self.errors
+    )
+
+
+def _missing(row: schemas.ProductImportRow) -> list[str]:
+  return [field for field in NEW_PRODUCT_FIELDS if getattr(row, field) is None]
+
+
+def import_products(
+  db: Session, stream: IO[bytes], fmt: str, batch_size: int
+) -> schemas.BulkImportResult:
+  importer = _Importer(db, batch_size)
+  text_stream = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+  rows = _iter_csv(text_stream) if fmt == 'csv' else _iter_ndjson(text_stream)
+  try:
+    for number, raw in rows:
+      importer.add(number, raw)
+  except (UnicodeDecodeError, csv.Error) as exc:
+    importer.fail(0, str(exc))
+  return importer.finish()
+
+
+def export_batch(db: Session, after_id: int, size: int) -> list[tuple]:
+  columns = [getattr(Product, column) for column in EXPORT_COLUMNS]
+  return db.execute(
+    select(*columns).where(Product.id > after_id).order_by(Product.id).limit(size)
+  ).all()
+
+
+def encode_ndjson(rows: list[tuple]) -> bytes:
+  return ''.join(
+    json.dumps(dict(zip(EXPORT_COLUMNS, row, strict=True)), default=float, ensure_ascii=False)
+    + '\n'
+    for row in rows
+  ).encode('utf-8')
+
+
+def encode_csv(rows: list[tuple], header: bool = False) -> bytes:
+  buffer = io.StringIO()
+  writer = csv.writer(buffer)
+  if header:
+    writer.writerow(EXPORT_COLUMNS)
+  writer.writerows(rows)
+  return buffer.getvalue().encode('utf-8')
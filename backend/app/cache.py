@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable, Iterable
+from typing import Any
+
+from .core.config import settings
+from .metrics import registry
+
+MISSING = object()
+
+
+class TTLCache:
+  def __init__(
+    self, name: str, maxsize: int, ttl: float, clock: Callable[[], float] = time.monotonic
+  ):
+    self.name = name
+    self.maxsize = maxsize
+    self.ttl = ttl
+    self._clock = clock
+    self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+    self._lock = threading.Lock()
+    self.hits = 0
+    self.misses = 0
+
+  def get(self, key: Hashable) -> Any:
+    now = self._clock()
+    with self._lock:
+      entry = self._data.get(key)
+      if entry is None or entry[0] <= now:
+        if entry is not None:
+          del self._data[key]
+        self.misses += 1
+        return MISSING
+      self._data.move_to_end(key)
+      self.hits += 1
+      return entry[1]
+
+  def set(self, key: Hashable, value: Any) -> None:
+    expires_at = self._clock() + self.ttl
+    with self._lock:
+      self._data[key] = (expires_at, value)
+      self._data.move_to_end(key)
+      while len(self._data) > self.maxsize:
+        self._data.popitem(last=False)
+
+  def invalidate(self, key: Hashable) -> None:
+    with self._lock:
+      self._data.pop(key, None)
+
+  def clear(self) -> None:
+    with self._lock:
+      self._data.clear()
+
+  def stats(self) -> dict:
+    lookups = self.hits + self.misses
+    return {
+      'name': self.name,
+      'hits': self.hits,
+      'misses': self.misses,
+      'hit_ratio': self.hits / lookups if lookups else 0.0,
+      'size': len(self._data),
+      'maxsize': self.maxsize,
+    }
+
+
+class ProductCache:
+  # Entries are guarded by the catalog version, which every product write
+  # bumps. Listing pages are keyed by a page version that only moves when a
+  # write changes what a listing shows beyond a stock count, so holds and
+  # checkouts leave them cached unless a product sells out or comes back;
+  # their stock figures may lag by up to the TTL. The search version only
+  # moves when searchable text or visibility does.
+  def __init__(self, maxsize: int, page_maxsize: int, ttl: float):
+    self.products = TTLCache('products', maxsize, ttl)
+    self.pages = TTLCache('product_pages', page_maxsize, ttl)
+    self._version = 0
+    self._page_version = 0
+    self._search_version = 0
+    self._lock = threading.Lock()
+    # Called with each invalidation so other processes can apply it too.
+    self.publish: Callable[[tuple[int, ...] | None, bool, bool], None] | None = None
+
+  @property
+  def version(self) -> int:
+    return self._version
+
+  @property
+  def page_version(self) -> int:
+    return self._page_version
+
+  @property
+  def search_version(self) -> int:
+    return self._search_version
+
+  def get_product(self, product_id: int) -> Any:
+    return self.products.get(product_id)
+
+  def set_product(self, product_id: int, value: Any, version: int) -> None:
+    # Values read before a concurrent write must not be cached after it.
+    if version == self._version:
+      self.products.set(product_id, value)
+
+  def get_page(self, params: Hashable) -> Any:
+    return self.pages.get((self._page_version, params))
+
+  def set_page(self, params: Hashable, value: Any, version: int) -> None:
+    self.pages.set((version, params), value)
+
+  def invalidate_product(
+    self, *product_ids: int, searchable: bool = False, listed: bool = True
+  ) -> None:
+    # searchable: the write changed a name, description or is_active.
+    # listed: it changed listing output other than a stock count, which
+    # includes stock reaching or leaving zero.
+    self.apply(product_ids, searchable, listed)
+    if self.publish is not None:
+      self.publish(product_ids, searchable, listed)
+
+  def invalidate_all(self) -> None:
+    self.apply(None, True, True)
+    if self.publish is not None:
+      self.publish(None, True, True)
+
+  def apply(self, product_ids: Iterable[int] | None, searchable: bool, listed: bool) -> None:
+    # None stands for every product.
+    with self._lock:
+      self._version += 1
+      if listed:
+        self._page_version += 1
+      if searchable:
+        self._search_version += 1
+    if product_ids is None:
+      self.products.clear()
+    else:
+      for product_id in product_ids:
+        self.products.invalidate(product_id)
+    if listed:
+      self.pages.clear()
+
+  def stats(self) -> list[dict]:
+    return [self.products.stats(), self.pages.stats()]
+
+
+product_cache = ProductCache(
+  maxsize=settings.product_cache_size,
+  page_maxsize=settings.product_page_cache_size,
+  ttl=settings.product_cache_ttl_seconds,
+)
+
+registry.collect_stats(
+  'cache',
+  'cache',
+  product_cache.stats,
+  (
+    ('hits_total', 'hits', 'counter', 'Cache hits.'),
+    ('misses_total', 'misses', 'counter', 'Cache misses.'),
+    ('hit_ratio', 'hit_ratio', 'gauge', 'Cache hits over lookups since start.'),
+    ('entries', 'size', 'gauge', 'Cached entries.'),
+  ),
+)
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import queue
+import select
+import threading
+import time
+import uuid
+
+from sqlalchemy import text
+
+from .cache import product_cache
+from .core.config import settings
+from .database import engine
+
+logger = logging.getLogger(__name__)
+
+# Product cache invalidations travel between processes (API workers and the
+# outbox worker) over PostgreSQL LISTEN/NOTIFY. Without it each process only
+# sees its own writes until entries expire.
+CHANNEL = 'product_cache'
+# NOTIFY payloads must stay under 8000 bytes; longer id lists become "every
+# product".
+MAX_PAYLOAD = 7000
+RECONNECT_SECONDS = 1.0
+
+_source = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+_outgoing: queue.Queue[str] = queue.Queue()
+_started = False
+
+
+def encode(product_ids: tuple[int, ...] | None, searchable: bool, listed: bool) -> str:
+  message = {'src': _source, 'ids': product_ids, 'searchable': searchable, 'listed': listed}
+  payload = json.dumps(message, separators=(',', ':'))
+  if len(payload) > MAX_PAYLOAD:
+    payload = json.dumps({**message, 'ids': None}, separators=(',', ':'))
+  return payload
+
+
+def apply(payload: str) -> None:
+  message = json.loads(payload)
+  if message['src'] != _source:
+    product_cache.apply(message['ids'], message['searchable'], message['listed'])
+
+
+def _publish(product_ids: tuple[int, ...] | None, searchable: bool, listed: bool) -> None:
+  # Called after the write committed, possibly on the event loop, so the
+  # NOTIFY itself is left to the publisher thread.
+  _outgoing.put(encode(product_ids, searchable, listed))
+
+
+def _run_publisher() -> None:
+  while True:
+    payloads = [_outgoing.get()]
+    while not _outgoing.empty():
+      payloads.append(_outgoing.get_nowait())
+    try:
+      with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        connection.execute(
+          text('SELECT pg_notify(:channel, :payload)'),
+          [{'channel': CHANNEL, 'payload': payload} for payload in payloads],
+        )
+    except Exception:  # noqa: BLE001 - entries still expire with the TTL
+      logger.exception('Could not publish %s product cache invalidations', len(payloads))
+
+
+def _listen_once() -> None:
+  # A connection of its own, detached from the pool so it does not count
+  # against the request connections.
+  connection = engine.raw_connection()
+  driver = connection.driver_connection
+  connection.detach()
+  try:
+    driver.autocommit = True
+    driver.cursor().execute(f'LISTEN {CHANNEL}')
+    # Invalidations sent while no connection was listening are lost.
+    product_cache.apply(None, True, True)
+    while True:
+      if select.select([driver], [], [], 60)[0]:
+        driver.poll()
+        while driver.notifies:
+          apply(driver.notifies.pop(0).payload)
+  finally:
+    connection.close()
+
+
+def _run_listener() -> None:
+  while True:
+    try:
+      _listen_once()
+    except Exception:  # noqa: BLE001 - reconnect; entries still expire with the TTL
+      logger.exception('Product cache listener failed; reconnecting')
+    time.sleep(RECONNECT_SECONDS)
+
+
+def start(listen: bool = True) -> None:
+  # Idempotent. Only PostgreSQL can carry the invalidations.
+  global _started
+  if _started or not settings.product_cache_sync or engine.dialect.name != 'postgresql':
+    return
+  _started = True
+  product_cache.publish = _publish
+  threading.Thread(target=_run_publisher, name='cache-publisher', daemon=True).start()
+  if listen:
+    threading.Thread(target=_run_listener, name='cache-listener', daemon=True).start()
@@ -0,0 +1,319 @@
+from __future__ import annotations
+
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections.abc import Callable, Iterable
+from datetime import datetime
+from typing import Any, Optional
+
+from sqlalchemy import delete, literal, select, update
+from sqlalchemy.orm import Session
+
+from . import schemas
+from .cache import MISSING, product_cache
+from .core.config import settings
+from .database import upsert_insert
+from .models import CartItem, Product
+
+# A cart line is (item_id, product_id, quantity).
+CartLine = tuple[int, int, int]
+PURGE_EVERY_WRITES = 1024
+
+
+def cached_product(db: Session, product_id: int) -> Optional[schemas.ProductOut]:
+  product = product_cache.get_product(product_id)
+  if product is MISSING:
+    version = product_cache.version
+    row = db.get(Product, product_id)
+    if row is None:
+      return None
+    product = schemas.ProductOut.model_validate(row)
+    product_cache.set_product(product_id, product, version)
+  return product
+
+
+CART_PRODUCT_COLUMNS = [getattr(Product, name) for name in schemas.CartProduct.model_fields]
+
+
+class CartStore(ABC):
+  # Lines written in the checkout transaction are cleared by it; other stores
+  # are cleared only once the order has committed.
+  transactional = False
+
+  @abstractmethod
+  def lines(self, db: Session, user_id: int) -> list[CartLine]: ...
+
+  @abstractmethod
+  def add(
+    self, db: Session, user_id: int, product_id: int, quantity: int
+  ) -> Optional[CartLine]: ...
+
+  @abstractmethod
+  def set_quantity(
+    self, db: Session, user_id: int, item_id: int, quantity: int
+  ) -> Optional[CartLine]: ...
+
+  @abstractmethod
+  def remove(self, db: Session, user_id: int, item_id: int) -> Optional[CartLine]: ...
+
+  @abstractmethod
+  def clear(self, db: Session, user_id: int, product_ids: Iterable[int]) -> None: ...
+
+  def quantities(self, db: Session, user_id: int) -> dict[int, int]:
+    return {product_id: quantity for _, product_id, quantity in self.lines(db, user_id)}
+
+  def quantity(self, db: Session, user_id: int, product_id: int) -> int:
+    return self.quantities(db, user_id).get(product_id, 0)
+
+  def read(self, db: Session, user_id: int) -> list[tuple[int, int, tuple]]:
+    # (item_id, quantity, CartProduct values) for lines whose product exists.
+    lines = self.lines(db, user_id)
+    if not lines:
+      return []
+    products = {
+      row.id: tuple(row)
+      for row in db.execute(
+        select(*CART_PRODUCT_COLUMNS).where(Product.id.in_({line[1] for line in lines}))
+      ).all()
+    }
+    return [
+      (item_id, quantity, products[product_id])
+      for item_id, product_id, quantity in lines
+      if product_id in products
+    ]
+
+
+class SqlCartStore(CartStore):
+  transactional = True
+
+  def lines(self, db: Session, user_id: int) -> list[CartLine]:
+    return db.execute(
+      select(CartItem.id, CartItem.product_id, CartItem.quantity)
+      .where(CartItem.user_id == user_id)
+      .order_by(CartItem.product_id)
+    ).all()
+
+  def read(self, db: Session, user_id: int) -> list[tuple[int, int, tuple]]:
+    rows = db.execute(
+      select(CartItem.id, CartItem.quantity, *CART_PRODUCT_COLUMNS)
+      .join(Product, Product.id == CartItem.product_id)
+      .where(CartItem.user_id == user_id)
+    ).all()
+    return [(row[0], row[1], tuple(row[2:])) for row in rows]
+
+  def add(self, db: Session, user_id: int, product_id: int, quantity: int) -> Optional[CartLine]:
+    # One INSERT ... SELECT from the active product, merging into an existing
+    # line on conflict. No row back means the product is missing or inactive.
+    now = datetime.utcnow()
+    insert = upsert_insert(db)(CartItem).from_select(
+      ['user_id', 'product_id', 'quantity', 'created_at', 'updated_at'],
+      select(literal(user_id), Product.id, literal(quantity), literal(now), literal(now)).where(
+        Product.id == product_id, Product.is_active.is_(True)
+      ),
+    )
+    statement = insert.on_conflict_do_update(
+      index_elements=[CartItem.user_id, CartItem.product_id],
+      set_={
+        'quantity': CartItem.quantity + insert.excluded.quantity,
+        'updated_at': insert.excluded.updated_at,
+      },
+    ).returning(CartItem.id, CartItem.product_id, CartItem.quantity)
+    row = db.execute(statement).first()
+    db.commit()
+    return row
+
+  def set_quantity(
+    self, db: Session, user_id: int, item_id: int, quantity: int
+  ) -> Optional[CartLine]:
+    row = db.execute(
+      update(CartItem)
+      .where(CartItem.id == item_id, CartItem.user_id == user_id)
+      .values(quantity=quantity, updated_at=datetime.utcnow())
+      .returning(CartItem.id, CartItem.product_id, CartItem.quantity)
+    ).first()
+    db.commit()
+    return row
+
+  def quantity(self, db: Session, user_id: int, product_id: int) -> int:
+    quantity = db.scalar(
+      select(CartItem.quantity).where(
+        CartItem.user_id == user_id, CartItem.product_id == product_id
+      )
+    )
+    return quantity or 0
+
+  def remove(self, db: Session, user_id: int, item_id: int) -> Optional[CartLine]:
+    deleted = db.execute(
+      delete(CartItem)
+      .where(CartItem.id == item_id, CartItem.user_id == user_id)
+      .returning(CartItem.id, CartItem.product_id, CartItem.quantity)
+    ).first()
+    db.commit()
+    return deleted
+
+  def clear(self, db: Session, user_id: int, product_ids: Iterable[int]) -> None:
+    db.execute(
+      delete(CartItem).where(CartItem.user_id == user_id, CartItem.product_id.in_(product_ids))
+    )
+
+
+class RedisCartStore(CartStore):
+  # One hash per user (`cart:<user_id>`, product id -> quantity) that expires
+  # after `ttl` seconds without writes. A line's item id is its product id.
+  def __init__(self, client: Any, ttl: int):
+    self.client = client
+    self.ttl = ttl
+
+  @staticmethod
+  def key(user_id: int) -> str:
+    return f'cart:{user_id}'
+
+  def lines(self, db: Session, user_id: int) -> list[CartLine]:
+    cart = self.client.hgetall(self.key(user_id))
+    return sorted(
+      (int(product_id), int(product_id), int(quantity)) for product_id, quantity in cart.items()
+    )
+
+  def add(self, db: Session, user_id: int, product_id: int, quantity: int) -> Optional[CartLine]:
+    product = cached_product(db, product_id)
+    if product is None or not product.is_active:
+      return None
+    key = self.key(user_id)
+    total, _ = (
+      self.client.pipeline().hincrby(key, product_id, quantity).expire(key, self.ttl).execute()
+    )
+    return product_id, product_id, int(total)
+
+  def set_quantity(
+    self, db: Session, user_id: int, item_id: int, quantity: int
+  ) -> Optional[CartLine]:
+    key = self.key(user_id)
+    if not self.client.hexists(key, item_id):
+      return None
+    self.client.pipeline().hset(key, item_id, quantity).expire(key, self.ttl).execute()
+    return item_id, item_id, quantity
+
+  def quantity(self, db: Session, user_id: int, product_id: int) -> int:
+    return int(self.client.hget(self.key(user_id), product_id) or 0)
+
+  def remove(self, db: Session, user_id: int, item_id: int) -> Optional[CartLine]:
+    key = self.key(user_id)
+    quantity, removed = self.client.pipeline().hget(key, item_id).hdel(key, item_id).execute()
+    return (item_id, item_id, int(quantity)) if removed else None
+
+  def clear(self, db: Session, user_id: int, product_ids: Iterable[int]) -> None:
+    product_ids = list(product_ids)
+    if product_ids:
+      self.client.hdel(self.key(user_id), *product_ids)
+
+
+class LocalRedis:
+  # In-process stand-in for the subset of Redis commands the cart store uses,
+  # for single-process deployments and local runs without a Redis server.
+  def __init__(self, clock: Callable[[], float] = time.monotonic):
+    self._clock = clock
+    self._lock = threading.RLock()
+    self._data: dict[str, dict[str, str]] = {}
+    self._expires: dict[str, float] = {}
+    self._writes = 0
+
+  def _hash(self, key: str, create: bool = False) -> Optional[dict[str, str]]:
+    expires = self._expires.get(key)
+    if expires is not None and expires <= self._clock():
+      self._data.pop(key, None)
+      self._expires.pop(key, None)
+    if create:
+      return self._data.setdefault(key, {})
+    return self._data.get(key)
+
+  def purge_expired(self) -> int:
+    now = self._clock()
+    with self._lock:
+      expired = [key for key, expires in self._expires.items() if expires <= now]
+      for key in expired:
+        self._data.pop(key, None)
+        self._expires.pop(key, None)
+    return len(expired)
+
+  def hgetall(self, key: str) -> dict[str, str]:
+    with self._lock:
+      return dict(self._hash(key) or {})
+
+  def hget(self, key: str, field: Any) -> Optional[str]:
+    with self._lock:
+      return (self._hash(key) or {}).get(str(field))
+
+  def hexists(self, key: str, field: Any) -> bool:
+    with self._lock:
+      return str(field) in (self._hash(key) or {})
+
+  def hincrby(self, key: str, field: Any, amount: int = 1) -> int:
+    with self._lock:
+      cart = self._hash(key, create=True)
+      value = int(cart.get(str(field), 0)) + amount
+      cart[str(field)] = str(value)
+      return value
+
+  def hset(self, key: str, field: Any, value: Any) -> int:
+    with self._lock:
+      cart = self._hash(key, create=True)
+      created = str(field) not in cart
+      cart[str(field)] = str(value)
+      return int(created)
+
+  def hdel(self, key: str, *fields: Any) -> int:
+    with self._lock:
+      cart = self._hash(key) or {}
+      removed = sum(1 for field in fields if cart.pop(str(field), None) is not None)
+      if key in self._data and not cart:
+        self._data.pop(key, None)
+        self._expires.pop(key, None)
+      return removed
+
+  def expire(self, key: str, seconds: int) -> bool:
+    with self._lock:
+      if self._hash(key) is None:
+        return False
+      self._expires[key] = self._clock() + seconds
+      # Abandoned carts are never read again, so sweep them now and then.
+      self._writes += 1
+      if self._writes % PURGE_EVERY_WRITES == 0:
+        self.purge_expired()
+      return True
+
+  def pipeline(self) -> _LocalPipeline:
+    return _LocalPipeline(self)
+
+
+class _LocalPipeline:
+  def __init__(self, client: LocalRedis):
+    self._client = client
+    self._commands: list[tuple[str, tuple]] = []
+
+  def __getattr__(self, name: str):
+    def queue(*args: Any) -> _LocalPipeline:
+      self._commands.append((name, args))
+      return self
+
+    return queue
+
+  def execute(self) -> list:
+    # Like MULTI/EXEC: the queued commands run without interleaving.
+    with self._client._lock:
+      return [getattr(self._client, name)(*args) for name, args in self._commands]
+
+
+def _create_store() -> CartStore:
+  if settings.cart_backend == 'redis':
+    if settings.cart_redis_url:
+      import redis
+
+      client = redis.Redis.from_url(settings.cart_redis_url, decode_responses=True)
+    else:
+      client = LocalRedis()
+    return RedisCartStore(client, settings.cart_ttl_seconds)
+  return SqlCartStore()
+
+
+cart_store = _create_store()
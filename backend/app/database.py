@@ -1,17 +1,106 @@
+from collections.abc import AsyncIterator, Callable
+from contextlib import asynccontextmanager
+from typing import Any, TypeVar
+
 from sqlalchemy import create_engine
-from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, declarative_base, sessionmaker
+from starlette.concurrency import run_in_threadpool
 
 from .core.config import settings
+from .db_pool import engine_options
+
+T = TypeVar('T')
+
+_ASYNC_DRIVERS = {
+  'postgresql': 'postgresql+asyncpg',
+  'postgresql+psycopg2': 'postgresql+asyncpg',
+  'sqlite': 'sqlite+aiosqlite',
+  'sqlite+pysqlite': 'sqlite+aiosqlite',
+}
+
+
+def to_async_url(url: str) -> str:
+  parsed = make_url(url)
+  driver = _ASYNC_DRIVERS.get(parsed.drivername, parsed.drivername)
+  return parsed.set(drivername=driver).render_as_string(hide_password=False)
+
 
-engine = create_engine(settings.database_url, pool_pre_ping=True)
+# The sync engine is always available: startup tasks and scripts use it even
+# when requests are served through the async engine.
+engine = create_engine(settings.database_url, **engine_options(settings.database_url, 'primary'))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = None
+AsyncSessionLocal = None
+if settings.async_database:
+  _async_url = settings.async_database_url or to_async_url(settings.database_url)
+  async_engine = create_async_engine(
+    _async_url, **engine_options(_async_url, 'primary_async', is_async=True)
+  )
+  AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
+DbSession = Session | AsyncSession
+
+
+_UPSERT_INSERTS = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+
+def upsert_insert(db: Session):
+  # The dialect's insert(), which supports ON CONFLICT ... DO UPDATE.
+  dialect = db.get_bind().dialect.name
+  if dialect not in _UPSERT_INSERTS:
+    raise ValueError(f'Upserts are not supported on {dialect}')
+  return _UPSERT_INSERTS[dialect]
+
 
-def get_db():
+def _get_sync_db():
   db = SessionLocal()
   try:
     yield db
   finally:
     db.close()
+
+
+async def _get_async_db():
+  async with AsyncSessionLocal() as db:
+    yield db
+
+
+get_db = _get_async_db if settings.async_database else _get_sync_db
+
+
+@asynccontextmanager
+async def session_scope() -> AsyncIterator[DbSession]:
+  # For work that outlives the request's `get_db` session, e.g. streaming bodies.
+  if settings.async_database:
+    async with AsyncSessionLocal() as db:
+      yield db
+  else:
+    db = SessionLocal()
+    try:
+      yield db
+    finally:
+      await run_in_threadpool(db.close)
+
+
+async def release_connection(db: DbSession) -> None:
+  # Ends the session's transaction and hands its connection back to the pool
+  # before a long wait; the session checks one out again if used later.
+  if isinstance(db, AsyncSession):
+    await db.close()
+  else:
+    await run_in_threadpool(db.close)
+
+
+async def run_db(db: DbSession, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+  # Handlers keep their database work in plain `fn(session, ...)` functions.
+  # On the async engine these run on the event loop through greenlet-backed
+  # `run_sync`; on the sync engine they run in the threadpool as before.
+  if isinstance(db, AsyncSession):
+    return await db.run_sync(fn, *args, **kwargs)
+  return await run_in_threadpool(fn, db, *args, **kwargs)
@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import threading
+import time
+import uuid
+from typing import Any
+
+from sqlalchemy import exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from .core.config import settings
+from .metrics import registry
+
+
+class PoolMetrics:
+  def __init__(self, name: str):
+    self.name = name
+    self.pool: QueuePool | None = None
+    self._lock = threading.Lock()
+    self.checkouts = 0
+    self.timeouts = 0
+    self.wait_seconds_total = 0.0
+    self.wait_seconds_max = 0.0
+
+  def record(self, wait: float, timed_out: bool = False) -> None:
+    with self._lock:
+      if timed_out:
+        self.timeouts += 1
+      else:
+        self.checkouts += 1
+      self.wait_seconds_total += wait
+      self.wait_seconds_max = max(self.wait_seconds_max, wait)
+
+  def stats(self) -> dict:
+    pool = self.pool
+    checkouts = self.checkouts
+    return {
+      'name': self.name,
+      'size': pool.size() if pool else 0,
+      'checked_out': pool.checkedout() if pool else 0,
+      'checked_in': pool.checkedin() if pool else 0,
+      'overflow': max(pool.overflow(), 0) if pool else 0,
+      'checkouts': checkouts,
+      'timeouts': self.timeouts,
+      'wait_seconds_avg': self.wait_seconds_total / checkouts if checkouts else 0.0,
+      'wait_seconds_total': self.wait_seconds_total,
+      'wait_seconds_max': self.wait_seconds_max,
+    }
+
+
+class _TimedPoolMixin:
+  metrics: PoolMetrics
+
+  def __init__(self, *args: Any, **kwargs: Any):
+    super().__init__(*args, **kwargs)
+    # recreate() (e.g. after dispose) builds a new instance of the same class.
+    self.metrics.pool = self
+
+  def connect(self):
+    started = time.perf_counter()
+    try:
+      connection = super().connect()
+    except exc.TimeoutError:
+      self.metrics.record(time.perf_counter() - started, timed_out=True)
+      raise
+    self.metrics.record(time.perf_counter() - started)
+    return connection
+
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+  pass
+
+
+class TimedAsyncAdaptedQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+  pass
+
+
+_registry: dict[str, PoolMetrics] = {}
+
+
+def engine_options(url: str, name: str, is_async: bool = False) -> dict[str, Any]:
+  parsed = make_url(url)
+  if parsed.get_backend_name() == 'sqlite' and parsed.database in (None, '', ':memory:'):
+    return {}
+  metrics = _registry.setdefault(name, PoolMetrics(name))
+  base = TimedAsyncAdaptedQueuePool if is_async else TimedQueuePool
+  options: dict[str, Any] = {
+    'poolclass': type(base.__name__, (base,), {'metrics': metrics}),
+    'pool_size': settings.db_pool_size,
+    'max_overflow': settings.db_max_overflow,
+    'pool_timeout': settings.db_pool_timeout,
+    'pool_recycle': settings.db_pool_recycle,
+    'pool_pre_ping': settings.db_pool_pre_ping,
+    'pool_use_lifo': settings.db_pool_use_lifo,
+  }
+  if settings.db_pgbouncer_mode and parsed.get_driver_name() == 'asyncpg':
+    # PgBouncer in transaction mode hands each transaction to an arbitrary
+    # server connection, so named prepared statements must not be reused.
+    options['connect_args'] = {
+      'statement_cache_size': 0,
+      'prepared_statement_cache_size': 0,
+      'prepared_statement_name_func': lambda: f'__asyncpg_{uuid.uuid4()}__',
+    }
+  return options
+
+
+def pool_stats() -> list[dict]:
+  return [metrics.stats() for metrics in _registry.values()]
+
+
+registry.collect_stats(
+  'db_pool',
+  'pool',
+  pool_stats,
+  (
+    ('size', 'size', 'gauge', 'Configured connection pool size.'),
+    ('checked_out', 'checked_out', 'gauge', 'Connections in use.'),
+    ('overflow', 'overflow', 'gauge', 'Connections open beyond the pool size.'),
+    ('checkouts_total', 'checkouts', 'counter', 'Connection checkouts.'),
+    ('timeouts_total', 'timeouts', 'counter', 'Checkouts that timed out waiting.'),
+    ('wait_seconds_total', 'wait_seconds_total', 'counter', 'Time spent waiting to check out.'),
+  ),
+)
@@ -5,24 +5,32 @@ from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from sqlalchemy.orm import Session
 
+from .cache import MISSING
 from .core.config import settings
-from .database import get_db
-from .i18n import translate
+from .database import DbSession, get_db, run_db
+from .i18n import negotiate_locale, translate
 from .models import User
+from .security import token_version, token_versions
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl='/api/auth/login')
 
 
-def get_locale(accept_language: Optional[str] = Header(default='en')) -> str:
-  if not accept_language:
-    return 'en'
-  primary = accept_language.split(',')[0]
-  return primary.split('-')[0] or 'en'
+async def get_locale(accept_language: Optional[str] = Header(default='en')) -> str:
+  return negotiate_locale(accept_language)
 
 
-def get_current_user(
+def _load_user(db: Session, user_id: int) -> Optional[User]:
+  return db.query(User).filter(User.id == user_id).first()
+
+
+def _load_token_version(db: Session, user_id: int) -> Optional[str]:
+  updated_at = db.query(User.updated_at).filter(User.id == user_id).scalar()
+  return token_version(updated_at) if updated_at is not None else None
+
+
+async def get_current_user(
   token: str = Depends(oauth2_scheme),
-  db: Session = Depends(get_db),
+  db: DbSession = Depends(get_db),
   lang: str = Depends(get_locale),
 ) -> User:
   credentials_exception = HTTPException(
@@ -37,13 +45,26 @@ def get_current_user(
       raise credentials_exception
   except JWTError as exc:
     raise credentials_exception from exc
-  user = db.query(User).filter(User.id == int(user_id)).first()
+  if settings.stateless_auth and 'ver' in payload:
+    version = token_versions.get(int(user_id))
+    if version is MISSING:
+      version = await run_db(db, _load_token_version, int(user_id))
+      if version is None:
+        raise credentials_exception
+      token_versions.set(int(user_id), version)
+    if version != payload['ver']:
+      raise credentials_exception
+    # Detached, claims-only user: enough for authorization and ownership filters.
+    return User(
+      id=int(user_id), is_active=payload.get('act', False), is_admin=payload.get('adm', False)
+    )
+  user = await run_db(db, _load_user, int(user_id))
   if user is None:
     raise credentials_exception
   return user
 
 
-def get_current_active_user(
+async def get_current_active_user(
   current_user: User = Depends(get_current_user),
   lang: str = Depends(get_locale),
 ) -> User:
@@ -54,7 +75,7 @@ def get_current_active_user(
   return current_user
 
 
-def get_current_admin_user(
+async def get_current_admin_user(
   current_user: User = Depends(get_current_active_user),
   lang: str = Depends(get_locale),
 ) -> User:
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, TypeVar
+
+from .core.config import settings
+from .metrics import password_hash_duration, registry
+
+T = TypeVar('T')
+
+
+class HashingBusy(Exception):
+  pass
+
+
+class HashingPool:
+  # bcrypt releases the GIL, so a small dedicated thread pool gets real
+  # parallelism while keeping password work off Starlette's shared threadpool.
+  def __init__(self, workers: int, max_pending: int):
+    self.workers = workers
+    self.max_pending = max_pending
+    self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='hashing')
+    self._slots = threading.BoundedSemaphore(workers + max_pending)
+    self._lock = threading.Lock()
+    self._in_flight = 0
+    self.completed = 0
+    self.rejected = 0
+    self.hash_seconds_total = 0.0
+    self.hash_seconds_max = 0.0
+    self.wait_seconds_total = 0.0
+    self.wait_seconds_max = 0.0
+
+  async def run(self, fn: Callable[..., T], *args: Any) -> T:
+    if not self._slots.acquire(blocking=False):
+      with self._lock:
+        self.rejected += 1
+      raise HashingBusy()
+    with self._lock:
+      self._in_flight += 1
+    future = self._executor.submit(self._timed, time.perf_counter(), fn, *args)
+    # Release on completion rather than when the caller stops waiting, so a
+    # disconnected client cannot free a slot its hash is still occupying.
+    future.add_done_callback(self._release)
+    return await asyncio.wrap_future(future)
+
+  def _release(self, _future) -> None:
+    with self._lock:
+      self._in_flight -= 1
+    self._slots.release()
+
+  def _timed(self, queued_at: float, fn: Callable[..., T], *args: Any) -> T:
+    started = time.perf_counter()
+    try:
+      return fn(*args)
+    finally:
+      finished = time.perf_counter()
+      self._record(started - queued_at, finished - started)
+      password_hash_duration.labels(fn.__name__).observe(finished - started)
+
+  def _record(self, wait: float, duration: float) -> None:
+    with self._lock:
+      self.completed += 1
+      self.wait_seconds_total += wait
+      self.wait_seconds_max = max(self.wait_seconds_max, wait)
+      self.hash_seconds_total += duration
+      self.hash_seconds_max = max(self.hash_seconds_max, duration)
+
+  def stats(self) -> dict:
+    completed = self.completed
+    return {
+      'workers': self.workers,
+      'max_pending': self.max_pending,
+      'in_flight': self._in_flight,
+      'completed': completed,
+      'rejected': self.rejected,
+      'hash_seconds_avg': self.hash_seconds_total / completed if completed else 0.0,
+      'hash_seconds_max': self.hash_seconds_max,
+      'wait_seconds_avg': self.wait_seconds_total / completed if completed else 0.0,
+      'wait_seconds_max': self.wait_seconds_max,
+    }
+
+
+hash_pool = HashingPool(settings.hash_pool_workers, settings.hash_pool_max_pending)
+
+registry.collected(
+  'password_hash_in_flight',
+  'Password hashes queued or running.',
+  'gauge',
+  lambda: [({}, hash_pool.stats()['in_flight'])],
+)
+registry.collected(
+  'password_hash_rejected_total',
+  'Password hashes rejected because the pool was full.',
+  'counter',
+  lambda: [({}, hash_pool.stats()['rejected'])],
+)
@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+import hashlib
+from typing import Optional
+
+from fastapi import Response, status
+
+
+def make_etag(*parts: object) -> str:
+  digest = hashlib.blake2b('|'.join(map(str, parts)).encode(), digest_size=12).hexdigest()
+  return f'W/"{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+  if not if_none_match:
+    return False
+  if if_none_match.strip() == '*':
+    return True
+  # If-None-Match uses the weak comparison function (RFC 9110, 13.1.2).
+  opaque = etag.removeprefix('W/')
+  return any(
+    candidate.strip().removeprefix('W/') == opaque for candidate in if_none_match.split(',')
+  )
+
+
+def not_modified(etag: str, cache_control: str, headers: Optional[dict] = None) -> Response:
+  return Response(
+    status_code=status.HTTP_304_NOT_MODIFIED,
+    headers={'ETag': etag, 'Cache-Control': cache_control, **(headers or {})},
+  )
+
+
+def set_validators(response: Response, etag: str, cache_control: str) -> None:
+  response.headers['ETag'] = etag
+  response.headers['Cache-Control'] = cache_control
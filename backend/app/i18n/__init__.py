@@ -1,35 +1,97 @@
 from __future__ import annotations
 
 import json
+import sys
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict
-
-_LOCALE_CACHE: Dict[str, dict] | None = None
-
-
-def _load_locales() -> Dict[str, dict]:
-  global _LOCALE_CACHE
-  if _LOCALE_CACHE is None:
-    base_path = Path(__file__).resolve()
-    translations = {}
-    for locale_file in base_path.parent.glob('*.json'):
-      with locale_file.open('r', encoding='utf-8') as f:
-        translations[locale_file.stem] = json.load(f)
-    _LOCALE_CACHE = translations
-  return _LOCALE_CACHE
-
-
-def translate(key: str, lang: str = 'en') -> str:
-  locales = _load_locales()
-  lang_key = lang if lang in locales else 'en'
-  current = locales.get(lang_key, {})
-  parts = key.split('.')
-  value = current
-  for part in parts:
+from typing import Optional
+
+DEFAULT_LOCALE = 'en'
+LOCALE_DIR = Path(__file__).resolve().parent
+COMPILED_PATH = LOCALE_DIR / 'compiled.json'
+
+
+def _flatten(tree: dict, prefix: str = '') -> dict[str, str]:
+  flat = {}
+  for key, value in tree.items():
+    path = f'{prefix}{key}'
     if isinstance(value, dict):
-      value = value.get(part)
-    else:
-      value = None
-    if value is None:
-      break
-  return value if isinstance(value, str) else key
+      flat.update(_flatten(value, f'{path}.'))
+    elif isinstance(value, str):
+      flat[path] = value
+  return flat
+
+
+def compile_catalogs() -> dict[str, dict[str, str]]:
+  sources = {}
+  for locale_file in sorted(LOCALE_DIR.glob('*.json')):
+    if locale_file == COMPILED_PATH:
+      continue
+    with locale_file.open('r', encoding='utf-8') as f:
+      sources[locale_file.stem] = _flatten(json.load(f))
+  # Keys missing from a locale fall back to the default locale's text.
+  default = sources.get(DEFAULT_LOCALE, {})
+  return {lang: {**default, **flat} for lang, flat in sources.items()}
+
+
+def _is_compiled_fresh() -> bool:
+  if not COMPILED_PATH.exists():
+    return False
+  compiled_mtime = COMPILED_PATH.stat().st_mtime
+  return all(
+    path.stat().st_mtime <= compiled_mtime
+    for path in LOCALE_DIR.glob('*.json')
+    if path != COMPILED_PATH
+  )
+
+
+def _load_catalogs() -> dict[str, dict[str, str]]:
+  if _is_compiled_fresh():
+    with COMPILED_PATH.open('r', encoding='utf-8') as f:
+      catalogs = json.load(f)
+  else:
+    catalogs = compile_catalogs()
+  return {
+    sys.intern(lang): {sys.intern(key): sys.intern(value) for key, value in flat.items()}
+    for lang, flat in catalogs.items()
+  }
+
+
+_CATALOGS = _load_catalogs()
+SUPPORTED_LOCALES = frozenset(_CATALOGS)
+
+
+def translate(key: str, lang: str = DEFAULT_LOCALE) -> str:
+  catalog = _CATALOGS.get(lang) or _CATALOGS.get(DEFAULT_LOCALE, {})
+  return catalog.get(key, key)
+
+
+def _match_locale(tag: str) -> Optional[str]:
+  tag = tag.lower()
+  if tag in SUPPORTED_LOCALES:
+    return tag
+  primary = tag.split('-', 1)[0]
+  return primary if primary in SUPPORTED_LOCALES else None
+
+
+@lru_cache(maxsize=1024)
+def negotiate_locale(accept_language: Optional[str]) -> str:
+  if not accept_language:
+    return DEFAULT_LOCALE
+  best, best_q = DEFAULT_LOCALE, 0.0
+  for part in accept_language.split(','):
+    tag, _, params = part.strip().partition(';')
+    q = 1.0
+    params = params.strip()
+    if params.startswith('q='):
+      try:
+        q = float(params[2:])
+      except ValueError:
+        continue
+    # Ties keep the earlier entry, which the header lists as preferred.
+    if q <= best_q:
+      continue
+    locale = DEFAULT_LOCALE if tag.strip() == '*' else _match_locale(tag.strip())
+    if locale:
+      best, best_q = locale, q
+  return best
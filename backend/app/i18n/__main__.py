@@ -0,0 +1,8 @@
+import json
+
+from . import COMPILED_PATH, compile_catalogs
+
+if __name__ == '__main__':
+  with COMPILED_PATH.open('w', encoding='utf-8') as f:
+    json.dump(compile_catalogs(), f, ensure_ascii=False, separators=(',', ':'))
+  print(f'Wrote {COMPILED_PATH}')
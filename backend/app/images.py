@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import multiprocessing
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from pathlib import Path
+from typing import BinaryIO, Optional
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from . import schemas
+from .cache import product_cache
+from .core.config import settings
+from .models import OutboxEvent, Product
+from .outbox import enqueue, handler
+
+logger = logging.getLogger(__name__)
+
+TOPIC = 'product.image_uploaded'
+# (name, longest side in pixels); each is written in every format below.
+VARIANTS = (('thumbnail', 320), ('large', 1024))
+FORMATS = {
+  'jpg': ('JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+  'webp': ('WEBP', {'quality': 80, 'method': 4}),
+}
+ORIGINAL_FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp', 'GIF': 'gif'}
+CHUNK_SIZE = 1024 * 1024
+
+
+class InvalidImage(Exception):
+  def __init__(self, reason: str):
+    super().__init__(reason)
+    self.reason = reason
+
+
+def image_dir(product_id: int, image_key: str) -> Path:
+  return Path(settings.media_root) / 'products' / str(product_id) / image_key
+
+
+def _variant_files() -> list[str]:
+  return [f'{name}.{ext}' for name, _ in VARIANTS for ext in FORMATS]
+
+
+def store_original(product_id: int, upload: BinaryIO) -> tuple[str, str]:
+  # Blocking. Checks the upload from its header alone (no decoding) and saves
+  # it under a key derived from its content; returns (key, file name).
+  digest = hashlib.sha256()
+  for chunk in iter(lambda: upload.read(CHUNK_SIZE), b''):
+    digest.update(chunk)
+  upload.seek(0)
+  try:
+    with Image.open(upload) as image:
+      fmt, (width, height) = image.format, image.size
+  except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as exc:
+    raise InvalidImage('invalid_image') from exc
+  if fmt not in ORIGINAL_FORMATS:
+    raise InvalidImage('invalid_image')
+  if width * height > settings.image_max_pixels:
+    raise InvalidImage('image_too_large')
+  image_key = digest.hexdigest()[:24]
+  directory = image_dir(product_id, image_key)
+  directory.mkdir(parents=True, exist_ok=True)
+  original = directory / f'original.{ORIGINAL_FORMATS[fmt]}'
+  partial = directory / f'{original.name}.part'
+  upload.seek(0)
+  with partial.open('wb') as f:
+    shutil.copyfileobj(upload, f, CHUNK_SIZE)
+  os.replace(partial, original)
+  return image_key, original.name
+
+
+def request_variants(
+  db: Session, product_id: int, image_key: str, original: str
+) -> schemas.ProductImageUpload:
+  if all((image_dir(product_id, image_key) / name).exists() for name in _variant_files()):
+    # The same file was uploaded before; its variants are still on disk.
+    db.execute(update(Product).where(Product.id == product_id).values(image_key=image_key))
+    db.commit()
+    product_cache.invalidate_product(product_id)
+    return schemas.ProductImageUpload(product_id=product_id, image_key=image_key, status='ready')
+  key = f'{product_id}:{image_key}'
+  now = datetime.utcnow()
+  requeued = db.execute(
+    update(OutboxEvent)
+    .where(OutboxEvent.idempotency_key == f'{TOPIC}:{key}')
+    .values(status='pending', attempts=0, available_at=now, updated_at=now)
+  ).rowcount
+  if not requeued:
+    enqueue(
+      db, TOPIC, key, {'product_id': product_id, 'image_key': image_key, 'original': original}
+    )
+  db.commit()
+  return schemas.ProductImageUpload(product_id=product_id, image_key=image_key, status='processing')
+
+
+def render_variant(source: str, target: str, size: int, ext: str) -> None:
+  # Runs in a pool process. Pixel counts were checked at upload.
+  Image.MAX_IMAGE_PIXELS = None
+  fmt, options = FORMATS[ext]
+  with Image.open(source) as image:
+    # Lets JPEG decode straight at a reduced scale instead of full size.
+    image.draft(None, (size * 2, size * 2))
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((size, size), Image.Resampling.LANCZOS)
+    has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+    if fmt == 'JPEG' and has_alpha:
+      rgba = image.convert('RGBA')
+      image = Image.new('RGB', rgba.size, 'white')
+      image.paste(rgba, mask=rgba.getchannel('A'))
+    elif image.mode not in ('RGB', 'RGBA'):
+      image = image.convert('RGBA' if has_alpha else 'RGB')
+    partial = f'{target}.part'
+    image.save(partial, fmt, **options)
+  os.replace(partial, target)
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def image_pool() -> ProcessPoolExecutor:
+  global _pool
+  if _pool is None:
+    # Spawned rather than forked, so workers do not inherit the parent's
+    # database connections and threads.
+    _pool = ProcessPoolExecutor(
+      max_workers=settings.image_pool_workers, mp_context=multiprocessing.get_context('spawn')
+    )
+  return _pool
+
+
+def shutdown_image_pool() -> None:
+  global _pool
+  if _pool is not None:
+    _pool.shutdown()
+    _pool = None
+
+
+@handler(TOPIC)
+def _render_variants(db: Session, payload: dict, key: str) -> None:
+  product_id, image_key = payload['product_id'], payload['image_key']
+  directory = image_dir(product_id, image_key)
+  source = str(directory / payload['original'])
+  try:
+    jobs = [
+      image_pool().submit(render_variant, source, str(directory / f'{name}.{ext}'), size, ext)
+      for name, size in VARIANTS
+      for ext in FORMATS
+    ]
+    for job in jobs:
+      job.result()
+  except BrokenProcessPool:
+    # A worker died (e.g. killed for memory); start a fresh pool on retry.
+    shutdown_image_pool()
+    raise
+  # Commits with the event. The API processes' product caches pick the change
+  # up within PRODUCT_CACHE_TTL_SECONDS.
+  db.execute(update(Product).where(Product.id == product_id).values(image_key=image_key))
+  logger.info('Rendered image %s for product %s', image_key, product_id)
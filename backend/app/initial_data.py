@@ -1,42 +1,60 @@
+import hashlib
 import json
+from datetime import datetime
 from pathlib import Path
 
+from sqlalchemy import insert, select, update
 from sqlalchemy.orm import Session
 
 from .core.config import settings
-from .models import Product, User
+from .models import Product, SeedRecord, User
 from .security import get_password_hash
 
+SEED_DEFAULTS = {'description': '', 'price': 0, 'image_url': None, 'is_active': True, 'stock': 0}
 
-def load_seed_products() -> list[dict]:
+
+def seed_products(db: Session, force: bool = False) -> bool:
+  # Set-based: one lookup, one bulk UPDATE and one bulk INSERT however long
+  # the seed file is, and nothing at all when its content hash is unchanged.
+  # Runs in the caller's transaction; invalidate the product cache after
+  # committing when it returns True.
   seed_path = Path(settings.seed_data_path)
   if not seed_path.exists():
-    return []
-  with seed_path.open('r', encoding='utf-8') as f:
-    return json.load(f)
-
-
-def seed_products(db: Session) -> None:
-  for item in load_seed_products():
-    product = db.query(Product).filter(Product.name == item['name']).first()
-    if product:
-      product.description = item.get('description', product.description)
-      product.price = item.get('price', product.price)
-      product.image_url = item.get('image_url', product.image_url)
-      product.is_active = item.get('is_active', product.is_active)
-      product.stock = item.get('stock', product.stock)
-    else:
-      db.add(
-        Product(
-          name=item['name'],
-          description=item.get('description', ''),
-          price=item.get('price', 0),
-          image_url=item.get('image_url'),
-          is_active=item.get('is_active', True),
-          stock=item.get('stock', 0),
-        )
-      )
-  db.commit()
+    return False
+  content = seed_path.read_bytes()
+  content_hash = hashlib.sha256(content).hexdigest()
+  record = db.get(SeedRecord, 'products')
+  if record is not None and record.content_hash == content_hash and not force:
+    return False
+
+  items = {item['name']: item for item in json.loads(content)}
+  existing = dict(db.execute(select(Product.name, Product.id).where(Product.name.in_(items))).all())
+  now = datetime.utcnow()
+  updates = [
+    {
+      'id': existing[name],
+      **{field: item[field] for field in SEED_DEFAULTS if field in item},
+      'updated_at': now,
+    }
+    for name, item in items.items()
+    if name in existing
+  ]
+  inserts = [
+    {
+      'name': name,
+      **{field: item.get(field, default) for field, default in SEED_DEFAULTS.items()},
+      'created_at': now,
+      'updated_at': now,
+    }
+    for name, item in items.items()
+    if name not in existing
+  ]
+  if updates:
+    db.execute(update(Product), updates)
+  if inserts:
+    db.execute(insert(Product), inserts)
+  db.merge(SeedRecord(name='products', content_hash=content_hash, applied_at=now))
+  return True
 
 
 def ensure_admin_user(db: Session) -> None:
@@ -49,4 +67,4 @@ def ensure_admin_user(db: Session) -> None:
     is_admin=True,
   )
   db.add(admin)
-  db.commit()
+  db.flush()
@@ -1,31 +1,54 @@
+from urllib.parse import urlsplit
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.staticfiles import StaticFiles
 
+from . import cache_events
 from .core.config import settings
-from .database import Base, SessionLocal, engine
-from .initial_data import ensure_admin_user, seed_products
-from .routers import admin, auth, cart, orders, products
+from .manage import prepare_database
+from .metrics import MetricsMiddleware
+from .pagination import NEXT_CURSOR_HEADER
+from .query_stats import QueryStatsMiddleware
+from .rate_limit import RateLimitMiddleware
+from .replicas import PrimaryPinMiddleware, replicas
+from .routers import (
+  admin,
+  analytics,
+  auth,
+  cart,
+  metrics,
+  orders,
+  products,
+  reservations,
+  stats,
+)
 
 app = FastAPI(title='E-Shop API')
 
+# Added first so it runs inside CORS: browsers can then read the 429.
+if settings.rate_limit_enabled:
+  app.add_middleware(RateLimitMiddleware)
 app.add_middleware(
   CORSMiddleware,
   allow_origins=settings.cors_origins,
   allow_credentials=True,
   allow_methods=['*'],
   allow_headers=['*'],
+  expose_headers=[NEXT_CURSOR_HEADER, 'Retry-After'],
 )
+if replicas is not None:
+  app.add_middleware(PrimaryPinMiddleware)
+if settings.query_stats_enabled:
+  app.add_middleware(QueryStatsMiddleware)
+if settings.metrics_enabled:
+  app.add_middleware(MetricsMiddleware)
 
 
 @app.on_event('startup')
 def on_startup():
-  db = SessionLocal()
-  try:
-    Base.metadata.create_all(bind=engine)
-    ensure_admin_user(db)
-    seed_products(db)
-  finally:
-    db.close()
+  prepare_database()
+  cache_events.start()
 
 
 @app.get('/')
@@ -37,4 +60,16 @@ app.include_router(auth.router)
 app.include_router(products.router)
 app.include_router(cart.router)
 app.include_router(orders.router)
+app.include_router(reservations.router)
 app.include_router(admin.router)
+app.include_router(stats.router)
+app.include_router(analytics.router)
+if settings.metrics_enabled:
+  app.include_router(metrics.router)
+if settings.serve_media:
+  # nginx serves media in production; this is for running without it.
+  app.mount(
+    urlsplit(settings.media_url).path.rstrip('/'),
+    StaticFiles(directory=settings.media_root, check_dir=False),
+    name='media',
+  )
@@ -0,0 +1,88 @@
+"""Database management commands.
+
+python -m app.manage migrate        apply pending schema migrations
+python -m app.manage seed [--force] create the admin user and load seed products
+python -m app.manage check          fail unless the schema is up to date
+python -m app.manage analytics      recount the sales rollups and low-stock watchlist
+
+Commands can be combined and run in order: `python -m app.manage migrate seed`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import sys
+
+from .analytics import rebuild
+from .cache import product_cache
+from .core.config import settings
+from .database import SessionLocal, engine
+from .initial_data import ensure_admin_user, seed_products
+from .migrations import LATEST_VERSION, SchemaOutdated, advisory_lock, migrate, verify
+
+logger = logging.getLogger('app.manage')
+
+
+def seed(force: bool = False) -> None:
+  db = SessionLocal()
+  try:
+    # One transaction under the migrations' lock, so workers booting together
+    # against a new database do not both insert the seed.
+    advisory_lock(db.connection())
+    ensure_admin_user(db)
+    loaded = seed_products(db, force=force)
+    db.commit()
+  finally:
+    db.close()
+  if loaded:
+    product_cache.invalidate_all()
+    logger.info('Seed products loaded')
+  else:
+    logger.info('Seed products unchanged')
+
+
+def prepare_database(with_seed: bool = True) -> None:
+  # STARTUP_MODE=full migrates (and seeds) on boot; `verify` leaves that to
+  # `python -m app.manage migrate seed` and only checks the schema version.
+  if settings.startup_mode == 'verify':
+    verify(engine)
+    return
+  migrate(engine)
+  if with_seed:
+    seed()
+
+
+def main() -> None:
+  parser = argparse.ArgumentParser(
+    description=__doc__.splitlines()[0], formatter_class=argparse.RawDescriptionHelpFormatter
+  )
+  parser.add_argument('commands', nargs='+', choices=('migrate', 'seed', 'check', 'analytics'))
+  parser.add_argument('--force', action='store_true', help='reload seed data even if unchanged')
+  args = parser.parse_args()
+  logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+  for command in args.commands:
+    if command == 'migrate':
+      applied = migrate(engine)
+      logger.info(
+        'Applied migrations %s' if applied else 'Schema already at version %s',
+        ', '.join(f'{number:04d}' for number in applied) or LATEST_VERSION,
+      )
+    elif command == 'seed':
+      seed(force=args.force)
+    elif command == 'analytics':
+      with SessionLocal() as db:
+        rebuild(db)
+        db.commit()
+      logger.info('Sales analytics rebuilt')
+    else:
+      try:
+        logger.info('Schema at version %s', verify(engine))
+      except SchemaOutdated as exc:
+        logger.error('%s', exc)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+  main()
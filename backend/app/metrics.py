@@ -0,0 +1,317 @@
+from __future__ import annotations
+
+import bisect
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from typing import Any
+
+from anyio import to_thread
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# (name suffix, labels, value)
+Sample = tuple[str, dict[str, str], float]
+
+
+class _Cells:
+  # Per-thread value slots: a thread only ever writes its own list, so updates
+  # take no lock and cannot be lost. Scrapes add the slots up.
+  def __init__(self, size: int):
+    self.size = size
+    self._local = threading.local()
+    self._shards: list[list[float]] = []
+    self._lock = threading.Lock()
+
+  def local(self) -> list[float]:
+    try:
+      return self._local.cells
+    except AttributeError:
+      cells = self._local.cells = [0.0] * self.size
+      with self._lock:
+        self._shards.append(cells)
+      return cells
+
+  def totals(self) -> list[float]:
+    with self._lock:
+      shards = list(self._shards)
+    return [sum(values) for values in zip(*shards, strict=True)] if shards else [0.0] * self.size
+
+
+class CounterChild:
+  def __init__(self):
+    self._cells = _Cells(1)
+
+  def inc(self, amount: float = 1.0) -> None:
+    self._cells.local()[0] += amount
+
+  def value(self) -> float:
+    return self._cells.totals()[0]
+
+
+class GaugeChild(CounterChild):
+  def dec(self, amount: float = 1.0) -> None:
+    self._cells.local()[0] -= amount
+
+
+class HistogramChild:
+  # Slots hold per-bucket counts (not cumulative, +Inf last) and then the sum.
+  def __init__(self, buckets: tuple[float, ...]):
+    self._buckets = buckets
+    self._cells = _Cells(len(buckets) + 2)
+
+  def observe(self, value: float) -> None:
+    cells = self._cells.local()
+    cells[bisect.bisect_left(self._buckets, value)] += 1
+    cells[-1] += value
+
+
+class _Metric(ABC):
+  kind = ''
+
+  def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+    self.name = name
+    self.documentation = documentation
+    self.labelnames = tuple(labelnames)
+    self._children: dict[tuple[str, ...], Any] = {}
+    self._lock = threading.Lock()
+
+  @abstractmethod
+  def _new_child(self): ...
+
+  def labels(self, *values: str):
+    # Callers bind label sets once and keep the child; looking up an existing
+    # set takes no lock either.
+    child = self._children.get(values)
+    if child is None:
+      if len(values) != len(self.labelnames):
+        raise ValueError(f'{self.name} expects labels {self.labelnames}')
+      with self._lock:
+        child = self._children.setdefault(values, self._new_child())
+    return child
+
+  def samples(self) -> Iterator[Sample]:
+    for values, child in list(self._children.items()):
+      yield from self._child_samples(dict(zip(self.labelnames, values, strict=True)), child)
+
+  def _child_samples(self, labels: dict[str, str], child) -> Iterator[Sample]:
+    yield '', labels, child.value()
+
+
+class Counter(_Metric):
+  kind = 'counter'
+
+  def _new_child(self) -> CounterChild:
+    return CounterChild()
+
+
+class Gauge(_Metric):
+  kind = 'gauge'
+
+  def _new_child(self) -> GaugeChild:
+    return GaugeChild()
+
+
+class Histogram(_Metric):
+  kind = 'histogram'
+
+  def __init__(
+    self,
+    name: str,
+    documentation: str,
+    labelnames: Sequence[str] = (),
+    buckets: Sequence[float] = DEFAULT_BUCKETS,
+  ):
+    super().__init__(name, documentation, labelnames)
+    self.buckets = tuple(sorted(buckets))
+
+  def _new_child(self) -> HistogramChild:
+    return HistogramChild(self.buckets)
+
+  def _child_samples(self, labels: dict[str, str], child) -> Iterator[Sample]:
+    totals = child._cells.totals()
+    count = 0.0
+    for bound, observed in zip(self.buckets + (math.inf,), totals[:-1], strict=True):
+      count += observed
+      yield '_bucket', {**labels, 'le': _format_value(bound)}, count
+    yield '_count', labels, count
+    yield '_sum', labels, totals[-1]
+
+
+class CollectedMetric:
+  # Samples read from existing stats (pools, caches) at scrape time, so
+  # request handling pays nothing for them.
+  def __init__(
+    self,
+    name: str,
+    documentation: str,
+    kind: str,
+    collect: Callable[[], Iterable[tuple[dict[str, str], float]]],
+  ):
+    self.name = name
+    self.documentation = documentation
+    self.kind = kind
+    self._collect = collect
+
+  def samples(self) -> Iterator[Sample]:
+    for labels, value in self._collect():
+      yield '', labels, value
+
+
+class Registry:
+  def __init__(self):
+    self._metrics: dict[str, Any] = {}
+
+  def register(self, metric):
+    if metric.name in self._metrics:
+      raise ValueError(f'Metric {metric.name} is already registered')
+    self._metrics[metric.name] = metric
+    return metric
+
+  def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    return self.register(Counter(name, documentation, labelnames))
+
+  def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+    return self.register(Gauge(name, documentation, labelnames))
+
+  def histogram(
+    self,
+    name: str,
+    documentation: str,
+    labelnames: Sequence[str] = (),
+    buckets: Sequence[float] = DEFAULT_BUCKETS,
+  ) -> Histogram:
+    return self.register(Histogram(name, documentation, labelnames, buckets))
+
+  def collected(
+    self,
+    name: str,
+    documentation: str,
+    kind: str,
+    collect: Callable[[], Iterable[tuple[dict[str, str], float]]],
+  ) -> CollectedMetric:
+    return self.register(CollectedMetric(name, documentation, kind, collect))
+
+  def collect_stats(
+    self,
+    prefix: str,
+    label: str,
+    stats: Callable[[], list[dict]],
+    fields: Sequence[tuple[str, str, str, str]],
+  ) -> None:
+    # One metric per (name, stats key, kind, help) over the rows of an
+    # existing `stats()` list, labelled by each row's name.
+    for name, key, kind, documentation in fields:
+      self.collected(
+        f'{prefix}_{name}',
+        documentation,
+        kind,
+        lambda key=key: (({label: row['name']}, row[key]) for row in stats()),
+      )
+
+  def render(self) -> str:
+    lines = []
+    for metric in list(self._metrics.values()):
+      lines.append(f'# HELP {metric.name} {metric.documentation}')
+      lines.append(f'# TYPE {metric.name} {metric.kind}')
+      for suffix, labels, value in metric.samples():
+        lines.append(f'{metric.name}{suffix}{_format_labels(labels)} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def _escape(value: str) -> str:
+  return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: dict[str, str]) -> str:
+  if not labels:
+    return ''
+  return '{' + ','.join(f'{name}="{_escape(str(value))}"' for name, value in labels.items()) + '}'
+
+
+def _format_value(value: float) -> str:
+  if value == math.inf:
+    return '+Inf'
+  if float(value).is_integer():
+    return str(int(value))
+  return repr(float(value))
+
+
+registry = Registry()
+
+http_requests = registry.counter(
+  'http_requests_total', 'HTTP requests by route and status.', ('method', 'route', 'status')
+)
+http_request_duration = registry.histogram(
+  'http_request_duration_seconds', 'HTTP request latency by route.', ('method', 'route')
+)
+http_in_flight = registry.gauge('http_requests_in_flight', 'HTTP requests being served.').labels()
+password_hash_duration = registry.histogram(
+  'password_hash_duration_seconds',
+  'Time spent hashing or verifying a password.',
+  ('operation',),
+  buckets=(0.01, 0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 1.0, 2.0),
+)
+_checkouts = registry.counter('checkouts_total', 'Checkout attempts by outcome.', ('outcome',))
+checkout_outcomes = {
+  outcome: _checkouts.labels(outcome)
+  for outcome in ('success', 'cart_empty', 'insufficient_stock', 'error')
+}
+
+
+def _threadpool_limiter():
+  # Only callable on the event loop, which is where scrapes are served.
+  return to_thread.current_default_thread_limiter()
+
+
+registry.collected(
+  'threadpool_threads_busy',
+  'Threadpool threads in use.',
+  'gauge',
+  lambda: [({}, _threadpool_limiter().borrowed_tokens)],
+)
+registry.collected(
+  'threadpool_threads_limit',
+  'Threadpool size.',
+  'gauge',
+  lambda: [({}, _threadpool_limiter().total_tokens)],
+)
+registry.collected(
+  'threadpool_tasks_waiting',
+  'Calls waiting for a threadpool thread.',
+  'gauge',
+  lambda: [({}, _threadpool_limiter().statistics().tasks_waiting)],
+)
+
+
+class MetricsMiddleware:
+  # Routes are labelled by path template ("/api/orders/{order_id}") so label
+  # sets stay bounded; paths no route matched share one label.
+  def __init__(self, app: ASGIApp):
+    self.app = app
+
+  async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+    if scope['type'] != 'http':
+      await self.app(scope, receive, send)
+      return
+    started = time.perf_counter()
+    status_code = 500
+
+    async def send_with_status(message: Message) -> None:
+      nonlocal status_code
+      if message['type'] == 'http.response.start':
+        status_code = message['status']
+      await send(message)
+
+    http_in_flight.inc()
+    try:
+      await self.app(scope, receive, send_with_status)
+    finally:
+      http_in_flight.dec()
+      route = getattr(scope.get('route'), 'path', None) or 'unmatched'
+      http_request_duration.labels(scope['method'], route).observe(time.perf_counter() - started)
+      http_requests.labels(scope['method'], route, str(status_code)).inc()
@@ -0,0 +1,189 @@
+from sqlalchemy import (
+  JSON,
+  Boolean,
+  Column,
+  DateTime,
+  ForeignKey,
+  Index,
+  Integer,
+  MetaData,
+  Numeric,
+  String,
+  Table,
+  Text,
+  UniqueConstraint,
+  func,
+  literal,
+)
+from sqlalchemy.engine import Connection
+
+# The schema when migrations were introduced, frozen here rather than taken
+# from app.models so that this migration always builds the same thing.
+metadata = MetaData()
+
+
+def _timestamps() -> list[Column]:
+  return [
+    Column('created_at', DateTime, nullable=False),
+    Column('updated_at', DateTime, nullable=False),
+  ]
+
+
+users = Table(
+  'users',
+  metadata,
+  Column('id', Integer, primary_key=True, index=True),
+  Column('email', String(255), unique=True, index=True, nullable=False),
+  Column('hashed_password', String(255), nullable=False),
+  Column('is_active', Boolean, nullable=False),
+  Column('is_admin', Boolean, nullable=False),
+  *_timestamps(),
+)
+
+products = Table(
+  'products',
+  metadata,
+  Column('id', Integer, primary_key=True, index=True),
+  Column('name', String(255), nullable=False),
+  Column('description', Text, nullable=False),
+  Column('price', Numeric(10, 2), nullable=False),
+  Column('image_url', Text, nullable=True),
+  Column('is_active', Boolean, nullable=False),
+  Column('stock', Integer, nullable=False),
+  *_timestamps(),
+)
+_active = products.c.is_active.is_(True)
+Index(
+  'ix_products_active_created_id',
+  products.c.created_at,
+  products.c.id,
+  postgresql_include=['price', 'stock'],
+  postgresql_where=_active,
+  sqlite_where=_active,
+)
+Index(
+  'ix_products_in_stock_created_id',
+  products.c.created_at,
+  products.c.id,
+  postgresql_include=['price'],
+  postgresql_where=_active & (products.c.stock > 0),
+  sqlite_where=_active & (products.c.stock > 0),
+)
+Index(
+  'ix_products_active_price',
+  products.c.price,
+  products.c.created_at,
+  products.c.id,
+  postgresql_where=_active,
+  sqlite_where=_active,
+)
+Index(
+  'ix_products_active_name_prefix',
+  products.c.name,
+  postgresql_ops={'name': 'text_pattern_ops'},
+  postgresql_where=_active,
+  sqlite_where=_active,
+)
+Index(
+  'ix_products_search',
+  func.setweight(func.to_tsvector(literal('simple'), products.c.name), 'A').op('||')(
+    func.setweight(func.to_tsvector(literal('simple'), products.c.description), 'B')
+  ),
+  postgresql_using='gin',
+).ddl_if(dialect='postgresql')
+Index(
+  'ix_products_name_trgm',
+  products.c.name,
+  postgresql_using='gin',
+  postgresql_ops={'name': 'gin_trgm_ops'},
+).ddl_if(dialect='postgresql')
+
+cart_items = Table(
+  'cart_items',
+  metadata,
+  Column('id', Integer, primary_key=True, index=True),
+  Column('user_id', Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False),
+  Column('product_id', Integer, ForeignKey('products.id'), nullable=False),
+  Column('quantity', Integer, nullable=False),
+  *_timestamps(),
+  UniqueConstraint('user_id', 'product_id', name='uq_user_product'),
+)
+
+orders = Table(
+  'orders',
+  metadata,
+  Column('id', Integer, primary_key=True, index=True),
+  Column('user_id', Integer, ForeignKey('users.id', ondelete='SET NULL'), nullable=False),
+  Column('status', String(50), nullable=False),
+  Column('total_price', Numeric(12, 2), nullable=False),
+  *_timestamps(),
+  Index('ix_orders_user_created_id', 'user_id', 'created_at', 'id'),
+)
+
+order_items = Table(
+  'order_items',
+  metadata,
+  Column('id', Integer, primary_key=True, index=True),
+  Column('order_id', Integer, ForeignKey('orders.id', ondelete='CASCADE'), nullable=False),
+  Column('product_id', Integer, ForeignKey('products.id'), nullable=False),
+  Column('quantity', Integer, nullable=False),
+  Column('unit_price', Numeric(10, 2), nullable=False),
+  Column('subtotal_price', Numeric(12, 2), nullable=False),
+  Index('ix_order_items_order_id', 'order_id'),
+)
+
+reservations = Table(
+  'reservations',
+  metadata,
+  Column('id', Integer, primary_key=True),
+  Column('user_id', Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False),
+  Column('product_id', Integer, ForeignKey('products.id'), nullable=False),
+  Column('quantity', Integer, nullable=False),
+  Column('expires_at', DateTime, nullable=False),
+  *_timestamps(),
+  UniqueConstraint('user_id', 'product_id', name='uq_reservation_user_product'),
+  Index('ix_reservations_expires_at', 'expires_at'),
+)
+
+outbox_events = Table(
+  'outbox_events',
+  metadata,
+  Column('id', Integer, primary_key=True),
+  Column('topic', String(100), nullable=False),
+  Column('idempotency_key', String(255), unique=True, nullable=False),
+  Column('payload', JSON, nullable=False),
+  Column('status', String(20), nullable=False),
+  Column('attempts', Integer, nullable=False),
+  Column('available_at', DateTime, nullable=False),
+  Column('last_error', Text, nullable=True),
+  Column('processed_at', DateTime, nullable=True),
+  *_timestamps(),
+)
+_due = outbox_events.c.status.in_(('pending', 'processing'))
+Index(
+  'ix_outbox_events_due',
+  outbox_events.c.available_at,
+  outbox_events.c.id,
+  postgresql_where=_due,
+  sqlite_where=_due,
+)
+
+seed_records = Table(
+  'seed_records',
+  metadata,
+  Column('name', String(100), primary_key=True),
+  Column('content_hash', String(64), nullable=False),
+  Column('applied_at', DateTime, nullable=False),
+)
+
+
+def upgrade(connection: Connection) -> None:
+  # Databases created before migrations existed were built by create_all at
+  # boot, which adds missing tables but never indexes on existing ones.
+  # Bring either kind, or an empty database, to this schema.
+  if connection.dialect.name == 'postgresql':
+    connection.exec_driver_sql('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+  metadata.create_all(connection)
+  for table in metadata.sorted_tables:
+    for index in table.indexes:
+      index.create(connection, checkfirst=True)
@@ -0,0 +1,5 @@
+from sqlalchemy.engine import Connection
+
+
+def upgrade(connection: Connection) -> None:
+  connection.exec_driver_sql('ALTER TABLE products ADD COLUMN image_key VARCHAR(64)')
@@ -0,0 +1,97 @@
+"""Versioned schema migrations.
+
+Each `NNNN_name.py` module in this package defines `upgrade(connection)`;
+`migrate` applies the ones newer than the database's recorded version, in
+order and in one transaction. Never edit a migration that has shipped: add a
+new one.
+
+Migrations define the tables they create themselves instead of importing
+app.models, so they keep building the same schema as the models move on.
+"""
+
+from __future__ import annotations
+
+import importlib
+import logging
+import pkgutil
+from collections.abc import Callable
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, insert, select
+from sqlalchemy.engine import Connection, Engine
+
+logger = logging.getLogger(__name__)
+
+schema_migrations = Table(
+  'schema_migrations',
+  MetaData(),
+  Column('version', Integer, primary_key=True),
+  Column('name', String(255), nullable=False),
+  Column('applied_at', DateTime, nullable=False),
+)
+
+# Serializes concurrent `migrate` and `seed` runs on PostgreSQL (arbitrary
+# constant).
+_ADVISORY_LOCK_ID = 7_341_902
+
+
+class SchemaOutdated(RuntimeError):
+  pass
+
+
+def _load() -> list[tuple[int, str, Callable[[Connection], None]]]:
+  migrations = []
+  for module in pkgutil.iter_modules(__path__):
+    version, _, name = module.name.partition('_')
+    if not version.isdigit():
+      continue
+    upgrade = importlib.import_module(f'{__name__}.{module.name}').upgrade
+    migrations.append((int(version), name, upgrade))
+  return sorted(migrations)
+
+
+MIGRATIONS = _load()
+LATEST_VERSION = MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def current_version(connection: Connection) -> int:
+  if not connection.dialect.has_table(connection, schema_migrations.name):
+    return 0
+  return connection.execute(select(func.max(schema_migrations.c.version))).scalar() or 0
+
+
+def advisory_lock(connection: Connection) -> None:
+  # Held until the connection's transaction ends; other workers wait, then
+  # find nothing left to do.
+  if connection.dialect.name == 'postgresql':
+    connection.exec_driver_sql(f'SELECT pg_advisory_xact_lock({_ADVISORY_LOCK_ID})')
+
+
+def migrate(engine: Engine) -> list[int]:
+  applied = []
+  with engine.begin() as connection:
+    advisory_lock(connection)
+    schema_migrations.create(connection, checkfirst=True)
+    version = current_version(connection)
+    for number, name, upgrade in MIGRATIONS:
+      if number <= version:
+        continue
+      logger.info('Applying migration %04d_%s', number, name)
+      upgrade(connection)
+      connection.execute(
+        insert(schema_migrations).values(version=number, name=name, applied_at=datetime.utcnow())
+      )
+      applied.append(number)
+  return applied
+
+
+def verify(engine: Engine) -> int:
+  # A cheap read for processes that must not run DDL themselves.
+  with engine.connect() as connection:
+    version = current_version(connection)
+  if version < LATEST_VERSION:
+    raise SchemaOutdated(
+      f'Database schema is at version {version}, the code needs {LATEST_VERSION}; '
+      'run `python -m app.manage migrate`'
+    )
+  return version
@@ -1,14 +1,22 @@
 from datetime import datetime
+
 from sqlalchemy import (
+  DDL,
+  JSON,
   Boolean,
   Column,
+  Date,
   DateTime,
   ForeignKey,
+  Index,
   Integer,
   Numeric,
   String,
   Text,
   UniqueConstraint,
+  bindparam,
+  event,
+  func,
 )
 from sqlalchemy.orm import relationship
 
@@ -41,12 +49,74 @@ class Product(Base, TimestampMixin):
   description = Column(Text, nullable=False)
   price = Column(Numeric(10, 2), nullable=False)
   image_url = Column(Text, nullable=True)
+  # Set once variants of an uploaded image exist; see app.images.
+  image_key = Column(String(64), nullable=True)
   is_active = Column(Boolean, default=True, nullable=False)
   stock = Column(Integer, default=0, nullable=False)
 
   cart_items = relationship('CartItem', back_populates='product')
   order_items = relationship('OrderItem', back_populates='product')
 
+  # Partial indexes backing the keyset-paginated catalog: each one matches the
+  # `ORDER BY created_at DESC, id DESC` of `list_products` for a filter combination.
+  __table_args__ = (
+    Index(
+      'ix_products_active_created_id',
+      'created_at',
+      'id',
+      postgresql_include=['price', 'stock'],
+      postgresql_where=is_active.is_(True),
+      sqlite_where=is_active.is_(True),
+    ),
+    Index(
+      'ix_products_in_stock_created_id',
+      'created_at',
+      'id',
+      postgresql_include=['price'],
+      postgresql_where=is_active.is_(True) & (stock > 0),
+      sqlite_where=is_active.is_(True) & (stock > 0),
+    ),
+    Index(
+      'ix_products_active_price',
+      'price',
+      'created_at',
+      'id',
+      postgresql_where=is_active.is_(True),
+      sqlite_where=is_active.is_(True),
+    ),
+    Index(
+      'ix_products_active_name_prefix',
+      'name',
+      postgresql_ops={'name': 'text_pattern_ops'},
+      postgresql_where=is_active.is_(True),
+      sqlite_where=is_active.is_(True),
+    ),
+  )
+
+
+# Full-text search document for products. The config is inlined as a literal so
+# queries match the expression index even with server-side bound parameters.
+SEARCH_CONFIG = bindparam('search_config', 'simple', literal_execute=True)
+_products = Product.__table__
+product_search_document = func.setweight(func.to_tsvector(SEARCH_CONFIG, _products.c.name), 'A').op(
+  '||'
+)(func.setweight(func.to_tsvector(SEARCH_CONFIG, _products.c.description), 'B'))
+
+Index('ix_products_search', product_search_document, postgresql_using='gin').ddl_if(
+  dialect='postgresql'
+)
+Index(
+  'ix_products_name_trgm',
+  _products.c.name,
+  postgresql_using='gin',
+  postgresql_ops={'name': 'gin_trgm_ops'},
+).ddl_if(dialect='postgresql')
+event.listen(
+  _products,
+  'before_create',
+  DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'),
+)
+
 
 class CartItem(Base, TimestampMixin):
   __tablename__ = 'cart_items'
@@ -63,6 +133,8 @@ class CartItem(Base, TimestampMixin):
 
 class Order(Base, TimestampMixin):
   __tablename__ = 'orders'
+  # Order history is paged per user newest first.
+  __table_args__ = (Index('ix_orders_user_created_id', 'user_id', 'created_at', 'id'),)
 
   id = Column(Integer, primary_key=True, index=True)
   user_id = Column(Integer, ForeignKey('users.id', ondelete='SET NULL'), nullable=False)
@@ -75,6 +147,7 @@ class Order(Base, TimestampMixin):
 
 class OrderItem(Base):
   __tablename__ = 'order_items'
+  __table_args__ = (Index('ix_order_items_order_id', 'order_id'),)
 
   id = Column(Integer, primary_key=True, index=True)
   order_id = Column(Integer, ForeignKey('orders.id', ondelete='CASCADE'), nullable=False)
@@ -85,3 +158,92 @@ class OrderItem(Base):
 
   order = relationship('Order', back_populates='items')
   product = relationship('Product', back_populates='order_items')
+
+
+class Reservation(Base, TimestampMixin):
+  # A timed hold: its quantity is already taken out of Product.stock and goes
+  # back when the hold is released or swept after expiring.
+  __tablename__ = 'reservations'
+  __table_args__ = (
+    UniqueConstraint('user_id', 'product_id', name='uq_reservation_user_product'),
+    Index('ix_reservations_expires_at', 'expires_at'),
+  )
+
+  id = Column(Integer, primary_key=True)
+  user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+  product_id = Column(Integer, ForeignKey('products.id'), nullable=False)
+  quantity = Column(Integer, nullable=False)
+  expires_at = Column(DateTime, nullable=False)
+
+
+class OutboxEvent(Base, TimestampMixin):
+  __tablename__ = 'outbox_events'
+
+  id = Column(Integer, primary_key=True)
+  topic = Column(String(100), nullable=False)
+  idempotency_key = Column(String(255), unique=True, nullable=False)
+  payload = Column(JSON, nullable=False)
+  # pending -> processing (leased to a worker until available_at) -> done, or
+  # failed once retries run out.
+  status = Column(String(20), default='pending', nullable=False)
+  attempts = Column(Integer, default=0, nullable=False)
+  available_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+  last_error = Column(Text, nullable=True)
+  processed_at = Column(DateTime, nullable=True)
+
+  __table_args__ = (
+    Index(
+      'ix_outbox_events_due',
+      'available_at',
+      'id',
+      postgresql_where=status.in_(('pending', 'processing')),
+      sqlite_where=status.in_(('pending', 'processing')),
+    ),
+  )
+
+
+class SeedRecord(Base):
+  # Content hash of each seed source as last applied, so unchanged seed data
+  # is skipped without reading the rows it produced.
+  __tablename__ = 'seed_records'
+
+  name = Column(String(100), primary_key=True)
+  content_hash = Column(String(64), nullable=False)
+  applied_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class ProductSalesDaily(Base):
+  # Rollups below are maintained by app.analytics from order.created events.
+  __tablename__ = 'product_sales_daily'
+
+  day = Column(Date, primary_key=True)
+  product_id = Column(Integer, ForeignKey('products.id'), primary_key=True)
+  units = Column(Integer, default=0, nullable=False)
+  revenue = Column(Numeric(14, 2), default=0, nullable=False)
+
+
+class SalesDaily(Base):
+  __tablename__ = 'sales_daily'
+
+  day = Column(Date, primary_key=True)
+  orders = Column(Integer, default=0, nullable=False)
+  units = Column(Integer, default=0, nullable=False)
+  revenue = Column(Numeric(14, 2), default=0, nullable=False)
+
+
+class AnalyticsOrder(Base):
+  # Orders already added to the rollups, so redelivered events and rebuilds
+  # never count one twice.
+  __tablename__ = 'analytics_orders'
+
+  order_id = Column(Integer, ForeignKey('orders.id', ondelete='CASCADE'), primary_key=True)
+
+
+class LowStockProduct(Base):
+  # Active products at or below LOW_STOCK_THRESHOLD.
+  __tablename__ = 'low_stock_products'
+  __table_args__ = (Index('ix_low_stock_products_stock', 'stock'),)
+
+  product_id = Column(Integer, ForeignKey('products.id', ondelete='CASCADE'), primary_key=True)
+  stock = Column(Integer, nullable=False)
+  updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
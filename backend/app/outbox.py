@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import logging
+import random
+from collections.abc import Callable, Collection
+from datetime import datetime, timedelta
+from typing import Any, Optional
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.orm import Session
+
+from .core.config import settings
+from .models import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+# Handlers get (session, payload, idempotency_key). Delivery is at least once,
+# so a handler must tolerate seeing the same key again. A topic may have
+# several handlers; they run in registration order and retry together.
+Handler = Callable[[Session, dict, str], None]
+_handlers: dict[str, list[Handler]] = {}
+
+
+def handler(topic: str) -> Callable[[Handler], Handler]:
+  def register(fn: Handler) -> Handler:
+    _handlers.setdefault(topic, []).append(fn)
+    return fn
+
+  return register
+
+
+def enqueue(db: Session, topic: str, key: str, payload: dict[str, Any]) -> None:
+  # Runs in the caller's transaction, so the event exists iff the change does.
+  db.execute(
+    insert(OutboxEvent).values(topic=topic, idempotency_key=f'{topic}:{key}', payload=payload)
+  )
+
+
+def claim_batch(
+  db: Session,
+  size: int,
+  topics: Optional[Collection[str]] = None,
+  exclude_topics: Collection[str] = (),
+  lease_seconds: Optional[float] = None,
+) -> list[tuple[int, str, str, dict, int]]:
+  # Lease due events (pending, or processing with an expired lease after a
+  # worker crash). SKIP LOCKED lets several workers claim disjoint batches.
+  now = datetime.utcnow()
+  filters = []
+  if topics is not None:
+    filters.append(OutboxEvent.topic.in_(topics))
+  if exclude_topics:
+    filters.append(OutboxEvent.topic.not_in(exclude_topics))
+  if lease_seconds is None:
+    lease_seconds = settings.outbox_lease_seconds
+  events = db.execute(
+    select(
+      OutboxEvent.id,
+      OutboxEvent.topic,
+      OutboxEvent.idempotency_key,
+      OutboxEvent.payload,
+      OutboxEvent.attempts,
+    )
+    .where(
+      OutboxEvent.status.in_(('pending', 'processing')),
+      OutboxEvent.available_at <= now,
+      *filters,
+    )
+    .order_by(OutboxEvent.available_at, OutboxEvent.id)
+    .limit(size)
+    .with_for_update(skip_locked=True)
+  ).all()
+  if events:
+    db.execute(
+      update(OutboxEvent)
+      .where(OutboxEvent.id.in_([event.id for event in events]))
+      .values(
+        status='processing',
+        available_at=now + timedelta(seconds=lease_seconds),
+        updated_at=now,
+      )
+    )
+  db.commit()
+  return events
+
+
+def retry_delay(attempts: int) -> float:
+  delay = min(
+    settings.outbox_retry_base_seconds * 2 ** (attempts - 1), settings.outbox_retry_max_seconds
+  )
+  # Jitter spreads retries of events that failed together.
+  return delay * random.uniform(0.5, 1.0)
+
+
+def process_batch(
+  db: Session,
+  size: int,
+  topics: Optional[Collection[str]] = None,
+  exclude_topics: Collection[str] = (),
+  lease_seconds: Optional[float] = None,
+) -> int:
+  # topics / exclude_topics let slow topics be drained by a worker of their
+  # own, on a lease that fits how long their handlers take.
+  events = claim_batch(db, size, topics, exclude_topics, lease_seconds)
+  for event in events:
+    fns = _handlers.get(event.topic)
+    try:
+      if not fns:
+        raise LookupError(f'No outbox handler for {event.topic}')
+      for fn in fns:
+        fn(db, event.payload, event.idempotency_key)
+      # Database side effects commit together with the event's completion.
+      now = datetime.utcnow()
+      db.execute(
+        update(OutboxEvent)
+        .where(OutboxEvent.id == event.id)
+        .values(status='done', processed_at=now, updated_at=now)
+      )
+      db.commit()
+    except Exception as exc:
+      db.rollback()
+      _record_failure(db, event.id, event.attempts + 1, exc)
+  return len(events)
+
+
+def _record_failure(db: Session, event_id: int, attempts: int, exc: Exception) -> None:
+  now = datetime.utcnow()
+  failed = attempts >= settings.outbox_max_attempts
+  logger.warning(
+    'Outbox event %s failed (attempt %s%s): %s',
+    event_id,
+    attempts,
+    ', giving up' if failed else '',
+    exc,
+  )
+  db.execute(
+    update(OutboxEvent)
+    .where(OutboxEvent.id == event_id)
+    .values(
+      status='failed' if failed else 'pending',
+      attempts=attempts,
+      available_at=now + timedelta(seconds=retry_delay(attempts)),
+      last_error=f'{type(exc).__name__}: {exc}'[:2000],
+      updated_at=now,
+    )
+  )
+  db.commit()
+
+
+@handler('order.created')
+def _log_order_created(db: Session, payload: dict, key: str) -> None:
+  logger.info(
+    'Order %s placed by user %s: %s items, total %s',
+    payload['order_id'],
+    payload['user_id'],
+    len(payload['items']),
+    payload['total_price'],
+  )
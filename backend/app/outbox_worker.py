@@ -0,0 +1,105 @@
+"""Drain the transactional outbox and run periodic upkeep (expired holds, low stock).
+
+python -m app.outbox_worker [--once]
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import signal
+import threading
+import time
+
+from . import cache_events
+from .analytics import refresh_low_stock
+from .core.config import settings
+from .database import SessionLocal
+from .images import TOPIC as IMAGE_TOPIC
+from .images import shutdown_image_pool
+from .manage import prepare_database
+from .outbox import process_batch
+from .reservations import sweep_expired
+
+logger = logging.getLogger('app.outbox_worker')
+
+
+def _process_images() -> int:
+  # Renders take seconds, so image events are claimed one at a time on a
+  # lease of their own, away from the events everything else waits on.
+  db = SessionLocal()
+  try:
+    return process_batch(db, 1, topics=[IMAGE_TOPIC], lease_seconds=settings.image_lease_seconds)
+  except Exception:
+    logger.exception('Image event failed')
+    return 0
+  finally:
+    db.close()
+
+
+def _run_images(stopping: threading.Event) -> None:
+  while not stopping.is_set():
+    if not _process_images():
+      stopping.wait(settings.outbox_poll_interval_seconds)
+
+
+def run(once: bool = False) -> None:
+  stopping = threading.Event()
+
+  def stop(*_):
+    stopping.set()
+
+  signal.signal(signal.SIGTERM, stop)
+  signal.signal(signal.SIGINT, stop)
+  prepare_database(with_seed=False)
+  # The sweep and image renders change products the API processes cache.
+  cache_events.start(listen=False)
+  logger.info('Outbox worker started (batch size %s)', settings.outbox_batch_size)
+  images = None
+  if not once:
+    images = threading.Thread(target=_run_images, args=(stopping,), name='image-events')
+    images.start()
+  next_sweep = next_refresh = 0.0
+  while not stopping.is_set():
+    db = SessionLocal()
+    try:
+      if time.monotonic() >= next_sweep:
+        swept = sweep_expired(db)
+        if swept:
+          logger.info('Released %s expired reservations', swept)
+        # A full batch means there may be more to release right away.
+        if swept < settings.reservation_sweep_batch_size:
+          next_sweep = time.monotonic() + settings.reservation_sweep_interval_seconds
+      if time.monotonic() >= next_refresh:
+        # Catches stock changes that bypass checkout (admin edits, holds).
+        refresh_low_stock(db)
+        db.commit()
+        next_refresh = time.monotonic() + settings.low_stock_refresh_interval_seconds
+      processed = process_batch(db, settings.outbox_batch_size, exclude_topics=[IMAGE_TOPIC])
+    except Exception:
+      logger.exception('Outbox batch failed')
+      processed = 0
+    finally:
+      db.close()
+    if once:
+      _process_images()
+      break
+    # Keep draining while there is a backlog; otherwise poll.
+    if processed < settings.outbox_batch_size:
+      stopping.wait(settings.outbox_poll_interval_seconds)
+  if images is not None:
+    images.join()
+  shutdown_image_pool()
+  logger.info('Outbox worker stopped')
+
+
+def main() -> None:
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--once', action='store_true', help='Process one batch and exit.')
+  args = parser.parse_args()
+  logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+  run(once=args.once)
+
+
+if __name__ == '__main__':
+  main()
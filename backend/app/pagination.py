@@ -0,0 +1,24 @@
+from __future__ import annotations
+
+import base64
+from datetime import datetime
+
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+
+class InvalidCursor(ValueError):
+  pass
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+  raw = f'{created_at.isoformat()}|{row_id}'.encode()
+  return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+  try:
+    padded = cursor + '=' * (-len(cursor) % 4)
+    created_at, row_id = base64.urlsafe_b64decode(padded).decode().split('|', 1)
+    return datetime.fromisoformat(created_at), int(row_id)
+  except (ValueError, UnicodeDecodeError) as exc:
+    raise InvalidCursor(cursor) from exc
@@ -0,0 +1,214 @@
+from __future__ import annotations
+
+import contextvars
+import logging
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import Any, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .core.config import settings
+from .database import async_engine, engine
+
+logger = logging.getLogger(__name__)
+
+
+class QueryStats:
+  def __init__(self, keep_statements: bool = False):
+    self.count = 0
+    self.db_seconds = 0.0
+    self.slowest_seconds = 0.0
+    self.slowest_statement: Optional[str] = None
+    self.slowest_parameters: Any = None
+    self.statements: Optional[list[str]] = [] if keep_statements else None
+    self._lock = threading.Lock()
+
+  def record(self, statement: str, parameters: Any, seconds: float, executemany: bool) -> None:
+    # A request's statements may run on several threadpool threads.
+    with self._lock:
+      self.count += 1
+      self.db_seconds += seconds
+      if seconds >= self.slowest_seconds:
+        self.slowest_seconds = seconds
+        self.slowest_statement = statement
+        self.slowest_parameters = None if executemany else parameters
+      if self.statements is not None:
+        self.statements.append(statement)
+
+
+# Stats of the request in flight; threadpool calls inherit the context.
+_current: contextvars.ContextVar[Optional[QueryStats]] = contextvars.ContextVar(
+  'query_stats', default=None
+)
+# Process-wide budgets from `assert_max_queries`, which also see statements
+# run outside the caller's context (e.g. a TestClient's server thread).
+_budgets: list[QueryStats] = []
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+  conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+  seconds = time.perf_counter() - conn.info['query_started'].pop()
+  stats = _current.get()
+  if stats is not None:
+    stats.record(statement, parameters, seconds, executemany)
+  for budget in _budgets:
+    budget.record(statement, parameters, seconds, executemany)
+
+
+def instrument(bind: Engine) -> None:
+  if not event.contains(bind, 'before_cursor_execute', _before_execute):
+    event.listen(bind, 'before_cursor_execute', _before_execute)
+    event.listen(bind, 'after_cursor_execute', _after_execute)
+
+
+instrument(engine)
+if async_engine is not None:
+  instrument(async_engine.sync_engine)
+
+
+@contextmanager
+def track_queries() -> Iterator[QueryStats]:
+  stats = QueryStats()
+  token = _current.set(stats)
+  try:
+    yield stats
+  finally:
+    _current.reset(token)
+
+
+@contextmanager
+def assert_max_queries(limit: int) -> Iterator[QueryStats]:
+  # Fails when the block runs more than `limit` statements, e.g.
+  #   with assert_max_queries(3):
+  #     client.get('/api/cart', headers=auth)
+  stats = QueryStats(keep_statements=True)
+  _budgets.append(stats)
+  try:
+    yield stats
+  finally:
+    _budgets.remove(stats)
+  if stats.count > limit:
+    statements = '\n'.join(f'  {statement}' for statement in stats.statements)
+    raise AssertionError(f'{stats.count} queries, budget is {limit}:\n{statements}')
+
+
+def _explain_sql(statement: str, dialect: str) -> str:
+  return f'EXPLAIN QUERY PLAN {statement}' if dialect == 'sqlite' else f'EXPLAIN {statement}'
+
+
+def _plan_text(rows) -> str:
+  return '\n'.join(str(row[-1]) for row in rows)
+
+
+def _explain_sync(statement: str, parameters: Any) -> str:
+  with engine.connect() as conn:
+    return _plan_text(
+      conn.exec_driver_sql(_explain_sql(statement, engine.dialect.name), parameters)
+    )
+
+
+async def explain(statement: str, parameters: Any) -> str:
+  # Plain EXPLAIN only plans the statement, so writes are not repeated.
+  if async_engine is not None:
+    async with async_engine.connect() as conn:
+      result = await conn.exec_driver_sql(
+        _explain_sql(statement, async_engine.dialect.name), parameters
+      )
+      return _plan_text(result.all())
+  return await run_in_threadpool(_explain_sync, statement, parameters)
+
+
+def server_timing(stats: QueryStats, elapsed: float) -> str:
+  return (
+    f'app;dur={elapsed * 1000:.1f}, '
+    f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.count} queries"'
+  )
+
+
+class QueryStatsMiddleware:
+  # Counts the SQL each request runs, reports it in a Server-Timing header and
+  # logs it; requests slower than SLOW_REQUEST_MS are logged with the plan of
+  # their slowest statement, explaining at most one per interval so a burst
+  # of slow requests does not add a burst of EXPLAINs on the primary.
+  def __init__(self, app: ASGIApp):
+    self.app = app
+    self._next_explain = 0.0
+
+  async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+    if scope['type'] != 'http':
+      await self.app(scope, receive, send)
+      return
+    started = time.perf_counter()
+    status_code = 500
+
+    async def send_with_timing(message: Message) -> None:
+      nonlocal status_code
+      if message['type'] == 'http.response.start':
+        status_code = message['status']
+        headers = MutableHeaders(scope=message)
+        headers.append('Server-Timing', server_timing(stats, time.perf_counter() - started))
+      await send(message)
+
+    try:
+      with track_queries() as stats:
+        await self.app(scope, receive, send_with_timing)
+    finally:
+      # Outside the tracked block, so EXPLAIN is not counted as the request's.
+      await self._log(scope, status_code, stats, time.perf_counter() - started)
+
+  async def _log(self, scope: Scope, status_code: int, stats: QueryStats, elapsed: float) -> None:
+    record = {
+      'method': scope['method'],
+      'path': scope['path'],
+      'status': status_code,
+      'duration_ms': round(elapsed * 1000, 1),
+      'queries': stats.count,
+      'db_ms': round(stats.db_seconds * 1000, 1),
+      'slowest_query_ms': round(stats.slowest_seconds * 1000, 1),
+    }
+    slow_ms = settings.slow_request_ms
+    if not slow_ms or record['duration_ms'] < slow_ms:
+      logger.debug(
+        '%s %s %s in %sms, %s queries in %sms',
+        record['method'],
+        record['path'],
+        status_code,
+        record['duration_ms'],
+        stats.count,
+        record['db_ms'],
+        extra={'request_stats': record},
+      )
+      return
+    record['slowest_query'] = stats.slowest_statement
+    plan = None
+    now = time.monotonic()
+    if settings.slow_request_explain and stats.slowest_statement and now >= self._next_explain:
+      self._next_explain = now + settings.slow_request_explain_interval_seconds
+      try:
+        plan = await explain(stats.slowest_statement, stats.slowest_parameters)
+      except Exception as exc:  # noqa: BLE001 - the plan is best effort
+        plan = f'EXPLAIN failed: {exc}'
+    record['plan'] = plan
+    logger.warning(
+      'Slow request %s %s %s in %sms, %s queries in %sms; slowest (%sms): %s%s',
+      record['method'],
+      record['path'],
+      status_code,
+      record['duration_ms'],
+      stats.count,
+      record['db_ms'],
+      record['slowest_query_ms'],
+      stats.slowest_statement,
+      f'\n{plan}' if plan else '',
+      extra={'request_stats': record},
+    )
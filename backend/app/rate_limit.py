@@ -0,0 +1,256 @@
+from __future__ import annotations
+
+import ipaddress
+import json
+import logging
+import math
+import threading
+import time
+from collections.abc import Callable
+from typing import Any, Optional
+
+from fastapi import Depends, HTTPException, Request, status
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from .core.config import settings
+from .deps import get_current_active_user, get_locale
+from .i18n import negotiate_locale, translate
+from .metrics import registry
+from .models import User
+
+logger = logging.getLogger(__name__)
+
+RATE_UNITS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+PURGE_EVERY_TAKES = 4096
+
+_rejected = registry.counter('rate_limited_total', 'Requests rejected by rate limits.', ('limit',))
+
+
+class Limit:
+  # A token bucket: `capacity` requests at once, refilled evenly over the
+  # period, from specs like "10/minute".
+  def __init__(self, name: str, spec: str):
+    count, _, unit = spec.partition('/')
+    if unit.strip() not in RATE_UNITS or float(count) <= 0:
+      raise ValueError(f'Invalid rate limit for {name}: {spec!r}')
+    self.name = name
+    self.capacity = float(count)
+    self.per_second = self.capacity / RATE_UNITS[unit.strip()]
+    self.rejected = _rejected.labels(name)
+
+
+class _Shard:
+  __slots__ = ('lock', 'buckets', 'takes')
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    # key -> (tokens, updated at, full again at)
+    self.buckets: dict[str, tuple[float, float, float]] = {}
+    self.takes = 0
+
+
+class MemoryBuckets:
+  # Buckets spread over independently locked shards, so concurrent requests
+  # for different clients rarely wait on each other. Per process: each
+  # uvicorn worker enforces the limits on its own.
+  def __init__(self, shards: int, clock: Callable[[], float] = time.monotonic):
+    self._shards = [_Shard() for _ in range(max(shards, 1))]
+    self._clock = clock
+
+  async def take(self, key: str, limit: Limit) -> float:
+    # Seconds until a token is available; 0 means this request may proceed.
+    shard = self._shards[hash(key) % len(self._shards)]
+    now = self._clock()
+    with shard.lock:
+      bucket = shard.buckets.get(key)
+      if bucket is None:
+        tokens = limit.capacity
+      else:
+        tokens = min(limit.capacity, bucket[0] + (now - bucket[1]) * limit.per_second)
+      wait = 0.0
+      if tokens >= 1:
+        tokens -= 1
+      else:
+        wait = (1 - tokens) / limit.per_second
+      shard.buckets[key] = (tokens, now, now + (limit.capacity - tokens) / limit.per_second)
+      shard.takes += 1
+      if shard.takes % PURGE_EVERY_TAKES == 0:
+        # A full bucket is the same as no bucket, so idle clients are dropped.
+        for stale in [k for k, (_, _, full_at) in shard.buckets.items() if full_at <= now]:
+          del shard.buckets[stale]
+    return wait
+
+
+# Refill and take in one round trip, on Redis' clock so that all workers agree.
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local per_second = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = capacity
+if bucket[1] then
+  local elapsed = math.max(0, now - tonumber(bucket[2]))
+  tokens = math.min(capacity, tonumber(bucket[1]) + elapsed * per_second)
+end
+local wait = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+else
+  wait = (1 - tokens) / per_second
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil((capacity - tokens) / per_second * 1000) + 1000)
+return tostring(wait)
+"""
+
+
+class RedisBuckets:
+  # Buckets shared by every worker. If Redis is unreachable requests are let
+  # through rather than failing with it.
+  def __init__(self, client: Any):
+    self._script = client.register_script(TOKEN_BUCKET_SCRIPT)
+
+  async def take(self, key: str, limit: Limit) -> float:
+    try:
+      wait = await self._script(keys=[f'ratelimit:{key}'], args=[limit.capacity, limit.per_second])
+    except Exception:  # noqa: BLE001 - fail open
+      logger.warning('Rate limit backend unavailable, allowing request', exc_info=True)
+      return 0.0
+    return float(wait)
+
+
+def _create_buckets():
+  if settings.rate_limit_redis_url:
+    import redis.asyncio
+
+    return RedisBuckets(redis.asyncio.Redis.from_url(settings.rate_limit_redis_url))
+  return MemoryBuckets(settings.rate_limit_shards)
+
+
+buckets = _create_buckets()
+
+default_limit = Limit('default', settings.rate_limit_default)
+login_limit = Limit('login', settings.rate_limit_login)
+register_limit = Limit('register', settings.rate_limit_register)
+checkout_limit = Limit('checkout', settings.rate_limit_checkout)
+
+
+_trusted_proxies = [
+  ipaddress.ip_network(network, strict=False) for network in settings.trusted_proxies
+]
+
+
+def _is_trusted_proxy(address: str) -> bool:
+  try:
+    ip = ipaddress.ip_address(address)
+  except ValueError:
+    return False
+  return any(ip in network for network in _trusted_proxies)
+
+
+def client_ip(scope: Scope) -> str:
+  # The address TRUSTED_PROXY_HOPS proxies in front of us saw, e.g. the one
+  # nginx appends to X-Forwarded-For. Entries further left are whatever the
+  # client sent and cannot be trusted, and so is the whole header unless it
+  # came from a TRUSTED_PROXIES address rather than straight from a client.
+  client = scope.get('client')
+  peer = client[0] if client else 'unknown'
+  hops = settings.trusted_proxy_hops
+  if hops > 0 and _is_trusted_proxy(peer):
+    forwarded = Headers(scope=scope).get('x-forwarded-for')
+    if forwarded:
+      addresses = [address.strip() for address in forwarded.split(',') if address.strip()]
+      if addresses:
+        return addresses[-min(hops, len(addresses))]
+  return peer
+
+
+async def check(limit: Limit, subject: str) -> float:
+  if not settings.rate_limit_enabled:
+    return 0.0
+  wait = await buckets.take(f'{limit.name}:{subject}', limit)
+  if wait:
+    limit.rejected.inc()
+  return wait
+
+
+def retry_after(wait: float) -> str:
+  return str(max(1, math.ceil(wait)))
+
+
+async def _enforce(limit: Limit, subject: str, lang: str) -> None:
+  wait = await check(limit, subject)
+  if wait:
+    raise HTTPException(
+      status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+      detail=translate('errors.rate_limited', lang),
+      headers={'Retry-After': retry_after(wait)},
+    )
+
+
+def limit_by_ip(limit: Limit):
+  async def dependency(request: Request, lang: str = Depends(get_locale)) -> None:
+    await _enforce(limit, f'ip:{client_ip(request.scope)}', lang)
+
+  return dependency
+
+
+def limit_by_user(limit: Limit):
+  async def dependency(
+    current_user: User = Depends(get_current_active_user), lang: str = Depends(get_locale)
+  ) -> None:
+    await _enforce(limit, f'user:{current_user.id}', lang)
+
+  return dependency
+
+
+login_rate_limit = limit_by_ip(login_limit)
+register_rate_limit = limit_by_ip(register_limit)
+checkout_rate_limit = limit_by_user(checkout_limit)
+
+_rejection_bodies: dict[str, bytes] = {}
+
+
+def _rejection_body(lang: str) -> bytes:
+  body = _rejection_bodies.get(lang)
+  if body is None:
+    body = _rejection_bodies[lang] = json.dumps(
+      {'detail': translate('errors.rate_limited', lang)}, ensure_ascii=False
+    ).encode()
+  return body
+
+
+class RateLimitMiddleware:
+  # Per-client ceiling on all requests, checked before routing so a flood is
+  # turned away without touching the threadpool or the database.
+  def __init__(self, app: ASGIApp):
+    self.app = app
+
+  async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+    if scope['type'] != 'http':
+      await self.app(scope, receive, send)
+      return
+    wait = await check(default_limit, f'ip:{client_ip(scope)}')
+    if not wait:
+      await self.app(scope, receive, send)
+      return
+    lang: Optional[str] = None
+    for name, value in scope['headers']:
+      if name == b'accept-language':
+        lang = value.decode('latin-1')
+        break
+    body = _rejection_body(negotiate_locale(lang))
+    await send(
+      {
+        'type': 'http.response.start',
+        'status': status.HTTP_429_TOO_MANY_REQUESTS,
+        'headers': [
+          (b'content-type', b'application/json'),
+          (b'content-length', str(len(body)).encode()),
+          (b'retry-after', retry_after(wait).encode()),
+        ],
+      }
+    )
+    await send({'type': 'http.response.body', 'body': body})
@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import itertools
+import logging
+import threading
+import time
+from collections.abc import AsyncIterator, Iterator
+from typing import Optional
+
+from fastapi import Request
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .core.config import settings
+from .database import AsyncSessionLocal, DbSession, SessionLocal, get_db, to_async_url
+from .db_pool import engine_options
+
+logger = logging.getLogger(__name__)
+
+# Set after a successful write so that client's reads go to the primary until
+# replicas have caught up.
+PIN_COOKIE = 'read_primary'
+SAFE_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS'))
+
+
+class Replica:
+  def __init__(self, name: str, url: str):
+    self.name = name
+    self.engine = create_engine(url, **engine_options(url, name))
+    self.async_engine: Optional[AsyncEngine] = None
+    if settings.async_database:
+      async_url = to_async_url(url)
+      self.async_engine = create_async_engine(
+        async_url, **engine_options(async_url, f'{name}_async', is_async=True)
+      )
+    self.healthy = True
+    self.retry_at = 0.0
+    for bind in (self.engine, self.async_engine.sync_engine if self.async_engine else None):
+      if bind is not None:
+        event.listen(bind, 'handle_error', self._on_error)
+
+  def _on_error(self, context) -> None:
+    # Connection failures take the replica out of rotation; statement errors
+    # are the handler's business.
+    if context.is_disconnect or context.connection is None:
+      self.mark_down()
+
+  def mark_down(self) -> None:
+    if self.healthy:
+      logger.warning('Replica %s is unavailable, reading from the others', self.name)
+    self.healthy = False
+    self.retry_at = time.monotonic() + settings.replica_retry_seconds
+
+  def probe(self) -> None:
+    try:
+      with self.engine.connect() as connection:
+        connection.exec_driver_sql('SELECT 1')
+    except Exception:  # noqa: BLE001 - any failure keeps it out of rotation
+      self.mark_down()
+      return
+    logger.info('Replica %s is back in rotation', self.name)
+    self.healthy = True
+
+
+class ReplicaSet:
+  def __init__(self, urls: list[str]):
+    self.replicas = [Replica(f'replica_{index}', url) for index, url in enumerate(urls, 1)]
+    self._turn = itertools.count()
+    self._probe_lock = threading.Lock()
+
+  def due_for_probe(self) -> bool:
+    now = time.monotonic()
+    return any(not replica.healthy and replica.retry_at <= now for replica in self.replicas)
+
+  def probe_due(self) -> None:
+    # Blocking; called from the threadpool. The lock keeps concurrent
+    # requests from probing the same replica at once.
+    if not self._probe_lock.acquire(blocking=False):
+      return
+    try:
+      now = time.monotonic()
+      for replica in self.replicas:
+        if not replica.healthy and replica.retry_at <= now:
+          replica.probe()
+    finally:
+      self._probe_lock.release()
+
+  def choose(self) -> Optional[Replica]:
+    # Round robin over healthy replicas; None sends the read to the primary.
+    count = len(self.replicas)
+    start = next(self._turn)
+    for offset in range(count):
+      replica = self.replicas[(start + offset) % count]
+      if replica.healthy:
+        return replica
+    return None
+
+
+replicas = ReplicaSet(settings.database_replica_urls) if settings.database_replica_urls else None
+
+
+def _replica_for(request: Request) -> Optional[Replica]:
+  if PIN_COOKIE in request.cookies:
+    return None
+  return replicas.choose()
+
+
+def reads_replica(db: DbSession) -> bool:
+  # Replica rows may lag the primary, so they must not fill shared caches.
+  return 'replica' in db.info
+
+
+def _get_sync_read_db(request: Request) -> Iterator:
+  # Sync dependencies run in the threadpool, so probing here is fine.
+  if replicas.due_for_probe():
+    replicas.probe_due()
+  replica = _replica_for(request)
+  db = SessionLocal(bind=replica.engine) if replica else SessionLocal()
+  if replica:
+    db.info['replica'] = replica.name
+  try:
+    yield db
+  finally:
+    db.close()
+
+
+async def _get_async_read_db(request: Request) -> AsyncIterator:
+  if replicas.due_for_probe():
+    await run_in_threadpool(replicas.probe_due)
+  replica = _replica_for(request)
+  bind = {'bind': replica.async_engine} if replica else {}
+  async with AsyncSessionLocal(**bind) as db:
+    if replica:
+      db.info['replica'] = replica.name
+    yield db
+
+
+# For handlers that only read and can tolerate replication lag. Without
+# replicas this is `get_db` itself.
+if replicas is None:
+  get_read_db = get_db
+elif settings.async_database:
+  get_read_db = _get_async_read_db
+else:
+  get_read_db = _get_sync_read_db
+
+
+class PrimaryPinMiddleware:
+  # Pins a client's reads to the primary for READ_YOUR_WRITES_SECONDS after
+  # any successful write, e.g. so order history right after checkout
+  # includes the new order.
+  def __init__(self, app: ASGIApp):
+    self.app = app
+
+  async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+    if scope['type'] != 'http' or scope['method'] in SAFE_METHODS:
+      await self.app(scope, receive, send)
+      return
+
+    async def send_with_pin(message: Message) -> None:
+      if message['type'] == 'http.response.start' and message['status'] < 400:
+        MutableHeaders(scope=message).append(
+          'Set-Cookie',
+          f'{PIN_COOKIE}=1; Max-Age={settings.read_your_writes_seconds}; Path=/; '
+          'HttpOnly; SameSite=Lax',
+        )
+      await send(message)
+
+    await self.app(scope, receive, send_with_pin)
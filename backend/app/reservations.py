@@ -0,0 +1,314 @@
+from __future__ import annotations
+
+import asyncio
+from collections import defaultdict
+from collections.abc import Iterable
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import case, delete, select, tuple_, update
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from . import schemas
+from .cache import product_cache
+from .core.config import settings
+from .database import SessionLocal, upsert_insert
+from .models import Product, Reservation
+
+
+class ReservationError(Exception):
+  def __init__(self, reason: str):
+    super().__init__(reason)
+    self.reason = reason
+
+
+def lock_products(db: Session, product_ids: Iterable[int]) -> None:
+  # Every path that touches both products and holds locks the products first,
+  # in id order, so none of them can deadlock with another.
+  db.execute(
+    select(Product.id)
+    .where(Product.id.in_(list(product_ids)))
+    .order_by(Product.id)
+    .with_for_update()
+  )
+
+
+def adjust_stock(
+  db: Session, changes: dict[int, int], locked: bool = False
+) -> Optional[dict[int, bool]]:
+  # Apply per-product stock changes (negative takes stock) in one conditional
+  # UPDATE, locking the rows in id order first unless the caller already has.
+  # Returns whether each product's stock reached or left zero; None means
+  # some product lacked stock, and the caller rolls back.
+  if not changes:
+    return {}
+  if not locked:
+    lock_products(db, changes)
+  change = case(changes, value=Product.id)
+  rows = db.execute(
+    update(Product)
+    .where(Product.id.in_(changes), Product.stock + change >= 0)
+    .values(stock=Product.stock + change)
+    .returning(Product.id, Product.stock)
+    .execution_options(synchronize_session=False)
+  ).all()
+  if len(rows) != len(changes):
+    return None
+  return {id: (stock > 0) != (stock - changes[id] > 0) for id, stock in rows}
+
+
+def invalidate_stock(moved: dict[int, bool]) -> None:
+  # After commit. Listing pages only need to go when a product sold out or
+  # came back; otherwise only the products' own entries are stale.
+  if moved:
+    product_cache.invalidate_product(*moved, listed=any(moved.values()))
+
+
+def list_holds(db: Session, user_id: int) -> list[schemas.ReservationOut]:
+  rows = db.execute(
+    select(Reservation.product_id, Reservation.quantity, Reservation.expires_at)
+    .where(Reservation.user_id == user_id, Reservation.expires_at > datetime.utcnow())
+    .order_by(Reservation.product_id)
+  ).all()
+  return [schemas.ReservationOut.model_validate(row) for row in rows]
+
+
+def place_holds(
+  db: Session, requests: list[tuple[int, int, int]]
+) -> tuple[list[schemas.ReservationOut | ReservationError], dict[int, bool]]:
+  # Sets a batch of (user, product, quantity) holds in the caller's
+  # transaction: each hold becomes that quantity, taking or returning only
+  # the difference, and each product row is updated once. Growth is granted
+  # in request order while stock lasts. A live hold keeps its expiry when it
+  # changes, so holding again cannot keep stock tied up past the TTL. Also
+  # returns the stock moves, as adjust_stock does.
+  stock = dict(
+    db.execute(
+      select(Product.id, Product.stock)
+      .where(
+        Product.id.in_({product_id for _, product_id, _ in requests}),
+        Product.is_active.is_(True),
+      )
+      .order_by(Product.id)
+      .with_for_update()
+    ).all()
+  )
+  initial = dict(stock)
+  wanted: dict[int, int] = defaultdict(int)
+  for _, product_id, quantity in requests:
+    wanted[product_id] += quantity
+  short = [product_id for product_id in stock if wanted[product_id] > stock[product_id]]
+  if short:
+    # Stock may only be tied up in expired holds nobody has swept yet.
+    for product_id, quantity in _sweep(db, short)[1].items():
+      stock[product_id] += quantity
+  keys = sorted({(user_id, product_id) for user_id, product_id, _ in requests})
+  held = {
+    (row.user_id, row.product_id): (row.quantity, row.expires_at)
+    for row in db.execute(
+      select(
+        Reservation.user_id, Reservation.product_id, Reservation.quantity, Reservation.expires_at
+      )
+      .where(tuple_(Reservation.user_id, Reservation.product_id).in_(keys))
+      .order_by(Reservation.user_id, Reservation.product_id)
+      .with_for_update()
+    )
+  }
+  now = datetime.utcnow()
+  expires_at = now + timedelta(seconds=settings.reservation_ttl_seconds)
+  taken: dict[int, int] = defaultdict(int)
+  changed: set[tuple[int, int]] = set()
+  decisions: list[tuple[int, int] | ReservationError] = []
+  for user_id, product_id, quantity in requests:
+    key = (user_id, product_id)
+    current, expiry = held.get(key, (0, None))
+    if product_id not in stock:
+      decisions.append(ReservationError('product_not_found'))
+    elif quantity - current > stock[product_id]:
+      decisions.append(ReservationError('insufficient_stock'))
+    else:
+      stock[product_id] -= quantity - current
+      taken[product_id] -= quantity - current
+      held[key] = (quantity, expiry if expiry is not None and expiry > now else expires_at)
+      changed.add(key)
+      decisions.append(key)
+  moved = {
+    product_id: (initial[product_id] > 0) != (stock[product_id] > 0)
+    for product_id in stock
+    if stock[product_id] != initial[product_id]
+  }
+  if not changed:
+    return decisions, moved
+  taken = {product_id: change for product_id, change in taken.items() if change}
+  if taken:
+    db.execute(
+      update(Product)
+      .where(Product.id.in_(taken))
+      .values(stock=Product.stock + case(taken, value=Product.id))
+      .execution_options(synchronize_session=False)
+    )
+  insert = upsert_insert(db)(Reservation).values(
+    [
+      {
+        'user_id': user_id,
+        'product_id': product_id,
+        'quantity': held[user_id, product_id][0],
+        'expires_at': held[user_id, product_id][1],
+        'created_at': now,
+        'updated_at': now,
+      }
+      for user_id, product_id in sorted(changed)
+    ]
+  )
+  db.execute(
+    insert.on_conflict_do_update(
+      index_elements=[Reservation.user_id, Reservation.product_id],
+      set_={
+        'quantity': insert.excluded.quantity,
+        'expires_at': insert.excluded.expires_at,
+        'updated_at': insert.excluded.updated_at,
+      },
+    )
+  )
+  outcomes = [
+    decision
+    if isinstance(decision, ReservationError)
+    else schemas.ReservationOut(
+      product_id=decision[1], quantity=held[decision][0], expires_at=held[decision][1]
+    )
+    for decision in decisions
+  ]
+  return outcomes, moved
+
+
+def _place_batch(
+  requests: list[tuple[int, int, int]],
+) -> list[schemas.ReservationOut | ReservationError]:
+  with SessionLocal() as db:
+    outcomes, moved = place_holds(db, requests)
+    db.commit()
+  invalidate_stock(moved)
+  return outcomes
+
+
+class HoldQueue:
+  # Holds that arrive while a batch is being placed wait for the next one, so
+  # a hot product's row is locked once per batch rather than once per
+  # shopper, and an idle queue places a hold straight away. Per process; a
+  # hold whose request is cancelled is still placed and simply expires.
+  def __init__(self, max_batch: int):
+    self._max_batch = max_batch
+    self._pending: list[tuple[tuple[int, int, int], asyncio.Future]] = []
+    self._flusher: Optional[asyncio.Task] = None
+
+  async def place(self, user_id: int, product_id: int, quantity: int) -> schemas.ReservationOut:
+    future = asyncio.get_running_loop().create_future()
+    self._pending.append(((user_id, product_id, quantity), future))
+    if self._flusher is None:
+      self._flusher = asyncio.create_task(self._flush())
+    outcome = await future
+    if isinstance(outcome, ReservationError):
+      raise outcome
+    return outcome
+
+  async def _flush(self) -> None:
+    try:
+      while self._pending:
+        batch = self._pending[: self._max_batch]
+        del self._pending[: self._max_batch]
+        try:
+          outcomes = await run_in_threadpool(_place_batch, [request for request, _ in batch])
+        except Exception as exc:  # noqa: BLE001 - every waiter fails with the batch
+          for _, future in batch:
+            if not future.done():
+              future.set_exception(exc)
+          continue
+        for (_, future), outcome in zip(batch, outcomes, strict=True):
+          if not future.done():
+            future.set_result(outcome)
+    finally:
+      self._flusher = None
+
+
+hold_queue = HoldQueue(settings.reservation_batch_size)
+
+
+def trim_hold(db: Session, user_id: int, product_id: int, limit: int) -> Optional[int]:
+  # Shrinks the user's hold on a product to at most `limit` (0 releases it),
+  # for when the cart line it covers shrinks or goes. Returns the quantity
+  # put back, or None when there is no hold. Commits.
+  hold = Reservation.user_id == user_id, Reservation.product_id == product_id
+  quantity = db.scalar(select(Reservation.quantity).where(*hold))
+  if quantity is None or quantity <= limit:
+    db.rollback()
+    return None if quantity is None else 0
+  lock_products(db, [product_id])
+  quantity = db.scalar(select(Reservation.quantity).where(*hold).with_for_update())
+  if quantity is None or quantity <= limit:
+    db.rollback()
+    return None if quantity is None else 0
+  if limit:
+    db.execute(
+      update(Reservation).where(*hold).values(quantity=limit, updated_at=datetime.utcnow())
+    )
+  else:
+    db.execute(delete(Reservation).where(*hold))
+  moved = adjust_stock(db, {product_id: quantity - limit}, locked=True)
+  db.commit()
+  invalidate_stock(moved)
+  return quantity - limit
+
+
+def release_hold(db: Session, user_id: int, product_id: int) -> Optional[int]:
+  return trim_hold(db, user_id, product_id, 0)
+
+
+def consume_holds(db: Session, user_id: int, product_ids: Iterable[int]) -> dict[int, int]:
+  # Checkout takes the user's holds in its own transaction, expired or not:
+  # until swept, a hold's quantity is still out of stock. Deleting the rows
+  # settles any race with the sweeper, since only one of them gets each row.
+  # The products are locked first, so the caller's adjust_stock need not.
+  product_ids = list(product_ids)
+  lock_products(db, product_ids)
+  rows = db.execute(
+    delete(Reservation)
+    .where(Reservation.user_id == user_id, Reservation.product_id.in_(product_ids))
+    .returning(Reservation.product_id, Reservation.quantity)
+  ).all()
+  return dict(rows)
+
+
+def _sweep(
+  db: Session, product_ids: Optional[list[int]] = None
+) -> tuple[int, dict[int, int], dict[int, bool]]:
+  # Delete a batch of expired holds and put their quantities back with one
+  # UPDATE, in the caller's transaction. Returns the number of holds, the
+  # stock returned per product and the stock moves, as adjust_stock does.
+  now = datetime.utcnow()
+  expired = select(Reservation.id, Reservation.product_id).where(Reservation.expires_at <= now)
+  if product_ids:
+    expired = expired.where(Reservation.product_id.in_(product_ids))
+  batch = db.execute(
+    expired.order_by(Reservation.id).limit(settings.reservation_sweep_batch_size)
+  ).all()
+  if not batch:
+    return 0, {}, {}
+  lock_products(db, {product_id for _, product_id in batch})
+  # Checked again under the locks: a hold may have been renewed or consumed.
+  rows = db.execute(
+    delete(Reservation)
+    .where(Reservation.id.in_([id for id, _ in batch]), Reservation.expires_at <= now)
+    .returning(Reservation.product_id, Reservation.quantity)
+  ).all()
+  restock: dict[int, int] = defaultdict(int)
+  for product_id, quantity in rows:
+    restock[product_id] += quantity
+  return len(rows), restock, adjust_stock(db, restock, locked=True)
+
+
+def sweep_expired(db: Session) -> int:
+  swept, _, moved = _sweep(db)
+  db.commit()
+  invalidate_stock(moved)
+  return swept
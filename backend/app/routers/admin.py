@@ -1,61 +1,183 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import tempfile
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, UploadFile, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
 from .. import schemas
-from ..database import get_db
+from ..bulk import encode_csv, encode_ndjson, export_batch, import_products
+from ..cache import product_cache
+from ..core.config import settings
+from ..database import DbSession, get_db, run_db, session_scope
 from ..deps import get_current_admin_user, get_locale
 from ..i18n import translate
+from ..images import InvalidImage, request_variants, store_original
 from ..models import Product, User
+from ..search import SEARCHABLE_FIELDS
 
 router = APIRouter(prefix='/api/admin/products', tags=['admin'])
 
 
-@router.post('', response_model=schemas.ProductOut, status_code=status.HTTP_201_CREATED)
-def create_product(
-  payload: schemas.ProductCreate,
-  _: User = Depends(get_current_admin_user),
-  db: Session = Depends(get_db),
-):
+def _create_product(db: Session, payload: schemas.ProductCreate) -> schemas.ProductOut:
   product = Product(**payload.dict())
   db.add(product)
   db.commit()
   db.refresh(product)
+  return schemas.ProductOut.model_validate(product)
+
+
+def _update_product(db: Session, product_id: int, changes: dict) -> Optional[schemas.ProductOut]:
+  product = db.query(Product).filter(Product.id == product_id).first()
+  if not product:
+    return None
+  for key, value in changes.items():
+    setattr(product, key, value)
+  db.commit()
+  db.refresh(product)
+  return schemas.ProductOut.model_validate(product)
+
+
+def _product_exists(db: Session, product_id: int) -> bool:
+  return db.query(Product.id).filter(Product.id == product_id).first() is not None
+
+
+def _toggle_product_active(db: Session, product_id: int) -> Optional[schemas.ProductOut]:
+  product = db.query(Product).filter(Product.id == product_id).first()
+  if not product:
+    return None
+  product.is_active = not product.is_active
+  db.commit()
+  db.refresh(product)
+  return schemas.ProductOut.model_validate(product)
+
+
+@router.post('', response_model=schemas.ProductOut, status_code=status.HTTP_201_CREATED)
+async def create_product(
+  payload: schemas.ProductCreate,
+  _: User = Depends(get_current_admin_user),
+  db: DbSession = Depends(get_db),
+):
+  product = await run_db(db, _create_product, payload)
+  product_cache.invalidate_product(product.id, searchable=True)
   return product
 
 
+@router.post('/bulk', response_model=schemas.BulkImportResult)
+async def bulk_import_products(
+  request: Request,
+  batch_size: int = Query(default=settings.bulk_import_batch_size, ge=1, le=10000),
+  _: User = Depends(get_current_admin_user),
+  db: DbSession = Depends(get_db),
+):
+  content_type = request.headers.get('content-type', '')
+  fmt = 'csv' if 'csv' in content_type else 'ndjson'
+  # Spool the upload (in memory up to a limit, then on disk) so parsing and the
+  # batched upserts can run in one session call without holding it in memory.
+  with tempfile.SpooledTemporaryFile(max_size=settings.bulk_import_spool_bytes) as spool:
+    async for chunk in request.stream():
+      spool.write(chunk)
+    spool.seek(0)
+    result = await run_db(db, import_products, spool, fmt, batch_size)
+  product_cache.invalidate_all()
+  return result
+
+
+@router.get('/export')
+async def export_products(
+  format: Literal['ndjson', 'csv'] = 'ndjson',
+  _: User = Depends(get_current_admin_user),
+):
+  batch_size = settings.bulk_import_batch_size
+
+  async def rows():
+    async with session_scope() as db:
+      after_id = 0
+      first = True
+      while True:
+        batch = await run_db(db, export_batch, after_id, batch_size)
+        if format == 'csv':
+          yield encode_csv(batch, header=first)
+        elif batch:
+          yield encode_ndjson(batch)
+        if len(batch) < batch_size:
+          return
+        after_id = batch[-1][0]
+        first = False
+
+  media_type = 'text/csv' if format == 'csv' else 'application/x-ndjson'
+  return StreamingResponse(
+    rows(),
+    media_type=media_type,
+    headers={'Content-Disposition': f'attachment; filename="products.{format}"'},
+  )
+
+
 @router.put('/{product_id}', response_model=schemas.ProductOut)
-def update_product(
+async def update_product(
   product_id: int,
   payload: schemas.ProductUpdate,
   _: User = Depends(get_current_admin_user),
-  db: Session = Depends(get_db),
+  db: DbSession = Depends(get_db),
   lang: str = Depends(get_locale),
 ):
-  product = db.query(Product).filter(Product.id == product_id).first()
+  changes = payload.dict(exclude_unset=True)
+  product = await run_db(db, _update_product, product_id, changes)
   if not product:
     raise HTTPException(
       status_code=status.HTTP_404_NOT_FOUND, detail=translate('errors.product_not_found', lang)
     )
-  for key, value in payload.dict(exclude_unset=True).items():
-    setattr(product, key, value)
-  db.commit()
-  db.refresh(product)
+  product_cache.invalidate_product(product.id, searchable=bool(SEARCHABLE_FIELDS & changes.keys()))
   return product
 
 
 @router.patch('/{product_id}/toggle-active', response_model=schemas.ProductOut)
-def toggle_product_active(
+async def toggle_product_active(
   product_id: int,
   _: User = Depends(get_current_admin_user),
-  db: Session = Depends(get_db),
+  db: DbSession = Depends(get_db),
   lang: str = Depends(get_locale),
 ):
-  product = db.query(Product).filter(Product.id == product_id).first()
+  product = await run_db(db, _toggle_product_active, product_id)
   if not product:
     raise HTTPException(
       status_code=status.HTTP_404_NOT_FOUND, detail=translate('errors.product_not_found', lang)
     )
-  product.is_active = not product.is_active
-  db.commit()
-  db.refresh(product)
+  product_cache.invalidate_product(product.id, searchable=True)
   return product
+
+
+@router.put(
+  '/{product_id}/image',
+  response_model=schemas.ProductImageUpload,
+  status_code=status.HTTP_202_ACCEPTED,
+)
+async def upload_product_image(
+  product_id: int,
+  file: UploadFile = File(...),
+  _: User = Depends(get_current_admin_user),
+  db: DbSession = Depends(get_db),
+  lang: str = Depends(get_locale),
+):
+  # Stores the original and queues its variants for the outbox worker, so no
+  # image decoding happens in the API process.
+  if file.size is not None and file.size > settings.image_max_upload_bytes:
+    raise HTTPException(
+      status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+      detail=translate('errors.image_too_large', lang),
+    )
+  if not await run_db(db, _product_exists, product_id):
+    raise HTTPException(
+      status_code=status.HTTP_404_NOT_FOUND, detail=translate('errors.product_not_found', lang)
+    )
+  try:
+    image_key, original = await run_in_threadpool(store_original, product_id, file.file)
+  except InvalidImage as exc:
+    code = (
+      status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+      if exc.reason == 'image_too_large'
+      else status.HTTP_400_BAD_REQUEST
+    )
+    raise HTTPException(status_code=code, detail=translate(f'errors.{exc.reason}', lang)) from exc
+  return await run_db(db, request_variants, product_id, image_key, original)
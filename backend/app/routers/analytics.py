@@ -0,0 +1,44 @@
+from typing import Literal
+
+from fastapi import APIRouter, Depends, Query
+
+from .. import schemas
+from ..analytics import daily_sales, low_stock, top_products
+from ..database import DbSession, run_db
+from ..deps import get_current_admin_user
+from ..models import User
+from ..replicas import get_read_db
+
+router = APIRouter(prefix='/api/admin/analytics', tags=['admin'])
+
+# Reads come from the rollups kept by app.analytics, so their cost depends on
+# the window and catalog size, not on how many orders exist.
+
+
+@router.get('/sales', response_model=list[schemas.DailySales])
+async def read_daily_sales(
+  days: int = Query(default=30, ge=1, le=366),
+  _: User = Depends(get_current_admin_user),
+  db: DbSession = Depends(get_read_db),
+):
+  return await run_db(db, daily_sales, days)
+
+
+@router.get('/top-products', response_model=list[schemas.TopProduct])
+async def read_top_products(
+  days: int = Query(default=7, ge=1, le=366),
+  limit: int = Query(default=10, ge=1, le=100),
+  by: Literal['units', 'revenue'] = 'units',
+  _: User = Depends(get_current_admin_user),
+  db: DbSession = Depends(get_read_db),
+):
+  return await run_db(db, top_products, days, limit, by)
+
+
+@router.get('/low-stock', response_model=list[schemas.LowStockItem])
+async def read_low_stock(
+  limit: int = Query(default=50, ge=1, le=500),
+  _: User = Depends(get_current_admin_user),
+  db: DbSession = Depends(get_read_db),
+):
+  return await run_db(db, low_stock, limit)
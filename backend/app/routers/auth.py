@@ -1,57 +1,134 @@
+from collections.abc import Callable
 from datetime import timedelta
+from typing import Any, Optional, TypeVar
 
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 
 from .. import schemas
 from ..core.config import settings
-from ..database import get_db
+from ..database import DbSession, get_db, run_db
 from ..deps import get_current_active_user, get_locale
+from ..hashing import HashingBusy, hash_pool
 from ..i18n import translate
 from ..models import User
-from ..security import create_access_token, get_password_hash, verify_password
+from ..rate_limit import login_rate_limit, register_rate_limit
+from ..security import (
+  create_access_token,
+  get_password_hash,
+  token_version,
+  token_versions,
+  verify_and_update_password,
+)
 
 router = APIRouter(prefix='/api/auth', tags=['auth'])
 
+T = TypeVar('T')
+
+
+async def _hash(lang: str, fn: Callable[..., T], *args: Any) -> T:
+  try:
+    return await hash_pool.run(fn, *args)
+  except HashingBusy as exc:
+    raise HTTPException(
+      status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+      detail=translate('errors.service_busy', lang),
+      headers={'Retry-After': '1'},
+    ) from exc
+
 
 def create_token_for_user(user: User) -> schemas.Token:
-  token = create_access_token(str(user.id), timedelta(minutes=settings.access_token_expire_minutes))
+  if settings.stateless_auth:
+    version = token_version(user.updated_at)
+    token_versions.set(user.id, version)
+    token = create_access_token(
+      str(user.id),
+      timedelta(minutes=settings.stateless_access_token_expire_minutes),
+      claims={'act': user.is_active, 'adm': user.is_admin, 'ver': version},
+    )
+  else:
+    token = create_access_token(
+      str(user.id), timedelta(minutes=settings.access_token_expire_minutes)
+    )
   return schemas.Token(access_token=token)
 
 
-@router.post('/register', response_model=schemas.UserOut, status_code=status.HTTP_201_CREATED)
-def register(
-  user_in: schemas.UserCreate, db: Session = Depends(get_db), lang: str = Depends(get_locale)
+def _get_user_by_email(db: Session, email: str) -> Optional[User]:
+  return db.query(User).filter(User.email == email).first()
+
+
+def _create_user(db: Session, email: str, hashed_password: str) -> schemas.UserOut:
+  user = User(email=email, hashed_password=hashed_password, is_active=True, is_admin=False)
+  db.add(user)
+  db.commit()
+  db.refresh(user)
+  return schemas.UserOut.model_validate(user)
+
+
+def _update_password_hash(db: Session, user: User, hashed_password: str) -> None:
+  user.hashed_password = hashed_password
+  db.commit()
+  db.refresh(user)
+
+
+def _read_user(db: Session, user_id: int) -> Optional[schemas.UserOut]:
+  user = db.get(User, user_id)
+  return schemas.UserOut.model_validate(user) if user is not None else None
+
+
+@router.post(
+  '/register',
+  response_model=schemas.UserOut,
+  status_code=status.HTTP_201_CREATED,
+  dependencies=[Depends(register_rate_limit)],
+)
+async def register(
+  user_in: schemas.UserCreate, db: DbSession = Depends(get_db), lang: str = Depends(get_locale)
 ):
-  existing = db.query(User).filter(User.email == user_in.email).first()
+  existing = await run_db(db, _get_user_by_email, user_in.email)
   if existing:
     raise HTTPException(
       status_code=status.HTTP_400_BAD_REQUEST, detail=translate('errors.user_exists', lang)
     )
-  user = User(
-    email=user_in.email,
-    hashed_password=get_password_hash(user_in.password),
-    is_active=True,
-    is_admin=False,
-  )
-  db.add(user)
-  db.commit()
-  db.refresh(user)
-  return user
+  hashed_password = await _hash(lang, get_password_hash, user_in.password)
+  return await run_db(db, _create_user, user_in.email, hashed_password)
 
 
-@router.post('/login', response_model=schemas.Token)
-def login(
-  user_in: schemas.UserLogin, db: Session = Depends(get_db), lang: str = Depends(get_locale)
+@router.post('/login', response_model=schemas.Token, dependencies=[Depends(login_rate_limit)])
+async def login(
+  user_in: schemas.UserLogin, db: DbSession = Depends(get_db), lang: str = Depends(get_locale)
 ):
-  user = db.query(User).filter(User.email == user_in.email).first()
-  if not user or not verify_password(user_in.password, user.hashed_password):
+  user = await run_db(db, _get_user_by_email, user_in.email)
+  if not user:
     raise HTTPException(
       status_code=status.HTTP_401_UNAUTHORIZED, detail=translate('errors.invalid_credentials', lang)
     )
+  valid, new_hash = await _hash(
+    lang, verify_and_update_password, user_in.password, user.hashed_password
+  )
+  if not valid:
+    raise HTTPException(
+      status_code=status.HTTP_401_UNAUTHORIZED, detail=translate('errors.invalid_credentials', lang)
+    )
+  if new_hash:
+    await run_db(db, _update_password_hash, user, new_hash)
   return create_token_for_user(user)
 
 
 @router.get('/me', response_model=schemas.UserOut)
-def read_me(current_user: User = Depends(get_current_active_user)):
-  return current_user
+async def read_me(
+  current_user: User = Depends(get_current_active_user),
+  db: DbSession = Depends(get_db),
+  lang: str = Depends(get_locale),
+):
+  # With stateless auth the dependency returns a claims-only user; outside of it
+  # this is an identity-map hit on the session the dependency already used.
+  user = await run_db(db, _read_user, current_user.id)
+  if user is None:
+    # A stateless token can outlive its user until the version cache expires.
+    raise HTTPException(
+      status_code=status.HTTP_401_UNAUTHORIZED,
+      detail=translate('errors.invalid_credentials', lang),
+      headers={'WWW-Authenticate': 'Bearer'},
+    )
+  return user
@@ -1,103 +1,164 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session, joinedload
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.orm import Session
 
 from .. import schemas
-from ..database import get_db
+from ..cart_store import cached_product, cart_store
+from ..core.config import settings
+from ..database import DbSession, get_db, release_connection, run_db
 from ..deps import get_current_active_user, get_locale
 from ..i18n import translate
-from ..models import CartItem, Product, User
+from ..models import User
+from ..reservations import ReservationError, hold_queue, release_hold, trim_hold
+from ..serialization import FastJSONResponse
 
 router = APIRouter(prefix='/api/cart', tags=['cart'])
 
+CART_PRODUCT_FIELDS = tuple(schemas.CartProduct.model_fields)
+
+
+def _read_cart(db: Session, user_id: int) -> schemas.CartResponse | dict:
+  items = [
+    {
+      'id': item_id,
+      'quantity': quantity,
+      'product': dict(zip(CART_PRODUCT_FIELDS, product, strict=True)),
+    }
+    for item_id, quantity, product in cart_store.read(db, user_id)
+  ]
+  total = sum((item['product']['price'] or 0) * item['quantity'] for item in items)
+  cart = {'items': items, 'total_price': float(total)}
+  if settings.fast_serialization:
+    return cart
+  return schemas.CartResponse.model_validate(cart)
+
+
+def _cart_response(cart, status_code: int = status.HTTP_200_OK):
+  if isinstance(cart, dict):
+    return FastJSONResponse(cart, status_code=status_code)
+  return cart
+
+
+def _mutation_result(db: Session, user_id: int, line, delta: bool):
+  if line is None:
+    return None
+  if delta:
+    # Product details come from the product cache, so on a warm cache the
+    # mutation itself is the only round trip.
+    item_id, product_id, quantity = line
+    product = cached_product(db, product_id)
+    if product is None:
+      # The product is gone; full cart reads skip such lines, so drop it.
+      cart_store.remove(db, user_id, item_id)
+      return None
+    return schemas.CartDelta(
+      item=schemas.CartItemOut(
+        id=item_id, quantity=quantity, product=schemas.CartProduct.model_validate(product)
+      )
+    )
+  return _read_cart(db, user_id)
+
+
+def _add_to_cart(db: Session, user_id: int, payload: schemas.CartItemCreate, delta: bool):
+  line = cart_store.add(db, user_id, payload.product_id, payload.quantity)
+  return _mutation_result(db, user_id, line, delta)
+
+
+def _update_cart_item(
+  db: Session, user_id: int, item_id: int, payload: schemas.CartItemUpdate, delta: bool
+):
+  line = cart_store.set_quantity(db, user_id, item_id, payload.quantity)
+  if line is not None:
+    # A hold never covers more than the cart line it was placed for.
+    trim_hold(db, user_id, line[1], line[2])
+  return _mutation_result(db, user_id, line, delta)
 
-def _get_cart_items(db: Session, user_id: int):
-  return (
-    db.query(CartItem)
-    .options(joinedload(CartItem.product))
-    .filter(CartItem.user_id == user_id)
-    .all()
-  )
 
+def _delete_cart_item(db: Session, user_id: int, item_id: int, delta: bool):
+  removed = cart_store.remove(db, user_id, item_id)
+  if removed is None:
+    return None
+  release_hold(db, user_id, removed[1])
+  if delta:
+    return schemas.CartDelta(removed_item_id=removed[0])
+  return _read_cart(db, user_id)
 
-def _serialize_cart(items):
-  total = sum((item.product.price or 0) * item.quantity for item in items)
-  cart_items = [schemas.CartItemOut.model_validate(item, from_attributes=True) for item in items]
-  return schemas.CartResponse(items=cart_items, total_price=total)
+
+def _not_found(lang: str) -> HTTPException:
+  return HTTPException(
+    status_code=status.HTTP_404_NOT_FOUND, detail=translate('errors.product_not_found', lang)
+  )
 
 
 @router.get('', response_model=schemas.CartResponse)
-def read_cart(current_user: User = Depends(get_current_active_user), db: Session = Depends(get_db)):
-  items = _get_cart_items(db, current_user.id)
-  return _serialize_cart(items)
+async def read_cart(
+  current_user: User = Depends(get_current_active_user), db: DbSession = Depends(get_db)
+):
+  return _cart_response(await run_db(db, _read_cart, current_user.id))
+
 
+CartMutationResponse = schemas.CartResponse | schemas.CartDelta
+DELTA_QUERY = Query(default=False, description='Return only the changed line instead of the cart.')
+HOLD_QUERY = Query(
+  default=False,
+  description="Also hold the line's new quantity; 409 when it cannot be held.",
+)
 
-@router.post('', response_model=schemas.CartResponse, status_code=status.HTTP_201_CREATED)
-def add_to_cart(
+
+@router.post('', response_model=CartMutationResponse, status_code=status.HTTP_201_CREATED)
+async def add_to_cart(
   payload: schemas.CartItemCreate,
+  delta: bool = DELTA_QUERY,
+  hold: bool = HOLD_QUERY,
   current_user: User = Depends(get_current_active_user),
-  db: Session = Depends(get_db),
+  db: DbSession = Depends(get_db),
   lang: str = Depends(get_locale),
 ):
-  product = (
-    db.query(Product).filter(Product.id == payload.product_id, Product.is_active.is_(True)).first()
-  )
-  if not product:
-    raise HTTPException(
-      status_code=status.HTTP_404_NOT_FOUND, detail=translate('errors.product_not_found', lang)
-    )
-  item = (
-    db.query(CartItem)
-    .filter(CartItem.user_id == current_user.id, CartItem.product_id == payload.product_id)
-    .first()
-  )
-  if item:
-    item.quantity += payload.quantity
-  else:
-    item = CartItem(
-      user_id=current_user.id, product_id=payload.product_id, quantity=payload.quantity
-    )
-    db.add(item)
-  db.commit()
-  items = _get_cart_items(db, current_user.id)
-  return _serialize_cart(items)
+  if hold:
+    # Holding first turns shoppers away while they fill their carts, before
+    # a sold-out product reaches checkout. Holds are placed in batches on their
+    # own connection, so this request's goes back to the pool meanwhile. The
+    # hold covers the whole line, so adding again grows it rather than
+    # stacking a second hold on top.
+    in_cart = await run_db(db, cart_store.quantity, current_user.id, payload.product_id)
+    await release_connection(db)
+    try:
+      await hold_queue.place(current_user.id, payload.product_id, in_cart + payload.quantity)
+    except ReservationError as exc:
+      if exc.reason == 'product_not_found':
+        raise _not_found(lang) from exc
+      raise HTTPException(
+        status_code=status.HTTP_409_CONFLICT, detail=translate('errors.insufficient_stock', lang)
+      ) from exc
+  cart = await run_db(db, _add_to_cart, current_user.id, payload, delta)
+  if cart is None:
+    raise _not_found(lang)
+  return _cart_response(cart, status.HTTP_201_CREATED)
 
 
-@router.put('/{item_id}', response_model=schemas.CartResponse)
-def update_cart_item(
+@router.put('/{item_id}', response_model=CartMutationResponse)
+async def update_cart_item(
   item_id: int,
   payload: schemas.CartItemUpdate,
+  delta: bool = DELTA_QUERY,
   current_user: User = Depends(get_current_active_user),
-  db: Session = Depends(get_db),
+  db: DbSession = Depends(get_db),
   lang: str = Depends(get_locale),
 ):
-  item = (
-    db.query(CartItem).filter(CartItem.id == item_id, CartItem.user_id == current_user.id).first()
-  )
-  if not item:
-    raise HTTPException(
-      status_code=status.HTTP_404_NOT_FOUND, detail=translate('errors.product_not_found', lang)
-    )
-  item.quantity = payload.quantity
-  db.commit()
-  items = _get_cart_items(db, current_user.id)
-  return _serialize_cart(items)
+  cart = await run_db(db, _update_cart_item, current_user.id, item_id, payload, delta)
+  if cart is None:
+    raise _not_found(lang)
+  return _cart_response(cart)
 
 
-@router.delete('/{item_id}', response_model=schemas.CartResponse)
-def delete_cart_item(
+@router.delete('/{item_id}', response_model=CartMutationResponse)
+async def delete_cart_item(
   item_id: int,
+  delta: bool = DELTA_QUERY,
   current_user: User = Depends(get_current_active_user),
-  db: Session = Depends(get_db),
+  db: DbSession = Depends(get_db),
   lang: str = Depends(get_locale),
 ):
-  item = (
-    db.query(CartItem).filter(CartItem.id == item_id, CartItem.user_id == current_user.id).first()
-  )
-  if not item:
-    raise HTTPException(
-      status_code=status.HTTP_404_NOT_FOUND, detail=translate('errors.product_not_found', lang)
-    )
-  db.delete(item)
-  db.commit()
-  items = _get_cart_items(db, current_user.id)
-  return _serialize_cart(items)
+  cart = await run_db(db, _delete_cart_item, current_user.id, item_id, delta)
+  if cart is None:
+    raise _not_found(lang)
+  return _cart_response(cart)
@@ -0,0 +1,11 @@
+from fastapi import APIRouter, Response
+
+from ..metrics import CONTENT_TYPE, registry
+
+router = APIRouter(tags=['metrics'])
+
+
+@router.get('/metrics', include_in_schema=False)
+async def read_metrics():
+  # Served on the event loop, where the threadpool gauges can be read.
+  return Response(registry.render(), media_type=CONTENT_TYPE)
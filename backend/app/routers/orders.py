@@ -1,101 +1,339 @@
 from decimal import Decimal
+from typing import Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session, joinedload
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
+from sqlalchemy import func, insert, select, tuple_
+from sqlalchemy.orm import Session, selectinload
 
 from .. import schemas
-from ..database import get_db
+from ..cart_store import cart_store
+from ..core.config import settings
+from ..database import DbSession, get_db, run_db
 from ..deps import get_current_active_user, get_locale
+from ..http_cache import etag_matches, make_etag, not_modified, set_validators
 from ..i18n import translate
-from ..models import CartItem, Order, OrderItem, Product, User
+from ..metrics import checkout_outcomes
+from ..models import Order, OrderItem, Product, User
+from ..outbox import enqueue
+from ..pagination import NEXT_CURSOR_HEADER, InvalidCursor, decode_cursor, encode_cursor
+from ..rate_limit import checkout_rate_limit
+from ..replicas import get_read_db
+from ..reservations import adjust_stock, consume_holds, invalidate_stock
+from ..serialization import FastJSONResponse, schema_columns
 
 router = APIRouter(prefix='/api/orders', tags=['orders'])
 
 
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# Items and their products are loaded with separate IN queries instead of a
+# joined Cartesian result.
+ORDER_DETAIL_OPTIONS = selectinload(Order.items).selectinload(OrderItem.product)
+
+
 def _get_order(db: Session, order_id: int, user_id: int):
   return (
     db.query(Order)
-    .options(joinedload(Order.items).joinedload(OrderItem.product))
+    .options(ORDER_DETAIL_OPTIONS)
     .filter(Order.id == order_id, Order.user_id == user_id)
     .first()
   )
 
 
-@router.post('', response_model=schemas.OrderOut, status_code=status.HTTP_201_CREATED)
-def create_order(
-  current_user: User = Depends(get_current_active_user),
-  db: Session = Depends(get_db),
-  lang: str = Depends(get_locale),
-):
-  cart_items = (
-    db.query(CartItem)
-    .options(joinedload(CartItem.product))
-    .filter(CartItem.user_id == current_user.id)
-    .all()
-  )
-  if not cart_items:
-    raise HTTPException(
-      status_code=status.HTTP_400_BAD_REQUEST, detail=translate('errors.cart_empty', lang)
-    )
+class CheckoutError(Exception):
+  def __init__(self, reason: str):
+    super().__init__(reason)
+    self.reason = reason
 
-  for item in cart_items:
-    if not item.product or item.product.stock < item.quantity:
-      raise HTTPException(
-        status_code=status.HTTP_400_BAD_REQUEST, detail=translate('errors.insufficient_stock', lang)
-      )
 
-  order = Order(user_id=current_user.id, status='pending', total_price=Decimal('0'))
-  db.add(order)
-  db.flush()
+def _checkout(db: Session, user_id: int) -> schemas.OrderOut:
+  # Checkout is a fixed number of statements regardless of cart size: read the
+  # cart, convert the user's holds, take any remaining stock in one
+  # conditional UPDATE (rows locked in id order so concurrent checkouts cannot
+  # deadlock), then bulk insert the items and the outbox event and clear the
+  # cart.
+  quantities = cart_store.quantities(db, user_id)
+  if not quantities:
+    raise CheckoutError('cart_empty')
+
+  held = consume_holds(db, user_id, quantities)
+  products = db.execute(
+    select(Product.id, Product.price, Product.name, Product.image_url)
+    .where(Product.id.in_(quantities))
+    .order_by(Product.id)
+  ).all()
+  # Held quantities are already out of stock, so only the difference is
+  # taken; consume_holds has locked the product rows already.
+  changes = {
+    product_id: held.get(product_id, 0) - quantity
+    for product_id, quantity in quantities.items()
+    if held.get(product_id, 0) != quantity
+  }
+  moved = adjust_stock(db, changes, locked=True)
+  if len(products) != len(quantities) or moved is None:
+    db.rollback()
+    raise CheckoutError('insufficient_stock')
 
+  order_items = []
   total = Decimal('0')
-  for cart_item in cart_items:
-    unit_price = Decimal(cart_item.product.price)
-    subtotal = unit_price * cart_item.quantity
-    order_item = OrderItem(
-      order_id=order.id,
-      product_id=cart_item.product_id,
-      quantity=cart_item.quantity,
-      unit_price=unit_price,
-      subtotal_price=subtotal,
+  for product in products:
+    unit_price = Decimal(product.price)
+    subtotal = unit_price * quantities[product.id]
+    order_items.append(
+      {
+        'product_id': product.id,
+        'quantity': quantities[product.id],
+        'unit_price': unit_price,
+        'subtotal_price': subtotal,
+      }
     )
-    db.add(order_item)
     total += subtotal
-    product = db.query(Product).filter(Product.id == cart_item.product_id).first()
-    if product:
-      product.stock -= cart_item.quantity
-    db.delete(cart_item)
 
-  order.total_price = total
+  order = Order(user_id=user_id, status='pending', total_price=total)
+  db.add(order)
+  db.flush()
+  item_ids = db.scalars(
+    insert(OrderItem).returning(OrderItem.id, sort_by_parameter_order=True),
+    [{**item, 'order_id': order.id} for item in order_items],
+  ).all()
+  # The response is built from what was just written instead of reloading the
+  # order; slower side effects hang off the outbox event.
+  result = schemas.OrderOut(
+    id=order.id,
+    status=order.status,
+    total_price=total,
+    created_at=order.created_at,
+    items=[
+      schemas.OrderItemOut(
+        id=item_id,
+        product=schemas.CartProduct(
+          id=product.id, name=product.name, price=product.price, image_url=product.image_url
+        ),
+        **item,
+      )
+      for item_id, item, product in zip(item_ids, order_items, products, strict=True)
+    ],
+  )
+  enqueue(
+    db,
+    'order.created',
+    str(order.id),
+    {
+      'order_id': order.id,
+      'user_id': user_id,
+      'total_price': str(total),
+      'items': [
+        {'product_id': item['product_id'], 'quantity': item['quantity']} for item in order_items
+      ],
+    },
+  )
+  if cart_store.transactional:
+    cart_store.clear(db, user_id, quantities)
   db.commit()
-  db.refresh(order)
-  return _get_order(db, order.id, current_user.id)
+  if not cart_store.transactional:
+    # Lines kept outside the database are dropped once the order exists.
+    cart_store.clear(db, user_id, quantities)
+  invalidate_stock(moved)
+  return result
 
 
-@router.get('', response_model=list[schemas.OrderOut])
-def list_orders(
-  current_user: User = Depends(get_current_active_user), db: Session = Depends(get_db)
-):
+ORDER_FIELDS = tuple(name for name in schemas.OrderOut.model_fields if name != 'items')
+ORDER_ITEM_FIELDS = tuple(name for name in schemas.OrderItemOut.model_fields if name != 'product')
+ORDER_PRODUCT_FIELDS = tuple(schemas.CartProduct.model_fields)
+ORDER_SUMMARY_FIELDS = tuple(
+  name for name in schemas.OrderSummary.model_fields if name != 'item_count'
+)
+NEWEST_FIRST = (Order.created_at.desc(), Order.id.desc())
+
+
+def _page_filters(user_id: int, after: Optional[tuple]) -> list:
+  filters = [Order.user_id == user_id]
+  if after:
+    filters.append(tuple_(Order.created_at, Order.id) < tuple_(*after))
+  return filters
+
+
+def _split_page(rows: list, limit: int) -> tuple[list, Optional[str]]:
+  # Callers fetch limit + 1 rows; the extra one only signals another page.
+  if len(rows) <= limit:
+    return rows, None
+  rows = rows[:limit]
+  return rows, encode_cursor(rows[-1].created_at, rows[-1].id)
+
+
+def _list_orders(db: Session, user_id: int, limit: int, after: Optional[tuple]):
+  if settings.fast_serialization:
+    return _list_order_rows(db, user_id, limit, after)
   orders = (
     db.query(Order)
-    .options(joinedload(Order.items).joinedload(OrderItem.product))
-    .filter(Order.user_id == current_user.id)
-    .order_by(Order.created_at.desc())
+    .options(ORDER_DETAIL_OPTIONS)
+    .filter(*_page_filters(user_id, after))
+    .order_by(*NEWEST_FIRST)
+    .limit(limit + 1)
     .all()
   )
-  return orders
+  return _split_page(orders, limit)
+
+
+def _list_order_rows(db: Session, user_id: int, limit: int, after: Optional[tuple]):
+  headers = db.execute(
+    select(*schema_columns(Order, ORDER_FIELDS))
+    .where(*_page_filters(user_id, after))
+    .order_by(*NEWEST_FIRST)
+    .limit(limit + 1)
+  ).all()
+  headers, next_cursor = _split_page(headers, limit)
+  orders = {row.id: {**row._asdict(), 'items': []} for row in headers}
+  if orders:
+    rows = db.execute(
+      select(
+        OrderItem.order_id,
+        *schema_columns(OrderItem, ORDER_ITEM_FIELDS),
+        *schema_columns(Product, ORDER_PRODUCT_FIELDS),
+      )
+      .outerjoin(Product, Product.id == OrderItem.product_id)
+      .where(OrderItem.order_id.in_(orders))
+      .order_by(OrderItem.id)
+    ).all()
+    product_start = 1 + len(ORDER_ITEM_FIELDS)
+    for row in rows:
+      item = dict(zip(ORDER_ITEM_FIELDS, row[1:product_start], strict=True))
+      product = row[product_start:]
+      item['product'] = (
+        dict(zip(ORDER_PRODUCT_FIELDS, product, strict=True)) if product[0] is not None else None
+      )
+      orders[row[0]]['items'].append(item)
+  return list(orders.values()), next_cursor
+
+
+def _list_order_summaries(db: Session, user_id: int, limit: int, after: Optional[tuple]):
+  item_count = (
+    select(func.count(OrderItem.id))
+    .where(OrderItem.order_id == Order.id)
+    .correlate(Order)
+    .scalar_subquery()
+  )
+  rows = db.execute(
+    select(*schema_columns(Order, ORDER_SUMMARY_FIELDS), item_count.label('item_count'))
+    .where(*_page_filters(user_id, after))
+    .order_by(*NEWEST_FIRST)
+    .limit(limit + 1)
+  ).all()
+  rows, next_cursor = _split_page(rows, limit)
+  if settings.fast_serialization:
+    return [row._asdict() for row in rows], next_cursor
+  return [schemas.OrderSummary.model_validate(row) for row in rows], next_cursor
+
+
+def _get_order_version(db: Session, order_id: int, user_id: int):
+  return db.query(Order.updated_at).filter(Order.id == order_id, Order.user_id == user_id).scalar()
+
+
+@router.post(
+  '',
+  response_model=schemas.OrderOut,
+  status_code=status.HTTP_201_CREATED,
+  dependencies=[Depends(checkout_rate_limit)],
+)
+async def create_order(
+  current_user: User = Depends(get_current_active_user),
+  db: DbSession = Depends(get_db),
+  lang: str = Depends(get_locale),
+):
+  try:
+    order = await run_db(db, _checkout, current_user.id)
+  except CheckoutError as exc:
+    checkout_outcomes[exc.reason].inc()
+    raise HTTPException(
+      status_code=status.HTTP_400_BAD_REQUEST, detail=translate(f'errors.{exc.reason}', lang)
+    ) from exc
+  except Exception:
+    checkout_outcomes['error'].inc()
+    raise
+  checkout_outcomes['success'].inc()
+  return order
+
+
+def _parse_cursor(cursor: Optional[str], lang: str) -> Optional[tuple]:
+  if not cursor:
+    return None
+  try:
+    return decode_cursor(cursor)
+  except InvalidCursor as exc:
+    raise HTTPException(
+      status_code=status.HTTP_400_BAD_REQUEST, detail=translate('errors.invalid_cursor', lang)
+    ) from exc
+
+
+def _page_response(response: Response, items: list, next_cursor: Optional[str]):
+  if settings.fast_serialization:
+    response = FastJSONResponse(items)
+  if next_cursor:
+    response.headers[NEXT_CURSOR_HEADER] = next_cursor
+  return response if settings.fast_serialization else items
+
+
+@router.get('', response_model=list[schemas.OrderOut])
+async def list_orders(
+  response: Response,
+  limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+  cursor: Optional[str] = None,
+  current_user: User = Depends(get_current_active_user),
+  db: DbSession = Depends(get_read_db),
+  lang: str = Depends(get_locale),
+):
+  after = _parse_cursor(cursor, lang)
+  orders, next_cursor = await run_db(db, _list_orders, current_user.id, limit, after)
+  return _page_response(response, orders, next_cursor)
+
+
+@router.get('/summary', response_model=list[schemas.OrderSummary])
+async def list_order_summaries(
+  response: Response,
+  limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+  cursor: Optional[str] = None,
+  current_user: User = Depends(get_current_active_user),
+  db: DbSession = Depends(get_read_db),
+  lang: str = Depends(get_locale),
+):
+  after = _parse_cursor(cursor, lang)
+  summaries, next_cursor = await run_db(db, _list_order_summaries, current_user.id, limit, after)
+  return _page_response(response, summaries, next_cursor)
 
 
 @router.get('/{order_id}', response_model=schemas.OrderOut)
-def get_order_detail(
+async def get_order_detail(
   order_id: int,
+  response: Response,
+  if_none_match: Optional[str] = Header(default=None),
   current_user: User = Depends(get_current_active_user),
-  db: Session = Depends(get_db),
+  db: DbSession = Depends(get_read_db),
+  primary: DbSession = Depends(get_db),
   lang: str = Depends(get_locale),
 ):
-  order = _get_order(db, order_id, current_user.id)
+  not_found = HTTPException(
+    status_code=status.HTTP_404_NOT_FOUND, detail=translate('errors.product_not_found', lang)
+  )
+  cache_control = settings.order_cache_control
+  if if_none_match:
+    # Revalidation only needs the header row, not the joined item graph.
+    updated_at = await run_db(db, _get_order_version, order_id, current_user.id)
+    if updated_at is None and db is not primary:
+      # A replica may not have the order yet; the primary has the final say.
+      db = primary
+      updated_at = await run_db(db, _get_order_version, order_id, current_user.id)
+    if updated_at is None:
+      raise not_found
+    etag = make_etag('order', order_id, updated_at.isoformat())
+    if etag_matches(if_none_match, etag):
+      return not_modified(etag, cache_control)
+  order = await run_db(db, _get_order, order_id, current_user.id)
+  if not order and db is not primary:
+    order = await run_db(primary, _get_order, order_id, current_user.id)
   if not order:
-    raise HTTPException(
-      status_code=status.HTTP_404_NOT_FOUND, detail=translate('errors.product_not_found', lang)
-    )
+    raise not_found
+  set_validators(
+    response, make_etag('order', order.id, order.updated_at.isoformat()), cache_control
+  )
   return order
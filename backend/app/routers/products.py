@@ -1,27 +1,212 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
+from sqlalchemy import select, tuple_
 from sqlalchemy.orm import Session
 
 from .. import schemas
-from ..database import get_db
+from ..cache import MISSING, product_cache
+from ..core.config import settings
+from ..database import DbSession, run_db
 from ..deps import get_locale
+from ..http_cache import etag_matches, make_etag, not_modified, set_validators
 from ..i18n import translate
 from ..models import Product
+from ..pagination import NEXT_CURSOR_HEADER, InvalidCursor, decode_cursor, encode_cursor
+from ..replicas import get_read_db, reads_replica
+from ..search import search_products
+from ..serialization import FastJSONResponse, dumps, schema_columns
 
 router = APIRouter(prefix='/api/products', tags=['products'])
 
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
 
-@router.get('', response_model=list[schemas.ProductOut])
-def list_products(db: Session = Depends(get_db)):
+
+def _escape_like(value: str) -> str:
+  return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+PRODUCT_COLUMNS = [
+  *schema_columns(
+    Product, (name for name in schemas.ProductOut.model_fields if name != 'image_variants')
+  ),
+  Product.image_key,
+]
+
+
+def _product_row_dict(row) -> dict:
+  product = row._asdict()
+  product['image_variants'] = schemas.image_variant_urls(product['id'], product.pop('image_key'))
+  return product
+
+
+def _product_filters(
+  after: Optional[tuple],
+  min_price: Optional[float],
+  max_price: Optional[float],
+  in_stock: bool,
+  name_prefix: Optional[str],
+) -> list:
+  filters = [Product.is_active.is_(True)]
+  if after:
+    filters.append(tuple_(Product.created_at, Product.id) < tuple_(*after))
+  if min_price is not None:
+    filters.append(Product.price >= min_price)
+  if max_price is not None:
+    filters.append(Product.price <= max_price)
+  if in_stock:
+    filters.append(Product.stock > 0)
+  if name_prefix:
+    filters.append(Product.name.like(f'{_escape_like(name_prefix)}%', escape='\\'))
+  return filters
+
+
+def _query_products(db: Session, limit: int, *filter_args) -> list[Product]:
   return (
-    db.query(Product).filter(Product.is_active.is_(True)).order_by(Product.created_at.desc()).all()
+    db.query(Product)
+    .filter(*_product_filters(*filter_args))
+    .order_by(Product.created_at.desc(), Product.id.desc())
+    .limit(limit)
+    .all()
+  )
+
+
+def _query_product_rows(db: Session, limit: int, *filter_args) -> list:
+  return db.execute(
+    select(*PRODUCT_COLUMNS)
+    .where(*_product_filters(*filter_args))
+    .order_by(Product.created_at.desc(), Product.id.desc())
+    .limit(limit)
+  ).all()
+
+
+def _get_product(db: Session, product_id: int) -> Optional[Product]:
+  return db.query(Product).filter(Product.id == product_id).first()
+
+
+def _page_response(response: Response, items, headers: dict, etag: str, cache_control: str):
+  if isinstance(items, bytes):
+    # Pre-encoded pages (fast serialization) bypass response_model.
+    response = items = FastJSONResponse(items)
+  response.headers.update(headers)
+  set_validators(response, etag, cache_control)
+  return items
+
+
+@router.get('', response_model=list[schemas.ProductOut])
+async def list_products(
+  response: Response,
+  limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+  cursor: Optional[str] = None,
+  min_price: Optional[float] = Query(default=None, ge=0),
+  max_price: Optional[float] = Query(default=None, ge=0),
+  in_stock: bool = False,
+  name_prefix: Optional[str] = Query(default=None, min_length=1, max_length=255),
+  if_none_match: Optional[str] = Header(default=None),
+  db: DbSession = Depends(get_read_db),
+  lang: str = Depends(get_locale),
+):
+  cache_control = settings.catalog_cache_control
+  page_key = (limit, cursor, min_price, max_price, in_stock, name_prefix)
+  cached = product_cache.get_page(page_key)
+  if cached is not MISSING:
+    items, next_cursor, etag = cached
+    cursor_headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {}
+    if etag_matches(if_none_match, etag):
+      return not_modified(etag, cache_control, cursor_headers)
+    return _page_response(response, items, cursor_headers, etag, cache_control)
+
+  after = None
+  if cursor:
+    try:
+      after = decode_cursor(cursor)
+    except InvalidCursor as exc:
+      raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST, detail=translate('errors.invalid_cursor', lang)
+      ) from exc
+
+  version = product_cache.page_version
+  query = _query_product_rows if settings.fast_serialization else _query_products
+  products = await run_db(db, query, limit + 1, after, min_price, max_price, in_stock, name_prefix)
+  cursor_headers = {}
+  next_cursor = None
+  if len(products) > limit:
+    products = products[:limit]
+    last = products[-1]
+    next_cursor = encode_cursor(last.created_at, last.id)
+    cursor_headers[NEXT_CURSOR_HEADER] = next_cursor
+  etag = make_etag(
+    'products',
+    next_cursor,
+    *(f'{product.id}:{product.updated_at.isoformat()}' for product in products),
   )
+  if etag_matches(if_none_match, etag):
+    return not_modified(etag, cache_control, cursor_headers)
+  if settings.fast_serialization:
+    # Cache the encoded page so hits skip serialization entirely.
+    items = dumps([_product_row_dict(product) for product in products])
+  else:
+    items = [schemas.ProductOut.model_validate(product) for product in products]
+  if not reads_replica(db):
+    product_cache.set_page(page_key, (items, next_cursor, etag), version)
+  return _page_response(response, items, cursor_headers, etag, cache_control)
+
+
+def _search(db: Session, q: str, limit: int) -> list[schemas.ProductSearchHit]:
+  return [
+    schemas.ProductSearchHit(
+      product=schemas.ProductOut.model_validate(product),
+      score=score,
+      name_highlight=name_highlight,
+      description_highlight=description_highlight,
+    )
+    for product, score, name_highlight, description_highlight in search_products(db, q, limit)
+  ]
+
+
+@router.get('/search', response_model=list[schemas.ProductSearchHit])
+async def search(
+  q: str = Query(min_length=1, max_length=255),
+  limit: int = Query(default=DEFAULT_SEARCH_LIMIT, ge=1, le=MAX_SEARCH_LIMIT),
+  db: DbSession = Depends(get_read_db),
+):
+  return await run_db(db, _search, q, limit)
+
+
+def _product_etag(product_id: int, updated_at) -> str:
+  return make_etag('product', product_id, updated_at.isoformat())
 
 
 @router.get('/{product_id}', response_model=schemas.ProductOut)
-def get_product(product_id: int, db: Session = Depends(get_db), lang: str = Depends(get_locale)):
-  product = db.query(Product).filter(Product.id == product_id).first()
+async def get_product(
+  product_id: int,
+  response: Response,
+  if_none_match: Optional[str] = Header(default=None),
+  db: DbSession = Depends(get_read_db),
+  lang: str = Depends(get_locale),
+):
+  cache_control = settings.catalog_cache_control
+  cached = product_cache.get_product(product_id)
+  if cached is not MISSING:
+    etag = _product_etag(cached.id, cached.updated_at)
+    if etag_matches(if_none_match, etag):
+      return not_modified(etag, cache_control)
+    set_validators(response, etag, cache_control)
+    return cached
+  version = product_cache.version
+  product = await run_db(db, _get_product, product_id)
   if not product:
     raise HTTPException(
       status_code=status.HTTP_404_NOT_FOUND, detail=translate('errors.product_not_found', lang)
     )
-  return product
+  etag = _product_etag(product.id, product.updated_at)
+  if etag_matches(if_none_match, etag):
+    return not_modified(etag, cache_control)
+  item = schemas.ProductOut.model_validate(product)
+  if not reads_replica(db):
+    product_cache.set_product(product_id, item, version)
+  set_validators(response, etag, cache_control)
+  return item
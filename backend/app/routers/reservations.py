@@ -0,0 +1,63 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+
+from .. import schemas
+from ..cart_store import cart_store
+from ..database import DbSession, get_db, release_connection, run_db
+from ..deps import get_current_active_user, get_locale
+from ..i18n import translate
+from ..models import User
+from ..reservations import ReservationError, hold_queue, list_holds, release_hold
+
+router = APIRouter(prefix='/api/reservations', tags=['reservations'])
+
+_ERROR_STATUS = {
+  'product_not_found': status.HTTP_404_NOT_FOUND,
+  'insufficient_stock': status.HTTP_409_CONFLICT,
+}
+
+
+@router.get('', response_model=list[schemas.ReservationOut])
+async def read_reservations(
+  current_user: User = Depends(get_current_active_user), db: DbSession = Depends(get_db)
+):
+  return await run_db(db, list_holds, current_user.id)
+
+
+@router.post('', response_model=schemas.ReservationOut, status_code=status.HTTP_201_CREATED)
+async def create_reservation(
+  payload: schemas.ReservationCreate,
+  current_user: User = Depends(get_current_active_user),
+  db: DbSession = Depends(get_db),
+  lang: str = Depends(get_locale),
+):
+  # A hold covers at most what the user has in their cart. Holds are placed in
+  # batches on their own connection; this request's goes back to the pool so
+  # waiting requests cannot starve it.
+  in_cart = await run_db(db, cart_store.quantity, current_user.id, payload.product_id)
+  if not in_cart:
+    raise HTTPException(
+      status_code=status.HTTP_409_CONFLICT, detail=translate('errors.not_in_cart', lang)
+    )
+  await release_connection(db)
+  try:
+    return await hold_queue.place(
+      current_user.id, payload.product_id, min(payload.quantity, in_cart)
+    )
+  except ReservationError as exc:
+    raise HTTPException(
+      status_code=_ERROR_STATUS[exc.reason], detail=translate(f'errors.{exc.reason}', lang)
+    ) from exc
+
+
+@router.delete('/{product_id}', response_model=list[schemas.ReservationOut])
+async def delete_reservation(
+  product_id: int,
+  current_user: User = Depends(get_current_active_user),
+  db: DbSession = Depends(get_db),
+  lang: str = Depends(get_locale),
+):
+  if await run_db(db, release_hold, current_user.id, product_id) is None:
+    raise HTTPException(
+      status_code=status.HTTP_404_NOT_FOUND, detail=translate('errors.reservation_not_found', lang)
+    )
+  return await run_db(db, list_holds, current_user.id)
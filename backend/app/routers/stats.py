@@ -0,0 +1,25 @@
+from fastapi import APIRouter, Depends
+
+from .. import schemas
+from ..cache import product_cache
+from ..db_pool import pool_stats
+from ..deps import get_current_admin_user
+from ..hashing import hash_pool
+from ..models import User
+
+router = APIRouter(prefix='/api/admin/stats', tags=['admin'])
+
+
+@router.get('/cache', response_model=list[schemas.CacheStats])
+async def read_cache_stats(_: User = Depends(get_current_admin_user)):
+  return product_cache.stats()
+
+
+@router.get('/hashing', response_model=schemas.HashingStats)
+async def read_hashing_stats(_: User = Depends(get_current_admin_user)):
+  return hash_pool.stats()
+
+
+@router.get('/pool', response_model=list[schemas.PoolStats])
+async def read_pool_stats(_: User = Depends(get_current_admin_user)):
+  return pool_stats()
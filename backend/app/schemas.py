@@ -1,7 +1,17 @@
-from datetime import datetime
-from typing import List, Optional
+from datetime import date, datetime
+from typing import List, Literal, Optional
 
-from pydantic import BaseModel, EmailStr, Field, ConfigDict
+from pydantic import (
+  AliasChoices,
+  BaseModel,
+  ConfigDict,
+  EmailStr,
+  Field,
+  ValidationInfo,
+  field_validator,
+)
+
+from .core.config import settings
 
 
 class Message(BaseModel):
@@ -56,13 +66,83 @@ class ProductUpdate(BaseModel):
   is_active: Optional[bool]
 
 
+class ProductImportRow(BaseModel):
+  # A row with an id may carry only the fields to change; the rest keep their
+  # stored values. New products need name, description, price and stock.
+  id: Optional[int] = None
+  name: Optional[str] = None
+  description: Optional[str] = None
+  price: Optional[float] = None
+  image_url: Optional[str] = None
+  stock: Optional[int] = None
+  is_active: bool = True
+
+
+class BulkImportError(BaseModel):
+  row: int
+  detail: str
+
+
+class BulkImportResult(BaseModel):
+  inserted: int
+  upserted: int
+  failed: int
+  errors: list[BulkImportError]
+
+
+class ProductImageVariants(BaseModel):
+  thumbnail: str
+  thumbnail_webp: str
+  large: str
+  large_webp: str
+
+
+def image_variant_urls(product_id: int, image_key: Optional[str]) -> Optional[dict]:
+  # Files are named after the fields, e.g. `large_webp` -> `large.webp`, under a
+  # directory per upload, so the URLs never change content.
+  if not image_key:
+    return None
+  base = f'{settings.media_url.rstrip("/")}/products/{product_id}/{image_key}'
+  return {
+    name: f'{base}/{name.removesuffix("_webp")}.webp'
+    if name.endswith('_webp')
+    else f'{base}/{name}.jpg'
+    for name in ProductImageVariants.model_fields
+  }
+
+
 class ProductOut(ProductBase):
   id: int
   created_at: datetime
   updated_at: datetime
+  # Read from `Product.image_key` when validating a row.
+  image_variants: Optional[ProductImageVariants] = Field(
+    default=None, validation_alias=AliasChoices('image_variants', 'image_key')
+  )
 
   model_config = ConfigDict(from_attributes=True)
 
+  @field_validator('image_variants', mode='before')
+  @classmethod
+  def _image_variant_urls(cls, value, info: ValidationInfo):
+    if isinstance(value, str):
+      return image_variant_urls(info.data['id'], value)
+    return value
+
+
+class ProductImageUpload(BaseModel):
+  product_id: int
+  image_key: str
+  # `processing` until the outbox worker has rendered the variants.
+  status: Literal['processing', 'ready']
+
+
+class ProductSearchHit(BaseModel):
+  product: ProductOut
+  score: float
+  name_highlight: str
+  description_highlight: str
+
 
 class CartItemCreate(BaseModel):
   product_id: int
@@ -95,6 +175,24 @@ class CartResponse(BaseModel):
   total_price: float
 
 
+class CartDelta(BaseModel):
+  item: Optional[CartItemOut] = None
+  removed_item_id: Optional[int] = None
+
+
+class ReservationCreate(BaseModel):
+  product_id: int
+  quantity: int = Field(gt=0)
+
+
+class ReservationOut(BaseModel):
+  product_id: int
+  quantity: int
+  expires_at: datetime
+
+  model_config = ConfigDict(from_attributes=True)
+
+
 class OrderItemOut(BaseModel):
   id: int
   product_id: int
@@ -114,3 +212,72 @@ class OrderOut(BaseModel):
   items: List[OrderItemOut]
 
   model_config = ConfigDict(from_attributes=True)
+
+
+class OrderSummary(BaseModel):
+  id: int
+  status: str
+  total_price: float
+  created_at: datetime
+  item_count: int
+
+  model_config = ConfigDict(from_attributes=True)
+
+
+class CacheStats(BaseModel):
+  name: str
+  hits: int
+  misses: int
+  hit_ratio: float
+  size: int
+  maxsize: int
+
+
+class HashingStats(BaseModel):
+  workers: int
+  max_pending: int
+  in_flight: int
+  completed: int
+  rejected: int
+  hash_seconds_avg: float
+  hash_seconds_max: float
+  wait_seconds_avg: float
+  wait_seconds_max: float
+
+
+class PoolStats(BaseModel):
+  name: str
+  size: int
+  checked_out: int
+  checked_in: int
+  overflow: int
+  checkouts: int
+  timeouts: int
+  wait_seconds_avg: float
+  wait_seconds_max: float
+
+
+class DailySales(BaseModel):
+  day: date
+  orders: int
+  units: int
+  revenue: float
+
+  model_config = ConfigDict(from_attributes=True)
+
+
+class TopProduct(BaseModel):
+  product_id: int
+  name: str
+  units: int
+  revenue: float
+
+  model_config = ConfigDict(from_attributes=True)
+
+
+class LowStockItem(BaseModel):
+  product_id: int
+  name: str
+  stock: int
+  units_last_7_days: int
+  days_of_cover: Optional[float]
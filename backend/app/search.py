@@ -0,0 +1,233 @@
+from __future__ import annotations
+
+import bisect
+import html
+import math
+import re
+import threading
+from collections import defaultdict
+from collections.abc import Iterable
+
+from sqlalchemy import bindparam, func, literal_column, select
+from sqlalchemy.orm import Session
+
+from .cache import product_cache
+from .models import SEARCH_CONFIG, Product, product_search_document
+
+_WORD = re.compile(r'\w+', re.UNICODE)
+_MARK_START = '\x02'
+_MARK_END = '\x03'
+NAME_WEIGHT = 3.0
+DESCRIPTION_WEIGHT = 1.0
+MAX_PREFIX_EXPANSIONS = 64
+SNIPPET_CHARS = 160
+# Product columns the index is built from; writes to others leave it as is.
+SEARCHABLE_FIELDS = frozenset({'name', 'description', 'is_active'})
+
+
+def tokenize(text: str) -> list[str]:
+  return _WORD.findall(text.lower())
+
+
+def _deletes(term: str) -> set[str]:
+  return {term[:i] + term[i + 1 :] for i in range(len(term))}
+
+
+def _within_one_edit(a: str, b: str) -> bool:
+  if a == b:
+    return True
+  if abs(len(a) - len(b)) > 1:
+    return False
+  if len(a) == len(b):
+    diff = [i for i in range(len(a)) if a[i] != b[i]]
+    return len(diff) == 1 or (
+      len(diff) == 2
+      and diff[1] == diff[0] + 1
+      and a[diff[0]] == b[diff[1]]
+      and a[diff[1]] == b[diff[0]]
+    )
+  shorter, longer = (a, b) if len(a) < len(b) else (b, a)
+  return any(longer[:i] + longer[i + 1 :] == shorter for i in range(len(longer)))
+
+
+def _render(text: str, matched: set[str]) -> str:
+  def mark(match: re.Match) -> str:
+    word = match.group(0)
+    return f'{_MARK_START}{word}{_MARK_END}' if word.lower() in matched else word
+
+  return _WORD.sub(mark, text)
+
+
+def _to_html(marked: str) -> str:
+  # Highlights are returned as escaped HTML with <mark> around matched words.
+  return html.escape(marked).replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>')
+
+
+def _snippet(marked: str) -> str:
+  if len(marked) <= SNIPPET_CHARS:
+    return marked
+  start = max(marked.find(_MARK_START) - SNIPPET_CHARS // 4, 0)
+  end = start + SNIPPET_CHARS
+  # Never cut a highlight in half.
+  if marked.rfind(_MARK_START, start, end) > marked.rfind(_MARK_END, start, end):
+    end = marked.find(_MARK_END, end) + 1
+  return ('…' if start else '') + marked[start:end] + ('…' if end < len(marked) else '')
+
+
+class InMemorySearchIndex:
+  # Fallback for databases without full-text search (SQLite in local/test
+  # use): an inverted index with prefix expansion over a sorted vocabulary and
+  # single-edit typo matching through a deletion neighbourhood.
+  def __init__(self):
+    self._lock = threading.Lock()
+    self.version: int | None = None
+    self.postings: dict[str, dict[int, float]] = {}
+    self.vocabulary: list[str] = []
+    self.neighbours: dict[str, set[str]] = {}
+    self.documents: dict[int, tuple[str, str]] = {}
+
+  def build(self, rows: Iterable[tuple[int, str, str]], version: int) -> None:
+    postings: dict[str, dict[int, float]] = defaultdict(lambda: defaultdict(float))
+    documents = {}
+    for product_id, name, description in rows:
+      documents[product_id] = (name, description or '')
+      for term in tokenize(name):
+        postings[term][product_id] += NAME_WEIGHT
+      for term in tokenize(description or ''):
+        postings[term][product_id] += DESCRIPTION_WEIGHT
+    neighbours: dict[str, set[str]] = defaultdict(set)
+    for term in postings:
+      if len(term) >= 4:
+        for deleted in _deletes(term):
+          neighbours[deleted].add(term)
+    with self._lock:
+      self.postings = {term: dict(ids) for term, ids in postings.items()}
+      self.vocabulary = sorted(postings)
+      self.neighbours = dict(neighbours)
+      self.documents = documents
+      self.version = version
+
+  def _expand(self, token: str) -> dict[str, float]:
+    # Candidate index terms for one query token and how much to trust each.
+    candidates = {token: 1.0} if token in self.postings else {}
+    start = bisect.bisect_left(self.vocabulary, token)
+    for term in self.vocabulary[start : start + MAX_PREFIX_EXPANSIONS]:
+      if not term.startswith(token):
+        break
+      candidates.setdefault(term, 0.7)
+    if len(token) >= 4:
+      for key in {token} | _deletes(token):
+        for term in self.neighbours.get(key, ()):
+          if term not in candidates and _within_one_edit(token, term):
+            candidates[term] = 0.5
+        if key in self.postings and key not in candidates and len(key) >= 3:
+          candidates[key] = 0.5
+    return candidates
+
+  def search(self, query: str, limit: int) -> list[tuple[int, float, set[str]]]:
+    tokens = tokenize(query)
+    if not tokens:
+      return []
+    total = max(len(self.documents), 1)
+    scores: dict[int, float] | None = None
+    matched: dict[int, set[str]] = defaultdict(set)
+    for token in tokens:
+      token_scores: dict[int, float] = defaultdict(float)
+      for term, trust in self._expand(token).items():
+        ids = self.postings[term]
+        idf = math.log(1 + total / len(ids))
+        for product_id, weight in ids.items():
+          token_scores[product_id] = max(token_scores[product_id], trust * weight * idf)
+          matched[product_id].add(term)
+      # Every query token has to match something (AND semantics).
+      if scores is None:
+        scores = dict(token_scores)
+      else:
+        scores = {
+          pid: score + token_scores[pid] for pid, score in scores.items() if pid in token_scores
+        }
+      if not scores:
+        return []
+    ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+    return [(product_id, score, matched[product_id]) for product_id, score in ranked]
+
+  def highlight(self, product_id: int, matched: set[str]) -> tuple[str, str]:
+    name, description = self.documents[product_id]
+    return _to_html(_render(name, matched)), _to_html(_snippet(_render(description, matched)))
+
+
+_memory_index = InMemorySearchIndex()
+_build_lock = threading.Lock()
+
+
+def _ensure_memory_index(db: Session) -> InMemorySearchIndex:
+  version = product_cache.search_version
+  if _memory_index.version != version:
+    # Query outside the lock: on the async engine this session yields to the
+    # event loop, and a request blocked on the lock would stall the loop.
+    rows = db.execute(
+      select(Product.id, Product.name, Product.description).where(Product.is_active.is_(True))
+    ).all()
+    with _build_lock:
+      if _memory_index.version != version:
+        _memory_index.build(rows, version)
+  return _memory_index
+
+
+def _tsquery_text(query: str) -> str:
+  return ' & '.join(f'{token}:*' for token in tokenize(query))
+
+
+def _search_postgres(db: Session, query: str, limit: int):
+  tsquery = func.to_tsquery(SEARCH_CONFIG, bindparam('tsquery', _tsquery_text(query)))
+  raw_query = bindparam('raw_query', query)
+  rank = func.ts_rank_cd(product_search_document, tsquery) + func.word_similarity(
+    raw_query, Product.name
+  )
+  statement = (
+    select(
+      Product,
+      rank.label('score'),
+      func.ts_headline(
+        SEARCH_CONFIG,
+        Product.name,
+        tsquery,
+        f'StartSel={_MARK_START},StopSel={_MARK_END},HighlightAll=true',
+      ).label('name_highlight'),
+      func.ts_headline(
+        SEARCH_CONFIG,
+        Product.description,
+        tsquery,
+        f'StartSel={_MARK_START},StopSel={_MARK_END},MaxWords=30,MinWords=10',
+      ).label('description_highlight'),
+    )
+    .where(
+      Product.is_active.is_(True),
+      product_search_document.op('@@')(tsquery) | raw_query.op('<%')(Product.name),
+    )
+    .order_by(literal_column('score').desc(), Product.id)
+    .limit(limit)
+  )
+  return [
+    (product, score, _to_html(name_highlight), _to_html(description_highlight))
+    for product, score, name_highlight, description_highlight in db.execute(statement).all()
+  ]
+
+
+def search_products(db: Session, query: str, limit: int):
+  if not tokenize(query):
+    return []
+  if db.get_bind().dialect.name == 'postgresql':
+    return _search_postgres(db, query, limit)
+  index = _ensure_memory_index(db)
+  hits = index.search(query, limit)
+  products = {
+    product.id: product
+    for product in db.query(Product).filter(Product.id.in_([hit[0] for hit in hits])).all()
+  }
+  results = []
+  for product_id, score, matched in hits:
+    if product_id in products:
+      name_highlight, description_highlight = index.highlight(product_id, matched)
+      results.append((products[product_id], score, name_highlight, description_highlight))
+  return results
@@ -1,26 +1,53 @@
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Any, Optional
 
 from jose import jwt
 from passlib.context import CryptContext
 
+from .cache import TTLCache
 from .core.config import settings
 
-pwd_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
+# Hashes made with other cost settings still verify and are upgraded on login.
+pwd_context = CryptContext(
+  schemes=['bcrypt'], deprecated='auto', bcrypt__rounds=settings.bcrypt_rounds
+)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
   return pwd_context.verify(plain_password, hashed_password)
 
 
+def verify_and_update_password(
+  plain_password: str, hashed_password: str
+) -> tuple[bool, Optional[str]]:
+  return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
 def get_password_hash(password: str) -> str:
   return pwd_context.hash(password)
 
 
-def create_access_token(subject: str, expires_delta: Optional[timedelta] = None) -> str:
+# Maps user id -> current token version so stateless tokens can be checked for
+# revocation without loading the user row on every request.
+token_versions = TTLCache(
+  'token_versions', settings.token_version_cache_size, settings.token_version_cache_ttl_seconds
+)
+
+
+def token_version(updated_at: datetime) -> str:
+  # Any change to the user row (deactivation, role change, password rehash)
+  # moves updated_at and thereby revokes stateless tokens issued before it.
+  return updated_at.isoformat()
+
+
+def create_access_token(
+  subject: str,
+  expires_delta: Optional[timedelta] = None,
+  claims: Optional[dict[str, Any]] = None,
+) -> str:
   expire = datetime.utcnow() + (
     expires_delta or timedelta(minutes=settings.access_token_expire_minutes)
   )
-  to_encode = {'sub': subject, 'exp': expire}
+  to_encode = {**(claims or {}), 'sub': subject, 'exp': expire}
   encoded_jwt = jwt.encode(to_encode, settings.secret_key, algorithm=settings.algorithm)
   return encoded_jwt
@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+from collections.abc import Iterable
+from decimal import Decimal
+from typing import Any
+
+import orjson
+from fastapi import Response
+
+
+def _default(value: Any) -> Any:
+  if isinstance(value, Decimal):
+    return float(value)
+  raise TypeError(f'Type is not JSON serializable: {type(value).__name__}')
+
+
+def dumps(content: Any) -> bytes:
+  return orjson.dumps(content, default=_default)
+
+
+class FastJSONResponse(Response):
+  # Encodes plain rows/dicts straight to JSON, skipping response_model
+  # validation and jsonable_encoder. Payloads must already match the route's
+  # response schema.
+  media_type = 'application/json'
+
+  def render(self, content: Any) -> bytes:
+    if isinstance(content, bytes):
+      return content
+    return dumps(content)
+
+
+def schema_columns(model: type, fields: Iterable[str]) -> list:
+  # Select exactly the response schema's fields so rows keep its field names.
+  return [getattr(model, name) for name in fields]
@@ -0,0 +1,4 @@
+"""Benchmarks for the e-shop backend.
+
+Run them from `backend/` with `python -m benchmarks.<name>`.
+"""
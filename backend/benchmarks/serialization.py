@@ -0,0 +1,111 @@
+"""Per-row cost of the default and fast list serialization paths.
+
+Seeds an in-memory SQLite database, then times the query plus encoding that
+`GET /api/products` and `GET /api/orders` do in each mode. The default path is
+reproduced with FastAPI's own `serialize_response` so the numbers include
+response_model validation and JSON rendering.
+
+    python -m benchmarks.serialization --rows 200 --repeat 50
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+from decimal import Decimal
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import schemas
+from app.database import Base
+from app.models import Order, OrderItem, Product, User
+from app.routers.orders import _list_order_rows, _list_orders
+from app.routers.products import _query_product_rows, _query_products
+from app.serialization import FastJSONResponse, dumps
+
+
+def seed(db, rows: int) -> int:
+  products = [
+    Product(name=f'Product {index}', description='Benchmark product ' * 4, price=9.99, stock=100)
+    for index in range(rows)
+  ]
+  user = User(email='bench@example.com', hashed_password='!')
+  db.add_all(products + [user])
+  db.flush()
+  # One order per row with three items each, so orders exercise the nesting.
+  for index in range(rows):
+    order = Order(user_id=user.id, status='pending', total_price=Decimal('29.97'))
+    order.items = [
+      OrderItem(
+        product_id=products[(index + offset) % rows].id,
+        quantity=1,
+        unit_price=Decimal('9.99'),
+        subtotal_price=Decimal('9.99'),
+      )
+      for offset in range(3)
+    ]
+    db.add(order)
+  db.commit()
+  return user.id
+
+
+def _default_render(field, content) -> bytes:
+  value = asyncio.run(serialize_response(field=field, response_content=content, is_coroutine=True))
+  return JSONResponse(value).body
+
+
+def measure(label: str, rows: int, repeat: int, run) -> float:
+  run()
+  started = time.perf_counter()
+  for _ in range(repeat):
+    run()
+  per_row = (time.perf_counter() - started) / repeat / rows * 1e6
+  print(f'{label:<24} {per_row:8.2f} us/row')
+  return per_row
+
+
+def main() -> None:
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--rows', type=int, default=200)
+  parser.add_argument('--repeat', type=int, default=50)
+  args = parser.parse_args()
+
+  engine = create_engine('sqlite://', poolclass=StaticPool)
+  Base.metadata.create_all(bind=engine)
+  db = sessionmaker(bind=engine)()
+  user_id = seed(db, args.rows)
+  filters = (None, None, None, False, None)
+  product_field = create_response_field(name='Response', type_=list[schemas.ProductOut])
+  order_field = create_response_field(name='Response', type_=list[schemas.OrderOut])
+
+  def default_products():
+    db.expunge_all()
+    _default_render(product_field, _query_products(db, args.rows, *filters))
+
+  def fast_products():
+    FastJSONResponse(dumps([row._asdict() for row in _query_product_rows(db, args.rows, *filters)]))
+
+  def default_orders():
+    db.expunge_all()
+    _default_render(order_field, _list_orders(db, user_id, args.rows, None)[0])
+
+  def fast_orders():
+    FastJSONResponse(_list_order_rows(db, user_id, args.rows, None)[0])
+
+  for name, default, fast in (
+    ('products', default_products, fast_products),
+    ('orders', default_orders, fast_orders),
+  ):
+    before = measure(f'{name} default', args.rows, args.repeat, default)
+    after = measure(f'{name} fast', args.rows, args.repeat, fast)
+    print(f'{name} speedup          {before / after:8.2f}x')
+
+
+if __name__ == '__main__':
+  main()
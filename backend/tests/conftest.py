@@ -0,0 +1,55 @@
+import itertools
+import os
+import tempfile
+
+# Settings are read when app modules are imported, so point them at a scratch
+# database first.
+os.environ['DATABASE_URL'] = f'sqlite:///{tempfile.mkdtemp()}/test.db'
+os.environ['RATE_LIMIT_ENABLED'] = 'false'
+
+import pytest  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.core.config import settings  # noqa: E402
+from app.main import app  # noqa: E402
+
+_unique = itertools.count()
+
+
+@pytest.fixture(scope='session')
+def client():
+  with TestClient(app) as client:
+    yield client
+
+
+@pytest.fixture
+def auth_headers(client):
+  email = f'user{next(_unique)}@example.com'
+  client.post('/api/auth/register', json={'email': email, 'password': 'secret1'})
+  response = client.post('/api/auth/login', json={'email': email, 'password': 'secret1'})
+  return {'Authorization': f'Bearer {response.json()["access_token"]}'}
+
+
+@pytest.fixture(scope='session')
+def admin_headers(client):
+  credentials = {'email': settings.admin_email, 'password': settings.admin_password}
+  response = client.post('/api/auth/login', json=credentials)
+  return {'Authorization': f'Bearer {response.json()["access_token"]}'}
+
+
+@pytest.fixture
+def make_product(client, admin_headers):
+  def make_product(stock=10, **fields):
+    product = {
+      'name': f'Product {next(_unique)}',
+      'description': 'A test product.',
+      'price': 5.0,
+      'image_url': None,
+      'stock': stock,
+      **fields,
+    }
+    response = client.post('/api/admin/products', json=product, headers=admin_headers)
+    assert response.status_code == 201
+    return response.json()
+
+  return make_product
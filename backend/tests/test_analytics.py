@@ -0,0 +1,27 @@
+from sqlalchemy import select
+
+from app import analytics
+from app.database import SessionLocal
+from app.models import ProductSalesDaily
+
+
+def _units(db, product_id):
+  return db.scalar(
+    select(ProductSalesDaily.units).where(ProductSalesDaily.product_id == product_id)
+  )
+
+
+def test_orders_are_counted_once(client, auth_headers, make_product):
+  product = make_product()
+  line = {'product_id': product['id'], 'quantity': 3}
+  client.post('/api/cart', json=line, headers=auth_headers)
+  order = client.post('/api/orders', headers=auth_headers).json()
+  payload = {'order_id': order['id']}
+  with SessionLocal() as db:
+    # The order.created event may be delivered more than once.
+    analytics._count_order(db, payload, f'order.created:{order["id"]}')
+    db.commit()
+    analytics._count_order(db, payload, f'order.created:{order["id"]}')
+    db.commit()
+    assert _units(db, product['id']) == 3
+    assert analytics.add_orders(db, [order['id']]) == 0
@@ -0,0 +1,39 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import delete, update
+
+from app.core.config import settings
+from app.database import SessionLocal
+from app.models import User
+from app.security import token_versions
+
+
+@pytest.fixture
+def stateless(monkeypatch):
+  monkeypatch.setattr(settings, 'stateless_auth', True)
+
+
+def _user_id(client, headers):
+  return client.get('/api/auth/me', headers=headers).json()['id']
+
+
+def test_stateless_token_is_revoked_by_user_changes(client, stateless, auth_headers):
+  user_id = _user_id(client, auth_headers)
+  with SessionLocal() as db:
+    db.execute(update(User).where(User.id == user_id).values(updated_at=datetime.utcnow()))
+    db.commit()
+  # Cached versions stay valid until they expire; a miss reloads the version.
+  assert client.get('/api/auth/me', headers=auth_headers).status_code == 200
+  token_versions.invalidate(user_id)
+  assert client.get('/api/auth/me', headers=auth_headers).status_code == 401
+
+
+def test_stateless_token_of_deleted_user_is_unauthorized(client, stateless, auth_headers):
+  user_id = _user_id(client, auth_headers)
+  with SessionLocal() as db:
+    db.execute(delete(User).where(User.id == user_id))
+    db.commit()
+  response = client.get('/api/auth/me', headers=auth_headers)
+  assert response.status_code == 401
+  assert response.headers['www-authenticate'] == 'Bearer'
@@ -0,0 +1,49 @@
+import json
+
+from app.database import SessionLocal
+from app.models import Product
+
+
+def _import(client, admin_headers, *rows):
+  body = ''.join(json.dumps(row) + '\n' for row in rows)
+  response = client.post(
+    '/api/admin/products/bulk',
+    content=body,
+    headers={**admin_headers, 'Content-Type': 'application/x-ndjson'},
+  )
+  assert response.status_code == 200
+  return response.json()
+
+
+def _stored(product_id):
+  with SessionLocal() as db:
+    product = db.get(Product, product_id)
+    return product.name, product.price, product.image_url, product.stock, product.is_active
+
+
+def test_partial_rows_keep_omitted_fields(client, admin_headers, make_product):
+  product = make_product(stock=4, image_url='/img/a.png', is_active=False)
+  result = _import(client, admin_headers, {'id': product['id'], 'price': 9})
+  assert result == {'inserted': 0, 'upserted': 1, 'failed': 0, 'errors': []}
+  assert _stored(product['id']) == (product['name'], 9, '/img/a.png', 4, False)
+
+
+def test_full_rows_keep_omitted_optional_fields(client, admin_headers, make_product):
+  product = make_product(image_url='/img/b.png', is_active=False)
+  row = {'id': product['id'], 'name': 'Renamed', 'description': 'New', 'price': 2, 'stock': 7}
+  assert _import(client, admin_headers, row)['upserted'] == 1
+  assert _stored(product['id']) == ('Renamed', 2, '/img/b.png', 7, False)
+
+
+def test_rows_that_cannot_create_a_product_fail(client, admin_headers):
+  result = _import(
+    client,
+    admin_headers,
+    {'name': 'No price', 'description': 'x', 'stock': 1},
+    {'id': 10**9, 'price': 1},
+    {'id': 10**9 + 1, 'name': 'Keyed', 'description': 'x', 'price': 1, 'stock': 1},
+  )
+  assert (result['inserted'], result['upserted'], result['failed']) == (0, 1, 2)
+  assert [error['row'] for error in result['errors']] == [1, 2]
+  assert result['errors'][0]['detail'] == 'price: Field required'
+  assert _stored(10**9 + 1) == ('Keyed', 1, None, 1, True)
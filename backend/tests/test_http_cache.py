@@ -0,0 +1,31 @@
+def test_product_revalidates_until_it_changes(client, admin_headers, make_product):
+  product = make_product()
+  url = f'/api/products/{product["id"]}'
+  etag = client.get(url).headers['ETag']
+  response = client.get(url, headers={'If-None-Match': etag})
+  assert response.status_code == 304
+  assert response.headers['ETag'] == etag
+
+  changes = {**product, 'price': 6.0}
+  client.put(f'/api/admin/products/{product["id"]}', json=changes, headers=admin_headers)
+  response = client.get(url, headers={'If-None-Match': etag})
+  assert response.status_code == 200
+  assert response.headers['ETag'] != etag
+
+
+def test_listing_page_revalidates(client, make_product):
+  product = make_product()
+  params = {'name_prefix': product['name']}
+  etag = client.get('/api/products', params=params).headers['ETag']
+  response = client.get('/api/products', params=params, headers={'If-None-Match': f'"x", {etag}'})
+  assert response.status_code == 304
+
+
+def test_order_revalidates(client, auth_headers, make_product):
+  product = make_product()
+  client.post('/api/cart', json={'product_id': product['id'], 'quantity': 1}, headers=auth_headers)
+  order = client.post('/api/orders', headers=auth_headers).json()
+  url = f'/api/orders/{order["id"]}'
+  etag = client.get(url, headers=auth_headers).headers['ETag']
+  response = client.get(url, headers={**auth_headers, 'If-None-Match': etag})
+  assert response.status_code == 304
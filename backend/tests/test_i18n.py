@@ -0,0 +1,18 @@
+from app.i18n import negotiate_locale, translate
+
+
+def test_negotiation_follows_quality_and_falls_back():
+  assert negotiate_locale(None) == 'en'
+  assert negotiate_locale('zh-CN,zh;q=0.9,en;q=0.8') == 'zh'
+  assert negotiate_locale('fr, zh;q=0.5') == 'zh'
+  assert negotiate_locale('en;q=0.4, zh;q=0.6') == 'zh'
+  assert negotiate_locale('zh;q=oops, en') == 'en'
+  assert negotiate_locale('fr, de') == 'en'
+
+
+def test_errors_are_translated(client):
+  response = client.get('/api/products/999999', headers={'Accept-Language': 'zh-CN'})
+  assert response.status_code == 404
+  assert response.json()['detail'] == translate('errors.product_not_found', 'zh')
+  assert response.json()['detail'] != translate('errors.product_not_found', 'en')
+  assert translate('errors.no_such_key', 'zh') == 'errors.no_such_key'
@@ -0,0 +1,87 @@
+from sqlalchemy import create_engine, inspect, text
+
+from app.migrations import LATEST_VERSION, current_version, migrate
+
+# What the app's create_all built at boot before migrations existed.
+PRE_MIGRATION_SCHEMA = """
+CREATE TABLE users (
+  id INTEGER NOT NULL, email VARCHAR(255) NOT NULL, hashed_password VARCHAR(255) NOT NULL,
+  is_active BOOLEAN NOT NULL, is_admin BOOLEAN NOT NULL,
+  created_at DATETIME NOT NULL, updated_at DATETIME NOT NULL, PRIMARY KEY (id)
+);
+CREATE INDEX ix_users_id ON users (id);
+CREATE UNIQUE INDEX ix_users_email ON users (email);
+CREATE TABLE products (
+  id INTEGER NOT NULL, name VARCHAR(255) NOT NULL, description TEXT NOT NULL,
+  price NUMERIC(10, 2) NOT NULL, image_url TEXT, is_active BOOLEAN NOT NULL,
+  stock INTEGER NOT NULL, created_at DATETIME NOT NULL, updated_at DATETIME NOT NULL,
+  PRIMARY KEY (id)
+);
+CREATE INDEX ix_products_id ON products (id);
+CREATE TABLE cart_items (
+  id INTEGER NOT NULL, user_id INTEGER NOT NULL, product_id INTEGER NOT NULL,
+  quantity INTEGER NOT NULL, created_at DATETIME NOT NULL, updated_at DATETIME NOT NULL,
+  PRIMARY KEY (id), CONSTRAINT uq_user_product UNIQUE (user_id, product_id),
+  FOREIGN KEY(user_id) REFERENCES users (id) ON DELETE CASCADE,
+  FOREIGN KEY(product_id) REFERENCES products (id)
+);
+CREATE INDEX ix_cart_items_id ON cart_items (id);
+CREATE TABLE orders (
+  id INTEGER NOT NULL, user_id INTEGER NOT NULL, status VARCHAR(50) NOT NULL,
+  total_price NUMERIC(12, 2) NOT NULL, created_at DATETIME NOT NULL,
+  updated_at DATETIME NOT NULL, PRIMARY KEY (id),
+  FOREIGN KEY(user_id) REFERENCES users (id) ON DELETE SET NULL
+);
+CREATE INDEX ix_orders_id ON orders (id);
+CREATE TABLE order_items (
+  id INTEGER NOT NULL, order_id INTEGER NOT NULL, product_id INTEGER NOT NULL,
+  quantity INTEGER NOT NULL, unit_price NUMERIC(10, 2) NOT NULL,
+  subtotal_price NUMERIC(12, 2) NOT NULL, PRIMARY KEY (id),
+  FOREIGN KEY(order_id) REFERENCES orders (id) ON DELETE CASCADE,
+  FOREIGN KEY(product_id) REFERENCES products (id)
+);
+CREATE INDEX ix_order_items_id ON order_items (id);
+INSERT INTO users VALUES (1, 'a@example.com', 'x', 1, 0, '2024-05-01', '2024-05-01');
+INSERT INTO products VALUES (1, 'Lamp', 'A lamp.', 12.50, NULL, 1, 3, '2024-05-01', '2024-05-01');
+INSERT INTO orders VALUES (1, 1, 'pending', 25.00, '2024-05-02 10:00:00', '2024-05-02');
+INSERT INTO order_items VALUES (1, 1, 1, 2, 12.50, 25.00);
+"""
+
+
+def _schema(engine):
+  inspector = inspect(engine)
+  return {
+    table: (
+      [
+        (column['name'], str(column['type']), column['nullable'])
+        for column in inspector.get_columns(table)
+      ],
+      sorted(
+        (index['name'], tuple(index['column_names'])) for index in inspector.get_indexes(table)
+      ),
+    )
+    for table in inspector.get_table_names()
+  }
+
+
+def test_migrating_a_pre_migration_database(tmp_path):
+  fresh = create_engine(f'sqlite:///{tmp_path}/fresh.db')
+  migrate(fresh)
+  legacy = create_engine(f'sqlite:///{tmp_path}/legacy.db')
+  with legacy.begin() as connection:
+    for statement in PRE_MIGRATION_SCHEMA.split(';'):
+      if statement.strip():
+        connection.exec_driver_sql(statement)
+
+  assert migrate(legacy) == list(range(1, LATEST_VERSION + 1))
+  assert _schema(legacy) == _schema(fresh)
+  with legacy.connect() as connection:
+    assert current_version(connection) == LATEST_VERSION
+    assert connection.execute(text('SELECT name, image_key FROM products')).all() == [
+      ('Lamp', None)
+    ]
+    # Orders placed before the rollups existed are counted in them.
+    assert connection.execute(text('SELECT day, units FROM product_sales_daily')).all() == [
+      ('2024-05-02', 2)
+    ]
+    assert connection.execute(text('SELECT order_id FROM analytics_orders')).all() == [(1,)]
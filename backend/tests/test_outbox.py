@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update
+
+from app import outbox
+from app.core.config import settings
+from app.database import SessionLocal
+from app.models import OutboxEvent
+
+
+def _event(db, key):
+  return db.scalars(select(OutboxEvent).where(OutboxEvent.idempotency_key == key)).one()
+
+
+def _make_due(db, key):
+  db.execute(
+    update(OutboxEvent)
+    .where(OutboxEvent.idempotency_key == key)
+    .values(available_at=datetime.utcnow() - timedelta(seconds=1))
+  )
+  db.commit()
+
+
+def test_failures_back_off_and_give_up(client, monkeypatch):
+  calls = []
+
+  def flaky(db, payload, key):
+    calls.append(key)
+    if len(calls) < 2:
+      raise RuntimeError('downstream unavailable')
+
+  monkeypatch.setitem(outbox._handlers, 'test.flaky', [flaky])
+  monkeypatch.setitem(outbox._handlers, 'test.broken', [lambda *_: 1 / 0])
+  monkeypatch.setattr(settings, 'outbox_max_attempts', 2)
+  topics = ('test.flaky', 'test.broken')
+  with SessionLocal() as db:
+    outbox.enqueue(db, 'test.flaky', '1', {})
+    outbox.enqueue(db, 'test.broken', '1', {})
+    db.commit()
+
+    assert outbox.process_batch(db, 10, topics) == 2
+    flaky_event = _event(db, 'test.flaky:1')
+    assert (flaky_event.status, flaky_event.attempts) == ('pending', 1)
+    assert flaky_event.available_at > datetime.utcnow()
+    assert 'downstream unavailable' in flaky_event.last_error
+    # Not due again until the backoff passes.
+    assert outbox.process_batch(db, 10, topics) == 0
+
+    for key in ('test.flaky:1', 'test.broken:1'):
+      _make_due(db, key)
+    assert outbox.process_batch(db, 10, topics) == 2
+    db.expire_all()
+    assert _event(db, 'test.flaky:1').status == 'done'
+    broken = _event(db, 'test.broken:1')
+    assert (broken.status, broken.attempts) == ('failed', 2)
+    assert 'ZeroDivisionError' in broken.last_error
+  assert calls == ['test.flaky:1', 'test.flaky:1']
+
+
+def test_leases_hide_claimed_events_until_they_expire(client):
+  with SessionLocal() as db:
+    outbox.enqueue(db, 'test.leased', '1', {})
+    db.commit()
+    assert [event.topic for event in outbox.claim_batch(db, 10, ['test.leased'])] == ['test.leased']
+    assert _event(db, 'test.leased:1').status == 'processing'
+    assert outbox.claim_batch(db, 10, ['test.leased']) == []
+
+    # A worker that died mid-batch leaves the lease to run out.
+    _make_due(db, 'test.leased:1')
+    assert len(outbox.claim_batch(db, 10, ['test.leased'])) == 1
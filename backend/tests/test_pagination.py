@@ -0,0 +1,43 @@
+from datetime import datetime
+
+from sqlalchemy import update
+
+from app.cache import product_cache
+from app.database import SessionLocal
+from app.models import Product
+from app.pagination import NEXT_CURSOR_HEADER
+
+
+def _walk(client, path, **kwargs):
+  ids, params = [], {'limit': 2}
+  while True:
+    response = client.get(path, params=params, **kwargs)
+    assert response.status_code == 200
+    ids += [item['id'] for item in response.json()]
+    cursor = response.headers.get(NEXT_CURSOR_HEADER)
+    if not cursor:
+      return ids
+    params['cursor'] = cursor
+
+
+def test_product_pages_break_ties_on_id(client, make_product):
+  tied = [make_product()['id'] for _ in range(3)]
+  with SessionLocal() as db:
+    db.execute(update(Product).where(Product.id.in_(tied)).values(created_at=datetime(2030, 1, 1)))
+    db.commit()
+  product_cache.invalidate_all()
+  ids = _walk(client, '/api/products')
+  assert ids[:3] == sorted(tied, reverse=True)
+  assert len(ids) == len(set(ids)) == len(client.get('/api/products?limit=100').json())
+
+
+def test_order_pages_cover_every_order_once(client, auth_headers, make_product):
+  product = make_product()
+  for _ in range(5):
+    client.post(
+      '/api/cart', json={'product_id': product['id'], 'quantity': 1}, headers=auth_headers
+    )
+    assert client.post('/api/orders', headers=auth_headers).status_code == 201
+  ids = _walk(client, '/api/orders', headers=auth_headers)
+  assert ids == sorted(ids, reverse=True)
+  assert len(set(ids)) == 5
@@ -0,0 +1,61 @@
+from app import cache_events
+from app.cache import MISSING, product_cache
+
+
+def _listed_stock(client, product):
+  response = client.get('/api/products', params={'name_prefix': product['name']})
+  return response.json()[0]['stock']
+
+
+def _add(client, headers, product_id, quantity):
+  return client.post(
+    '/api/cart?hold=true',
+    json={'product_id': product_id, 'quantity': quantity},
+    headers=headers,
+  )
+
+
+def test_stock_only_changes_keep_listing_pages(client, auth_headers, make_product):
+  product = make_product(stock=5)
+  assert _listed_stock(client, product) == 5
+  version = product_cache.page_version
+
+  assert _add(client, auth_headers, product['id'], 2).status_code == 201
+  assert product_cache.page_version == version
+  assert _listed_stock(client, product) == 5
+  assert client.get(f'/api/products/{product["id"]}').json()['stock'] == 3
+
+  # Selling out changes what listings show, e.g. with in_stock=true.
+  assert _add(client, auth_headers, product['id'], 3).status_code == 201
+  assert product_cache.page_version > version
+  assert _listed_stock(client, product) == 0
+
+
+def test_admin_writes_invalidate_listing_pages(client, admin_headers, make_product):
+  product = make_product(stock=5)
+  assert _listed_stock(client, product) == 5
+  changes = {**product, 'stock': 7}
+  response = client.put(f'/api/admin/products/{product["id"]}', json=changes, headers=admin_headers)
+  assert response.status_code == 200
+  assert _listed_stock(client, product) == 7
+
+
+def test_remote_invalidations_apply_except_our_own(client, make_product):
+  product = make_product()
+  client.get(f'/api/products/{product["id"]}')
+  version = product_cache.version
+
+  own = cache_events.encode((product['id'],), False, True)
+  cache_events.apply(own)
+  assert product_cache.version == version
+
+  remote = own.replace(cache_events._source, 'elsewhere')
+  cache_events.apply(remote)
+  assert product_cache.version == version + 1
+  assert product_cache.get_product(product['id']) is MISSING
+
+
+def test_oversized_invalidations_cover_every_product():
+  payload = cache_events.encode(tuple(range(10_000)), True, True)
+  assert len(payload) <= cache_events.MAX_PAYLOAD
+  assert '"ids":null' in payload
@@ -0,0 +1,50 @@
+from app.cache import product_cache
+from app.query_stats import assert_max_queries
+
+
+def _product_ids(client, count=3):
+  return [product['id'] for product in client.get('/api/products').json()[:count]]
+
+
+def test_catalog_reads_one_query_each(client):
+  product_id = _product_ids(client, 1)[0]
+  product_cache.invalidate_all()
+  with assert_max_queries(1):
+    assert client.get('/api/products').status_code == 200
+  with assert_max_queries(1):
+    assert client.get(f'/api/products/{product_id}').status_code == 200
+  # Served from the product cache until the next write.
+  with assert_max_queries(0):
+    assert client.get('/api/products').status_code == 200
+
+
+def test_cart_queries_do_not_grow_with_the_cart(client, auth_headers):
+  product_ids = _product_ids(client)
+  for product_id in product_ids:
+    with assert_max_queries(3):
+      response = client.post(
+        '/api/cart', json={'product_id': product_id, 'quantity': 1}, headers=auth_headers
+      )
+    assert response.status_code == 201
+  # With the product in cache the upsert is the only statement besides auth.
+  client.get(f'/api/products/{product_id}')
+  with assert_max_queries(2):
+    response = client.post(
+      '/api/cart?delta=true', json={'product_id': product_id, 'quantity': 1}, headers=auth_headers
+    )
+  assert response.status_code == 201
+  with assert_max_queries(2):
+    response = client.get('/api/cart', headers=auth_headers)
+  assert len(response.json()['items']) == len(product_ids)
+
+
+def test_checkout_query_budget(client, auth_headers):
+  product_ids = _product_ids(client)
+  for product_id in product_ids:
+    client.post('/api/cart', json={'product_id': product_id, 'quantity': 1}, headers=auth_headers)
+  # SQLite inserts order items one row at a time to return their ids in
+  # order; PostgreSQL writes them in one statement.
+  with assert_max_queries(9 + len(product_ids)):
+    response = client.post('/api/orders', headers=auth_headers)
+  assert response.status_code == 201
+  assert len(response.json()['items']) == len(product_ids)
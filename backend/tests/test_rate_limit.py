@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+from app import rate_limit
+from app.core.config import settings
+from app.i18n import translate
+from app.rate_limit import Limit, MemoryBuckets
+
+
+class Clock:
+  def __init__(self):
+    self.now = 1000.0
+
+  def __call__(self):
+    return self.now
+
+
+def test_buckets_refill_evenly():
+  clock = Clock()
+  buckets = MemoryBuckets(4, clock)
+  limit = Limit('test', '2/minute')
+
+  def take(key):
+    return asyncio.run(buckets.take(key, limit))
+
+  assert take('a') == 0
+  assert take('a') == 0
+  assert take('a') == pytest.approx(30)
+  assert take('b') == 0
+  clock.now += 30
+  assert take('a') == 0
+
+
+def test_invalid_specs_are_rejected():
+  for spec in ('10', '10/fortnight', '0/minute'):
+    with pytest.raises(ValueError):
+      Limit('test', spec)
+
+
+def test_login_is_limited_per_client(client, monkeypatch):
+  # The dependency is bound to the configured limit at import, so a tighter
+  # one is swapped in.
+  monkeypatch.setattr(settings, 'rate_limit_enabled', True)
+  monkeypatch.setattr(rate_limit, 'buckets', MemoryBuckets(1, Clock()))
+  monkeypatch.setitem(
+    client.app.dependency_overrides,
+    rate_limit.login_rate_limit,
+    rate_limit.limit_by_ip(Limit('login', '2/minute')),
+  )
+  credentials = {'email': 'nobody@example.com', 'password': 'wrong'}
+  headers = {'Accept-Language': 'zh'}
+  for _ in range(2):
+    assert client.post('/api/auth/login', json=credentials).status_code == 401
+  response = client.post('/api/auth/login', json=credentials, headers=headers)
+  assert response.status_code == 429
+  assert response.headers['Retry-After'] == '30'
+  assert response.json()['detail'] == translate('errors.rate_limited', 'zh')
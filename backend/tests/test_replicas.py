@@ -0,0 +1,27 @@
+from app.cache import MISSING, product_cache
+from app.database import SessionLocal
+from app.main import app
+from app.replicas import get_read_db
+from app.routers.products import DEFAULT_PAGE_SIZE
+
+
+def _replica_db():
+  with SessionLocal() as db:
+    db.info['replica'] = 'replica_1'
+    yield db
+
+
+def test_replica_reads_do_not_fill_the_product_cache(client, make_product):
+  product = make_product()
+  product_cache.invalidate_all()
+  app.dependency_overrides[get_read_db] = _replica_db
+  try:
+    assert client.get(f'/api/products/{product["id"]}').status_code == 200
+    assert client.get('/api/products').status_code == 200
+  finally:
+    del app.dependency_overrides[get_read_db]
+  assert product_cache.get_product(product['id']) is MISSING
+  assert product_cache.get_page((DEFAULT_PAGE_SIZE, None, None, None, False, None)) is MISSING
+  # Primary reads still fill it.
+  client.get(f'/api/products/{product["id"]}')
+  assert product_cache.get_product(product['id']) is not MISSING
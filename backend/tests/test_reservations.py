@@ -0,0 +1,96 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+
+from app.database import SessionLocal
+from app.models import Reservation
+from app.reservations import sweep_expired
+
+
+def _stock(client, product_id):
+  return client.get(f'/api/products/{product_id}').json()['stock']
+
+
+def _add(client, headers, product_id, quantity, hold=False):
+  return client.post(
+    f'/api/cart?hold={str(hold).lower()}',
+    json={'product_id': product_id, 'quantity': quantity},
+    headers=headers,
+  )
+
+
+def _holds(client, headers):
+  return {
+    hold['product_id']: hold for hold in client.get('/api/reservations', headers=headers).json()
+  }
+
+
+def test_hold_requires_and_is_capped_by_the_cart(client, auth_headers, make_product):
+  product = make_product(stock=10)
+  hold = {'product_id': product['id'], 'quantity': 3}
+  response = client.post('/api/reservations', json=hold, headers=auth_headers)
+  assert response.status_code == 409
+
+  _add(client, auth_headers, product['id'], 2)
+  response = client.post('/api/reservations', json=hold, headers=auth_headers)
+  assert response.status_code == 201
+  assert response.json()['quantity'] == 2
+  # Holding again sets the hold rather than adding to it.
+  client.post('/api/reservations', json=hold, headers=auth_headers)
+  assert _holds(client, auth_headers)[product['id']]['quantity'] == 2
+  assert _stock(client, product['id']) == 8
+
+
+def test_cart_hold_grows_without_extending_expiry(client, auth_headers, make_product):
+  product = make_product(stock=10)
+  assert _add(client, auth_headers, product['id'], 2, hold=True).status_code == 201
+  expires_at = _holds(client, auth_headers)[product['id']]['expires_at']
+  assert _add(client, auth_headers, product['id'], 3, hold=True).status_code == 201
+  hold = _holds(client, auth_headers)[product['id']]
+  assert hold['quantity'] == 5
+  assert hold['expires_at'] == expires_at
+  assert _stock(client, product['id']) == 5
+  # No more than the stock can be held; the failed add leaves everything as is.
+  assert _add(client, auth_headers, product['id'], 6, hold=True).status_code == 409
+  assert _holds(client, auth_headers)[product['id']]['quantity'] == 5
+  assert _stock(client, product['id']) == 5
+
+
+def test_cart_changes_shrink_and_release_holds(client, auth_headers, make_product):
+  product = make_product(stock=10)
+  item = _add(client, auth_headers, product['id'], 4, hold=True).json()['items'][0]
+  client.put(f'/api/cart/{item["id"]}', json={'quantity': 1}, headers=auth_headers)
+  assert _holds(client, auth_headers)[product['id']]['quantity'] == 1
+  assert _stock(client, product['id']) == 9
+  # Raising the line again does not raise the hold.
+  client.put(f'/api/cart/{item["id"]}', json={'quantity': 3}, headers=auth_headers)
+  assert _holds(client, auth_headers)[product['id']]['quantity'] == 1
+  client.delete(f'/api/cart/{item["id"]}', headers=auth_headers)
+  assert product['id'] not in _holds(client, auth_headers)
+  assert _stock(client, product['id']) == 10
+
+
+def test_checkout_takes_held_and_unheld_stock_once(client, auth_headers, make_product):
+  held, unheld = make_product(stock=5), make_product(stock=5)
+  _add(client, auth_headers, held['id'], 2, hold=True)
+  _add(client, auth_headers, held['id'], 1)
+  _add(client, auth_headers, unheld['id'], 2)
+  assert client.post('/api/orders', headers=auth_headers).status_code == 201
+  assert _stock(client, held['id']) == 2
+  assert _stock(client, unheld['id']) == 3
+  assert _holds(client, auth_headers) == {}
+
+
+def test_expired_holds_return_to_stock(client, auth_headers, make_product):
+  product = make_product(stock=3)
+  _add(client, auth_headers, product['id'], 3, hold=True)
+  assert _stock(client, product['id']) == 0
+  with SessionLocal() as db:
+    db.execute(
+      update(Reservation)
+      .where(Reservation.product_id == product['id'])
+      .values(expires_at=datetime.utcnow() - timedelta(seconds=1))
+    )
+    db.commit()
+    assert sweep_expired(db) == 1
+  assert _stock(client, product['id']) == 3
@@ -0,0 +1,22 @@
+def _names(client, q):
+  response = client.get('/api/products/search', params={'q': q})
+  assert response.status_code == 200
+  return [hit['product']['name'] for hit in response.json()]
+
+
+def test_fallback_index_matches_prefixes_and_typos(client, make_product):
+  product = make_product(name='Zephyrine lantern', description='Brass <b>camping</b> light.')
+  assert product['name'] in _names(client, 'zephyr')
+  assert product['name'] in _names(client, 'zephyrnie lantern')
+  assert _names(client, 'zephyrine teapot') == []
+
+  hit = client.get('/api/products/search', params={'q': 'camping'}).json()[0]
+  assert hit['product']['id'] == product['id']
+  assert hit['description_highlight'] == 'Brass &lt;b&gt;<mark>camping</mark>&lt;/b&gt; light.'
+
+
+def test_fallback_index_follows_product_writes(client, admin_headers, make_product):
+  product = make_product(name='Quillonary stapler')
+  assert product['name'] in _names(client, 'quillonary')
+  client.patch(f'/api/admin/products/{product["id"]}/toggle-active', headers=admin_headers)
+  assert _names(client, 'quillonary') == []
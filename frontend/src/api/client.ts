@@ -28,10 +28,12 @@ const resolveApiBaseUrl = (): string => {
 
 const API_BASE_URL = resolveApiBaseUrl()
 
-const apiFetch = async <T>(
+const NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+const request = async (
   path: string,
   { method = 'GET', data, token }: ApiFetchOptions = {}
-): Promise<T> => {
+): Promise<Response> => {
   const headers: Record<string, string> = { 'Content-Type': 'application/json' }
   const authToken = token ?? getStoredToken()
   if (authToken) {
@@ -49,6 +51,12 @@ const apiFetch = async <T>(
     throw new Error(message || 'Request failed')
   }
 
+  return response
+}
+
+const apiFetch = async <T>(path: string, options: ApiFetchOptions = {}): Promise<T> => {
+  const response = await request(path, options)
+
   if (response.status === 204) {
     return null as T
   }
@@ -56,10 +64,26 @@ const apiFetch = async <T>(
   return (await response.json()) as T
 }
 
+// List endpoints return one page at a time; follow the cursor until the last one.
+const apiFetchAll = async <T>(path: string, pageSize: number): Promise<T[]> => {
+  const items: T[] = []
+  let cursor: string | null = null
+  do {
+    const params = new URLSearchParams({ limit: String(pageSize) })
+    if (cursor) {
+      params.set('cursor', cursor)
+    }
+    const response: Response = await request(`${path}?${params}`)
+    items.push(...((await response.json()) as T[]))
+    cursor = response.headers.get(NEXT_CURSOR_HEADER)
+  } while (cursor)
+  return items
+}
+
 export const api = {
   productsQuery: () => ({
     queryKey: ['products'] as const,
-    queryFn: () => apiFetch<Product[]>('/api/products'),
+    queryFn: () => apiFetchAll<Product>('/api/products', 200),
     staleTime: 1000 * 30
   }),
   productQuery: (productId: string) => ({
@@ -76,7 +100,7 @@ export const api = {
   }),
   ordersQuery: () => ({
     queryKey: ['orders'] as const,
-    queryFn: () => apiFetch<Order[]>('/api/orders')
+    queryFn: () => apiFetchAll<Order>('/api/orders', 100)
   }),
   orderQuery: (orderId: string) => ({
     queryKey: ['order', orderId] as const,
@@ -20,7 +20,17 @@ const ProductCard = ({ product, onAdd }: ProductCardProps): JSX.Element => {
     <Card className="group flex h-[250px] w-[250px] flex-col overflow-hidden border-[#E3DCCF] bg-[#FBFAF7] shadow-lg ring-1 ring-transparent transition hover:-translate-y-1 hover:ring-[#111111]/20">
       <Link to="/products/$productId" params={{ productId: product.id.toString() }} className="flex flex-1 flex-col">
         <div className="relative h-[120px] w-full overflow-hidden bg-slate-100">
-          {product.image_url ? (
+          {product.image_variants ? (
+            <picture>
+              <source srcSet={product.image_variants.thumbnail_webp} type="image/webp" />
+              <img
+                src={product.image_variants.thumbnail}
+                alt={product.name}
+                className="h-full w-full object-cover transition duration-500 group-hover:scale-105"
+                loading="lazy"
+              />
+            </picture>
+          ) : product.image_url ? (
             <img
               src={product.image_url}
               alt={product.name}
@@ -144,7 +144,12 @@ const StandardProductView = ({
     <div className="mx-auto max-w-5xl space-y-8 px-0 py-6">
       <div className="grid gap-10 lg:grid-cols-2">
         <div className="rounded-3xl border border-[#E5E5E5] bg-white p-4">
-          {product.image_url ? (
+          {product.image_variants ? (
+            <picture>
+              <source srcSet={product.image_variants.large_webp} type="image/webp" />
+              <img src={product.image_variants.large} alt={product.name} className="h-full w-full rounded-2xl object-cover" />
+            </picture>
+          ) : product.image_url ? (
             <img src={product.image_url} alt={product.name} className="h-full w-full rounded-2xl object-cover" />
           ) : (
             <div className="flex h-full min-h-[320px] items-center justify-center text-6xl">📦</div>
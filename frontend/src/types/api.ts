@@ -1,9 +1,17 @@
+export interface ProductImageVariants {
+  thumbnail: string
+  thumbnail_webp: string
+  large: string
+  large_webp: string
+}
+
 export interface Product {
   id: number
   name: string
   description: string
   price: number
   image_url?: string | null
+  image_variants?: ProductImageVariants | null
   stock?: number
 }
 